@@ -0,0 +1,92 @@
+#
+# Test of the Companion outbound queue over UDP, with a primary and a backup Companion
+# (fake UDP listeners on 127.0.0.1 and 127.0.0.2, same port). Checks that:
+# - queueing a command never waits for the send
+# - button presses reach both hosts, in order
+# - custom variable updates are coalesced, and the last value reaches both hosts
+# and reports the per host delivery statistics.
+#
+# Usage:
+#   python benchmarks/companion_outbox_test.py [--presses 200] [--updates 5000]
+#
+import argparse
+import json
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from companion import Companion
+
+
+def received(sock: socket.socket) -> list[str]:
+    messages = []
+    while True:
+        try:
+            messages.append(sock.recv(2048).decode())
+        except socket.timeout:
+            return messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Companion outbound queue test')
+    parser.add_argument('--presses', type=int, default=200)
+    parser.add_argument('--updates', type=int, default=5000, help='T-bar variable updates, interleaved with the presses')
+    args = parser.parse_args()
+
+    primary = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    primary.bind(('127.0.0.1', 0))
+    port = primary.getsockname()[1]
+    backup = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    backup.bind(('127.0.0.2', port))
+    for sock in (primary, backup):
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        sock.settimeout(0.5)
+
+    companion = Companion('127.0.0.1', port, backup_host='127.0.0.2')
+    time.sleep(0.1)     # let the resolver settle, as it would have at startup
+
+    every = max(1, args.updates // args.presses)
+    max_call_us = 0
+    presses = 0
+    for i in range(args.updates):
+        t0 = time.perf_counter_ns()
+        companion.send_tbar(i % 101)
+        if i % every == 0 and presses < args.presses:
+            companion.pushbutton(99, 0, presses)
+            presses += 1
+        max_call_us = max(max_call_us, (time.perf_counter_ns() - t0) // 1000)
+    last_value = (args.updates - 1) % 101
+
+    checks = {}
+    expected_presses = [f'LOCATION 99/0/{n} PRESS' for n in range(presses)]
+    for name, sock in (('primary', primary), ('backup', backup)):
+        messages = received(sock)
+        checks[f'{name}_presses_in_order'] = [m for m in messages if m.startswith('LOCATION')] == expected_presses
+        # press n was queued right after update n * every: that must be the value Companion
+        # has when the press arrives (coalescing must not move a later value ahead of it)
+        value = None
+        overtaken = 0
+        for m in messages:
+            if m.startswith('CUSTOM-VARIABLE'):
+                value = int(m.rsplit(' ', 1)[1])
+            elif m.startswith('LOCATION'):
+                n = int(m.split('/')[2].split()[0])
+                overtaken += value != (n * every) % 101
+        checks[f'{name}_updates_not_overtaken'] = overtaken == 0
+        variables = [m for m in messages if m.startswith('CUSTOM-VARIABLE')]
+        checks[f'{name}_last_value'] = bool(variables) and variables[-1] == f'CUSTOM-VARIABLE tbar_value SET-VALUE {last_value}'
+
+    result = {'presses': presses, 'variable_updates': args.updates, 'coalesced': companion.coalesced,
+              'max_queue_call_us': max_call_us, 'hosts': companion.stats(), 'checks': checks}
+    ok = all(checks.values())
+    result['ok'] = ok
+    print(json.dumps(result, indent=2))
+    companion.close()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
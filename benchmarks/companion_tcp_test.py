@@ -0,0 +1,171 @@
+#
+# Test of the Companion TCP client against a local stand-in Companion server, which answers
+# LOCATION .../PRESS and CUSTOM-VARIABLE commands with +OK (and anything else with -ERR),
+# optionally after a delay. The test checks that:
+# - pipelined commands are all answered, and matched to their commands in order
+# - button presses arrive in order, and the last value of a coalesced custom variable arrives
+# - the client reconnects after the server drops the connection, and after a server restart
+# - send() never blocks, including while the server is down
+# and reports the send to acknowledgement latency.
+#
+# Usage:
+#   python benchmarks/companion_tcp_test.py [--commands 500] [--delay 0.0]
+#
+import argparse
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from companion import Companion, CompanionTCP
+
+
+class StandInCompanion:
+    """ Minimal Companion TCP API: one response line per command line """
+    def __init__(self, port: int = 0, delay: float = 0.0):
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(('127.0.0.1', port))
+        self.listener.listen()
+        self.port = self.listener.getsockname()[1]
+        self.delay = delay
+        self.received: list[str] = []
+        self.connections: list[socket.socket] = []
+        self.drop_after = None      # close the connection after this many commands
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def serve(self):
+        while True:
+            try:
+                conn, _addr = self.listener.accept()
+            except OSError:
+                return
+            self.connections.append(conn)
+            threading.Thread(target=self.client, args=(conn,), daemon=True).start()
+
+    def client(self, conn: socket.socket):
+        buffer = b''
+        with conn:
+            while True:
+                try:
+                    data = conn.recv(4096)
+                except OSError:
+                    return
+                if not data:
+                    return
+                buffer += data
+                *lines, buffer = buffer.split(b'\n')
+                replies = []
+                for line in lines:
+                    command = line.decode().strip()
+                    self.received.append(command)
+                    if self.drop_after is not None and len(self.received) >= self.drop_after:
+                        self.drop_after = None
+                        conn.close()
+                        return
+                    ok = command.startswith('LOCATION ') or command.startswith('CUSTOM-VARIABLE ')
+                    replies.append(b'+OK\n' if ok else b'-ERR Syntax error\n')
+                if self.delay:
+                    time.sleep(self.delay)
+                try:
+                    conn.sendall(b''.join(replies))
+                except OSError:
+                    return
+
+    def close(self):
+        # shutdown first, close alone doesn't stop a listener or connection in use by another thread
+        try:
+            self.listener.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.listener.close()
+        for conn in self.connections:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+                conn.close()
+            except OSError:
+                pass
+
+
+def wait_for(condition, timeout: float = 10.0) -> bool:
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Companion TCP client test')
+    parser.add_argument('--commands', type=int, default=500)
+    parser.add_argument('--delay', type=float, default=0.0, help='stand-in server response delay, seconds')
+    args = parser.parse_args()
+
+    CompanionTCP.RETRY_MIN = 0.05
+    server = StandInCompanion(delay=args.delay)
+    companion = Companion('127.0.0.1', server.port, tcp=True)
+    checks = {}
+
+    # pipelined commands, plus one the server rejects
+    max_send_us = 0
+    for i in range(args.commands):
+        t0 = time.perf_counter_ns()
+        if i % 2:
+            companion.pushbutton(99, 1, i % 8)
+        else:
+            companion.send_tbar(i % 101)
+        max_send_us = max(max_send_us, (time.perf_counter_ns() - t0) // 1000)
+    companion._queue('BOGUS COMMAND')
+    connection = companion.connections['127.0.0.1']
+    checks['all_answered'] = wait_for(lambda: not companion.outbox and
+                                      connection.stats['ok'] + connection.stats['errors'] == connection.stats['sent'])
+    checks['error_matched'] = connection.stats['errors'] == 1
+    checks['presses_in_order'] = [c for c in server.received if c.startswith('LOCATION')] == (
+        [f'LOCATION 99/1/{i % 8} PRESS' for i in range(1, args.commands, 2)])
+    last_tbar = [c for c in server.received if c.startswith('CUSTOM-VARIABLE')][-1]
+    checks['last_variable_value_delivered'] = last_tbar == f'CUSTOM-VARIABLE tbar_value SET-VALUE {(args.commands - 2) % 101}'
+    total = args.commands + 1
+
+    # the server drops the connection part way through a burst
+    server.drop_after = len(server.received) + 10
+    for i in range(50):
+        companion.pushbutton(99, 2, i % 8)
+    checks['reconnected_after_drop'] = wait_for(lambda: connection.stats['connects'] == 2)
+    companion.pushbutton(99, 3, 1)
+    checks['sends_after_reconnect'] = wait_for(lambda: server.received[-1] == 'LOCATION 99/3/1 PRESS')
+
+    # the server goes away: sends must not block, and the queue is delivered after a restart
+    port = server.port
+    server.close()
+    wait_for(lambda: not connection.connected, 5.0)
+    max_send_down_us = 0
+    for i in range(20):
+        t0 = time.perf_counter_ns()
+        companion.pushbutton(99, 4, i % 8)
+        max_send_down_us = max(max_send_down_us, (time.perf_counter_ns() - t0) // 1000)
+    time.sleep(0.2)
+    server = StandInCompanion(port=port, delay=args.delay)
+    checks['queued_delivered_after_restart'] = wait_for(lambda: server.received.count('LOCATION 99/4/7 PRESS') == 2)
+
+    h = connection.histogram
+    result = {'commands': total, 'coalesced': companion.coalesced, 'stats': connection.stats,
+              'max_send_call_us': max_send_us, 'max_send_call_while_down_us': max_send_down_us,
+              'ack_latency_us': {'p50': h.percentile(50), 'p90': h.percentile(90), 'p99': h.percentile(99), 'max': h.max},
+              'checks': checks}
+    ok = all(checks.values())
+    result['ok'] = ok
+    print(json.dumps(result, indent=2))
+
+    companion.close()
+    server.close()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+#
+# Latency of Camera commands sent through a relay port of the same process, with and
+# without the in-process fast path, against a simulated camera
+#
+# Usage:
+#   python benchmarks/fastpath_bench.py [--count N]
+#
+import argparse
+import json
+import os
+import socket
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import viscarelay
+from camera import Camera
+from visca_sim import SimCamera
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def latency_test(cam: Camera, count: int) -> dict:
+    """ Send one command at a time; Camera returns on the first reply (the ACK) """
+    samples = []
+    for _ in range(count):
+        t0 = time.perf_counter()
+        cam.pantilt(0, 0)
+        samples.append((time.perf_counter() - t0) * 1e6)
+    samples.sort()
+    return {
+        'commands': count,
+        'p50_us': round(samples[len(samples) // 2], 1),
+        'p99_us': round(samples[int(len(samples) * 0.99) - 1], 1),
+        'mean_us': round(statistics.mean(samples), 1),
+        'missed_responses': cam.num_missed_responses,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='VISCA relay fast path benchmark')
+    parser.add_argument('--count', type=int, default=5000)
+    args = parser.parse_args()
+
+    sim = SimCamera()
+    relay = viscarelay.ViscaRelay(rcv_port=free_port())
+    relay.ptz_set('127.0.0.1', sim.port)
+    address = ('127.0.0.1', relay.rcv_port)
+
+    result = {}
+    for name, fast_path in (('loopback', False), ('fast_path', True)):
+        viscarelay.fast_path = fast_path
+        cam = Camera(*address)
+        assert isinstance(cam._channel, viscarelay.LocalClient) == fast_path
+        latency_test(cam, 200)      # warm up
+        cam.num_missed_responses = 0
+        result[name] = latency_test(cam, args.count)
+        cam.close_connection()
+
+    result['p50_saving_us'] = round(result['loopback']['p50_us'] - result['fast_path']['p50_us'], 1)
+    print(json.dumps(result, indent=2))
+
+    relay.close()
+    sim.close()
+
+
+if __name__ == '__main__':
+    main()
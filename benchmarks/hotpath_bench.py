@@ -0,0 +1,413 @@
+#
+# Benchmark suite for the hot paths: the code run for every joystick event, VISCA command,
+# relayed packet, OSC message and T-bar movement. Runs without cameras, controllers or a
+# Companion: cameras are stand-in channels that answer every command at once, the relay and
+# Companion sockets are stand-ins that loop packets back in memory, and joystick events are
+# synthetic pygame events from a virtual gamepad (see virtual_joystick).
+#
+# Each case is timed with timeit (best of --repeat runs) and reported as ns per operation.
+# The JSON output can be saved (--output) and a later run compared with it (--compare):
+# a case more than --threshold slower than in the saved run is reported as a regression,
+# and the exit status is 1. Cases whose modules can't be imported (e.g. no pygame) are
+# reported as skipped.
+#
+# The end to end timings through the network are in the other benchmarks (relay_bench.py,
+# fastpath_bench.py, tbar_stream.py, osc_ptz_load.py).
+#
+# Usage:
+#   python benchmarks/hotpath_bench.py [--cases joy_pos_to_cam_speed,...] [--repeat 5]
+#                                      [--output results.json] [--compare baseline.json [--threshold 0.2]]
+#
+# e.g. to compare with an older commit:
+#   git stash; python benchmarks/hotpath_bench.py --output /tmp/before.json; git stash pop
+#   python benchmarks/hotpath_bench.py --compare /tmp/before.json
+#
+import argparse
+import itertools
+import json
+import os
+import platform
+import socket
+import sys
+import tempfile
+import timeit
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import settings_store
+
+# never the user's settings, and no configuration dialog
+_settings_dir = tempfile.TemporaryDirectory()
+settings_store.shared = settings_store.SettingsStore(os.path.join(_settings_dir.name, 'settings.json'))
+settings_store.shared.set('-configured-', True)
+
+import config
+
+CAMERA_ADDRESS = ('192.0.2.10', 52381)    # documentation address, never reached
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class StandInChannel:
+    """ In place of a Camera's transport channel: each command is answered at once with an ACK,
+        or with the next of a list of canned replies
+    """
+    sockaddr = ('192.0.2.1', 52381)     # no relay port forwards here
+
+    def __init__(self, replies: list[bytes] | None = None):
+        self.ack = bytearray(b'\x01\x11\x00\x03\x00\x00\x00\x00\x90\x41\xff')
+        self.replies = itertools.cycle(replies) if replies else None
+        self.sent = 0
+
+    def send(self, message) -> bool:
+        self.ack[4:8] = message[4:8]
+        self.sent += 1
+        return True
+
+    def recv(self, _timeout: float) -> bytes:
+        if self.replies is not None:
+            return next(self.replies)
+        return bytes(self.ack)
+
+    def close(self):
+        pass
+
+
+class StandInRelaySocket:
+    """ In place of a relay port's socket: datagrams are queued in memory, and the camera
+        answers each forwarded command with an ACK and a Completion
+    """
+    def __init__(self, camera_address):
+        self.camera_address = camera_address
+        self.inbox = deque()
+        self.to_clients = 0
+
+    def recvfrom_into(self, buffer):
+        try:
+            packet, address = self.inbox.popleft()
+        except IndexError:
+            raise BlockingIOError from None
+        buffer[:len(packet)] = packet
+        return len(packet), address
+
+    def sendto(self, packet, address):
+        if address == self.camera_address:
+            if packet[0] == 0x01:
+                sequence = bytes(packet[4:8])
+                self.inbox.append((b'\x01\x11\x00\x03' + sequence + b'\x90\x41\xff', address))
+                self.inbox.append((b'\x01\x11\x00\x03' + sequence + b'\x90\x51\xff', address))
+        else:
+            self.to_clients += 1
+        return len(packet)
+
+    def close(self):
+        pass
+
+
+class StandInUDPSocket:
+    """ In place of Companion's UDP socket """
+    def __init__(self):
+        self.sent = 0
+
+    def sendto(self, data, _address):
+        self.sent += 1
+        return len(data)
+
+    def close(self):
+        pass
+
+
+class StandInWindow:
+    """ In place of the main window, for the OSC handlers' wake up events """
+    def __init__(self):
+        self.events = 0
+
+    def write_event_value(self, _key, _value):
+        self.events += 1
+
+
+def stand_in_camera(replies: list[bytes] | None = None):
+    """ A Camera whose commands go to a StandInChannel. The Camera is connected to a simulated
+        camera, as its constructor talks to the camera, then switched to the stand-in
+    """
+    from camera import Camera
+    from visca_sim import SimCamera
+    sim = SimCamera()
+    cam = Camera(*sim.address)
+    cam.close_connection()
+    sim.close()
+    cam._channel = StandInChannel(replies)
+    return cam
+
+
+def virtual_controller(callbacks: dict):
+    """ A Controller for a virtual gamepad (see virtual_joystick), with the default controller map """
+    from controller import Controller
+    from virtual_joystick import VirtualJoysticks
+    joystick, _added = VirtualJoysticks().attach()
+    controller = Controller(callbacks, long_press_limit=config.g_long_press_time, dead_zone=config.g_dead_zone)
+    controller.set_callbacks(callbacks)
+    controller.set_pygame_joystick(joystick)
+    return controller
+
+
+def axis_events(controller) -> list:
+    """ Stick sweeps on the controller's pan, tilt and zoom axes, ending centred """
+    from controller import ControlFunc
+    zoom = next(axis for axis in controller.axes if axis.control_func == ControlFunc.ZOOM)
+    events = []
+    for i in range(64):
+        value = (i % 32) / 16 - 1 if i < 63 else 0.0
+        for axis in (controller.pan_axis.value, controller.tilt_axis.value, zoom.value):
+            events.append(controller.joystick.move_axis(axis, value))
+    return events
+
+
+def _ignore(**_kwargs):
+    return None
+
+
+# ------------------------------------------------------------------
+# Cases: each returns (statement, operations per call of the statement)
+# ------------------------------------------------------------------
+
+def main_module():
+    """ The main module, imported without binding the relay's fixed port """
+    if 'main' not in sys.modules:
+        config.g_visca_relay_port = free_port()
+    import main
+    return main
+
+
+def case_joy_pos_to_cam_speed():
+    main = main_module()
+    positions = [i / 50 - 1 for i in range(101)]
+    kinds = ('pan', 'tilt', 'zoom', 'focus')
+    convert = main.joy_pos_to_cam_speed
+
+    def run():
+        for kind in kinds:
+            for position in positions:
+                convert(position, kind, True)
+    return run, len(kinds) * len(positions)
+
+
+def case_controller_dispatch():
+    """ controller.handle_pygame_event: axis and button events to callbacks that do nothing """
+    import pygame
+    import controller as controller_module
+    main = main_module()
+    controller = virtual_controller({name: _ignore for name in main.controller_callbacks})
+    events = axis_events(controller)
+    for button in (0, 4, 8):
+        events.append(controller.joystick.press(button))
+        events.append(controller.joystick.release(button))
+    values = [ev.value if ev.type == pygame.JOYAXISMOTION else None for ev in events]
+    handle = controller_module.handle_pygame_event
+
+    def run():
+        # handle_pygame_event rescales the value of an axis event in place
+        for ev, value in zip(events, values):
+            if value is not None:
+                ev.value = value
+            handle(controller, ev)
+    return run, len(events)
+
+
+def case_event_pipeline():
+    """ main.handle_pygame_event: stick events through the main program's handlers to a camera """
+    main = main_module()
+    from controller import ControllerList
+    from virtual_joystick import VirtualJoysticks
+    joysticks = VirtualJoysticks()
+    main.controller_list = ControllerList(main.controller_callbacks, config.g_long_press_time, config.g_dead_zone,
+                                          config.snapshot.generation, open_joystick=joysticks.open)
+    gamepad, added = joysticks.attach()
+    main.handle_pygame_event(added)
+    controller = main.controller_list.lookup(gamepad.get_instance_id())
+    main.cam = stand_in_camera()
+    main.gamepad_enabled = True
+    events = axis_events(controller)
+    positions = [ev.value for ev in events]
+    handle = main.handle_pygame_event
+
+    def run():
+        for ev, position in zip(events, positions):
+            gamepad.axes[ev.axis] = position
+            ev.value = position
+            handle(ev)
+    return run, len(events)
+
+
+def case_camera_pantilt():
+    cam = stand_in_camera()
+    speeds = [(pan, tilt) for pan in (-24, -7, 0, 3, 18) for tilt in (-9, 0, 24)]
+
+    def run():
+        for pan, tilt in speeds:
+            cam.pantilt(pan, tilt)
+    return run, len(speeds)
+
+
+def case_camera_zoom():
+    cam = stand_in_camera()
+    speeds = list(range(-7, 8))
+
+    def run():
+        for speed in speeds:
+            cam.zoom(speed)
+    return run, len(speeds)
+
+
+def case_receive_response():
+    """ Camera._receive_response: a late Completion of the previous command, then the ACK """
+    sequence = 10
+    stale = b'\x01\x11\x00\x03' + (sequence - 1).to_bytes(4, 'big') + b'\x90\x51\xff'
+    ack = b'\x01\x11\x00\x03' + sequence.to_bytes(4, 'big') + b'\x90\x41\xff'
+    cam = stand_in_camera([stale, ack])
+    cam.sequence_number = sequence
+    receive = cam._receive_response
+
+    def run():
+        for _ in range(100):
+            receive()
+    return run, 100
+
+
+def case_relay_forward():
+    """ RelayPort forwarding: commands from several clients to the camera, and the camera's
+        ACK and Completion back to each client (one operation is a command and its replies)
+    """
+    import viscarelay
+    port = viscarelay.RelayPort(free_port())
+    port.socket.close()
+    port.socket = StandInRelaySocket(CAMERA_ADDRESS)
+    port.set_destination(CAMERA_ADDRESS)
+    buffer = bytearray(viscarelay.RELAY_BUFSIZE)
+    view = memoryview(buffer)
+    clients = [('127.0.0.1', 50000 + n) for n in range(4)]
+    payload = bytes.fromhex('81 01 06 01 05 05 03 03 ff')
+    commands = [(b'\x01\x00' + len(payload).to_bytes(2, 'big') + seq.to_bytes(4, 'big') + payload, clients[seq % 4])
+                for seq in range(1, viscarelay.RELAY_BATCH // 3 + 1)]
+    inbox = port.socket.inbox
+
+    def run():
+        inbox.extend(commands)
+        while inbox:
+            port.relay_packets(buffer, view)
+    run.close = port.close
+    return run, len(commands)
+
+
+def case_osc_camera_handler():
+    """ /setcam by number and by name, among 64 named cameras """
+    import osc
+    config.set_num_cams(64)
+    for n in range(1, 65):
+        config.cameras.update(n, name=f'Position {n}')
+    osc.window = StandInWindow()
+    messages = [(str(n),) if n % 2 else (f'Position {n}',) for n in range(1, 65)]
+    handler = osc.camera_handler
+
+    def run():
+        for args in messages:
+            handler('/setcam', *args)
+        osc.take_actions()
+    return run, len(messages)
+
+
+def case_companion_t_bar():
+    """ Companion.t_bar: a T-bar throw, at the default rate limit """
+    from companion import Companion
+    companion = Companion('127.0.0.1', port=free_port())
+    companion.socket.close()
+    companion.socket = StandInUDPSocket()
+    values = list(range(101)) + list(range(100, -1, -1))
+    t_bar = companion.t_bar
+
+    def run():
+        for value in values:
+            t_bar(value)
+    run.close = companion.close
+    return run, len(values)
+
+
+CASES = {
+    'joy_pos_to_cam_speed': case_joy_pos_to_cam_speed,
+    'controller_dispatch': case_controller_dispatch,
+    'event_pipeline': case_event_pipeline,
+    'camera_pantilt': case_camera_pantilt,
+    'camera_zoom': case_camera_zoom,
+    'receive_response': case_receive_response,
+    'relay_forward': case_relay_forward,
+    'osc_camera_handler': case_osc_camera_handler,
+    'companion_t_bar': case_companion_t_bar,
+}
+
+
+def measure(case, repeat: int) -> dict:
+    try:
+        run, operations = case()
+    except ImportError as exc:
+        return {'skipped': str(exc)}
+    try:
+        timer = timeit.Timer(run)
+        number, _time = timer.autorange()
+        best = min(timer.repeat(repeat=repeat, number=number))
+    finally:
+        close = getattr(run, 'close', None)
+        if close is not None:
+            close()
+    ns = best / (number * operations) * 1e9
+    return {'ns_per_op': round(ns, 1), 'ops_per_s': round(1e9 / ns)}
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> dict:
+    """ The cases more than threshold slower than in the baseline """
+    regressions = {}
+    for name, result in results.items():
+        before = baseline.get('cases', {}).get(name, {}).get('ns_per_op')
+        now = result.get('ns_per_op')
+        if before and now and now > before * (1 + threshold):
+            regressions[name] = {'baseline_ns_per_op': before, 'ns_per_op': now,
+                                 'slower_by': f'{now / before - 1:.0%}'}
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Hot path benchmark suite')
+    parser.add_argument('--cases', default=','.join(CASES), help='comma separated cases to run')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='save the results to this file')
+    parser.add_argument('--compare', help='results of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.2, help='slow down reported as a regression')
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.cases.split(',') if name.strip()]
+    unknown = [name for name in names if name not in CASES]
+    if unknown:
+        parser.error(f'unknown cases: {", ".join(unknown)} (cases are {", ".join(CASES)})')
+
+    result = {'python': platform.python_version(), 'platform': platform.platform(),
+              'cases': {name: measure(CASES[name], args.repeat) for name in names}}
+    ok = True
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(result['cases'], baseline, args.threshold)
+        result['comparison'] = {'baseline': args.compare, 'threshold': args.threshold, 'regressions': regressions}
+        ok = not regressions
+    result['ok'] = ok
+    if args.output:
+        settings_store.write_json(args.output, result)
+    print(json.dumps(result, indent=2))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
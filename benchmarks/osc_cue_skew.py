@@ -0,0 +1,107 @@
+#
+# Skew test for time tagged OSC cues: sends bundles like "recall preset 3 on cameras 1, 2
+# and 4 at T+0.5s" to the OSC server, and measures when each simulated camera received its
+# preset command: the spread between the cameras (skew) and how late the cue fired.
+# For comparison it also measures recalling the preset on the cameras one after another,
+# as the main loop does when it connects to each camera in turn.
+#
+# Usage:
+#   python benchmarks/osc_cue_skew.py [--cameras 4] [--cue 1,2,4] [--cues 10] [--lead 0.5] [--port 19998]
+#
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pythonosc.osc_bundle_builder import OscBundleBuilder
+from pythonosc.osc_message_builder import OscMessageBuilder
+from pythonosc.udp_client import UDPClient
+
+import osc
+import ptz_control
+from camera import Camera
+from visca_sim import SimCamera
+
+PRESET_RECALL = b'\x01\x04\x3f\x02'
+
+
+def preset_times(sims: list[SimCamera], cue: list[int], since: float) -> list[float]:
+    """ time.perf_counter() at which each camera of the cue received a preset recall after since """
+    times = []
+    for cam_num in cue:
+        received = [t for t, _addr, payload in sims[cam_num - 1].log if t >= since and payload[1:5] == PRESET_RECALL]
+        times.append(received[0] if received else float('nan'))
+    return times
+
+
+def summary(values_ms: list[float]) -> dict:
+    return {'p50_ms': round(statistics.median(values_ms), 3), 'max_ms': round(max(values_ms), 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time tagged OSC cue skew test')
+    parser.add_argument('--cameras', type=int, default=4)
+    parser.add_argument('--cue', default='1,2,4', help='cameras in the cue')
+    parser.add_argument('--cues', type=int, default=10)
+    parser.add_argument('--lead', type=float, default=0.5, help='seconds between sending a cue and its time tag')
+    parser.add_argument('--reply-delay', type=float, default=0.002, help='simulated camera reply delay, seconds')
+    parser.add_argument('--port', type=int, default=19998, help='OSC port to use for the test')
+    args = parser.parse_args()
+    cue = [int(n) for n in args.cue.split(',')]
+
+    sims = [SimCamera(reply_delay=args.reply_delay) for _ in range(args.cameras)]
+    for sim in sims:
+        sim.log_enabled = True
+    pool = ptz_control.CameraPool(lambda n: sims[n - 1].address if n <= len(sims) else (None, 0))
+    osc.OSC_Port = args.port
+    server = osc.OSCTask(None, host='127.0.0.1', pool=pool)
+    client = UDPClient('127.0.0.1', args.port)
+
+    skews = []
+    lateness = []
+    for i in range(args.cues):
+        preset = 1 + i % 16
+        sent = time.perf_counter()
+        fire_at = time.time() + args.lead
+        target = sent + args.lead
+        bundle = OscBundleBuilder(fire_at)
+        for cam_num in cue:
+            message = OscMessageBuilder('/ptz/preset')
+            message.add_arg(preset)
+            message.add_arg(cam_num)
+            bundle.add_content(message.build())
+        client.send(bundle.build())
+        time.sleep(args.lead + 0.2)
+        times = preset_times(sims, cue, sent)
+        skews.append((max(times) - min(times)) * 1000)
+        lateness.append((max(times) - target) * 1000)
+
+    # the same recall, one camera after another
+    sequential = []
+    cams = {cam_num: Camera(*sims[cam_num - 1].address) for cam_num in cue}
+    for i in range(args.cues):
+        start = time.perf_counter()
+        for cam_num in cue:
+            cams[cam_num].recall_preset(i % 16)
+        times = preset_times(sims, cue, start)
+        sequential.append((max(times) - min(times)) * 1000)
+    for cam in cams.values():
+        cam.close_connection()
+
+    result = {'cameras': args.cameras, 'cue': cue, 'cues': args.cues, 'lead_s': args.lead,
+              'timed_skew': summary(skews), 'timed_lateness': summary(lateness),
+              'sequential_skew': summary(sequential)}
+    print(json.dumps(result, indent=2))
+
+    server.shutdown()
+    pool.reset()
+    for sim in sims:
+        sim.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+#
+# Load test for the OSC /ptz commands: a simulated fader sends /ptz/pantilt and /ptz/zoom
+# at a high rate to simulated cameras, and the test reports how many VISCA commands
+# reached each camera and checks that the camera ended up at the last requested speeds,
+# then stopped, and recalled the requested preset.
+#
+# Usage:
+#   python benchmarks/osc_ptz_load.py [--rate 200] [--seconds 3] [--cameras 2] [--port 19999]
+#
+import argparse
+import json
+import math
+import os
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pythonosc.udp_client import SimpleUDPClient
+
+import config
+import osc
+import ptz_control
+from visca_sim import SimCamera
+
+
+def float32(value: float) -> float:
+    """ value as received in an OSC float argument """
+    return struct.unpack('>f', struct.pack('>f', value))[0]
+
+
+def drive_commands(sim: SimCamera) -> int:
+    return sum(1 for _t, _addr, payload in sim.log if payload[1:4] in (b'\x01\x06\x01', b'\x01\x04\x07'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='OSC PTZ load test')
+    parser.add_argument('--rate', type=float, default=200, help='OSC messages per second, per camera and axis')
+    parser.add_argument('--seconds', type=float, default=3)
+    parser.add_argument('--cameras', type=int, default=2)
+    parser.add_argument('--port', type=int, default=19999, help='OSC port to use for the test')
+    args = parser.parse_args()
+
+    sims = [SimCamera() for _ in range(args.cameras)]
+    for sim in sims:
+        sim.log_enabled = True
+    pool = ptz_control.CameraPool(lambda n: sims[n - 1].address if n <= len(sims) else (None, 0))
+    osc.OSC_Port = args.port
+    server = osc.OSCTask(None, host='127.0.0.1', pool=pool)
+    client = SimpleUDPClient('127.0.0.1', args.port)
+
+    # sweep the faders, ending at a known position
+    messages = 0
+    interval = 1.0 / args.rate
+    start = time.perf_counter()
+    n = int(args.rate * args.seconds)
+    for i in range(n):
+        phase = 1.0 if i == n - 1 else math.sin(i / 50)
+        for cam_num in range(1, args.cameras + 1):
+            client.send_message('/ptz/pantilt', [0.6 * phase, -0.4 * phase, cam_num])
+            client.send_message('/ptz/zoom', [0.5 * phase, cam_num])
+            messages += 2
+        delay = start + (i + 1) * interval - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+    elapsed = time.perf_counter() - start
+    time.sleep(ptz_control.MIN_INTERVAL * 4)
+
+    profile = config.Config.cam_profile(1)
+    # as Camera speeds: positive OSC pan (right) is a negative Camera pan speed
+    expected = (-profile.speed('pan', float32(0.6)),
+                profile.speed('tilt', float32(-0.4)),
+                profile.speed('zoom', float32(0.5)))
+    result = {'osc_messages': messages, 'osc_messages_per_s': round(messages / elapsed), 'cameras': []}
+    ok = True
+    for cam_num, sim in enumerate(sims, 1):
+        final = (sim.pan_speed, sim.tilt_speed, sim.zoom_speed)
+        correct = final == expected
+        ok = ok and correct
+        result['cameras'].append({'camera': cam_num,
+                                  'drive_commands': drive_commands(sim),
+                                  'drive_commands_per_s': round(drive_commands(sim) / elapsed),
+                                  'final_speeds': final, 'expected_speeds': expected,
+                                  'final_speeds_correct': correct})
+
+    for cam_num in range(1, args.cameras + 1):
+        client.send_message('/ptz/stop', [cam_num])
+        client.send_message('/ptz/preset', [3, cam_num])
+    time.sleep(0.3)
+    positions = [sim.position() for sim in sims]
+    time.sleep(0.2)
+    for cam_num, sim in enumerate(sims, 1):
+        stopped = sim.position() == positions[cam_num - 1]
+        preset = sim.preset == 2
+        ok = ok and stopped and preset
+        result['cameras'][cam_num - 1].update({'stopped': stopped, 'preset_recalled': preset})
+
+    result['ok'] = ok
+    print(json.dumps(result, indent=2))
+
+    server.shutdown()
+    pool.reset()
+    for sim in sims:
+        sim.close()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#
+# Camera speed profile benchmark and check
+#
+# - times converting an axis position to a camera speed by interpolating in the speed curve
+#   (as before profiles) and with a compiled profile's lookup table
+# - compares the two over the whole axis range (the lookup table may differ by one speed
+#   step where the position falls between two table entries)
+# - checks that maximum speeds, reversed pan/tilt and supported commands are applied, and
+#   times finding the profile of a camera among --cameras configured ones
+#
+# Usage:
+#   python benchmarks/profile_bench.py [--cameras 64]
+#
+import argparse
+import bisect
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from camera_profiles import BREAKPOINTS, CameraProfile, parse_speed_list
+from camera_registry import CameraRegistry
+
+
+def interpolated(position: float, joy: list, cam: list) -> int:
+    """ The speed, interpolated in the curve for each position """
+    x = min(abs(position), 1.0)
+    i = bisect.bisect_right(joy, x)
+    if i >= len(joy):
+        speed = cam[-1]
+    else:
+        speed = cam[i - 1] + (cam[i] - cam[i - 1]) * (x - joy[i - 1]) / (joy[i] - joy[i - 1])
+    speed = round(speed)
+    return speed if position >= 0 else -speed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Camera speed profile benchmark')
+    parser.add_argument('--cameras', type=int, default=64)
+    args = parser.parse_args()
+
+    profile = CameraProfile('Default')
+    joy = BREAKPOINTS['pan']
+    cam = [0, 0] + parse_speed_list(profile.speeds['pan'], len(joy) - 2, 24, 'Pan Speeds')
+    repeat = 200000
+    result = {'per_speed_ns': {
+        'interpolated': round(min(timeit.repeat(lambda: interpolated(0.63, joy, cam), number=repeat, repeat=3)) / repeat * 1e9),
+        'lookup_table': round(min(timeit.repeat(lambda: profile.speed('pan', 0.63), number=repeat, repeat=3)) / repeat * 1e9),
+    }}
+    positions = [i / 5000 - 1 for i in range(10001)]
+    differences = [abs(profile.speed('pan', p) - interpolated(p, joy, cam)) for p in positions]
+    result['lookup_vs_interpolated'] = {'max_difference': max(differences),
+                                        'positions_different': sum(1 for d in differences if d)}
+
+    limited = CameraProfile('Limited', speeds={'pan': '2,4,8,12,18,24'}, max_speeds={'pan': 10},
+                            reverse_tilt=True, commands=['presets'])
+    checks = {
+        'max_speed_applied': max(limited.speed('pan', p) for p in positions) == 10,
+        'reversed_tilt': limited.speed('tilt', 1.0) == -profile.speed('tilt', 1.0),
+        'pan_not_reversed': limited.speed('pan', 1.0) > 0,
+        'commands': limited.supports('presets') and not limited.supports('focus'),
+        'saved_and_loaded': CameraProfile.from_dict('Limited', limited.to_dict()).luts == limited.luts,
+    }
+    try:
+        CameraProfile.from_dict('Bad', {'speeds': {'zoom': '1,2,3,4,5,9'}})
+        checks['bad_speeds_rejected'] = False
+    except ValueError:
+        checks['bad_speeds_rejected'] = True
+
+    registry = CameraRegistry(args.cameras)
+    for n in range(1, args.cameras + 1):
+        registry.update(n, profile=limited if n % 2 else profile)
+    last = args.cameras
+    result['profile_lookup_ns'] = round(min(timeit.repeat(lambda: registry.get(last).profile,
+                                                           number=repeat, repeat=3)) / repeat * 1e9)
+    checks['profile_per_camera'] = all(registry.get(n).profile is (limited if n % 2 else profile)
+                                       for n in range(1, args.cameras + 1))
+
+    result['checks'] = checks
+    ok = all(checks.values()) and result['lookup_vs_interpolated']['max_difference'] <= 1
+    result['ok'] = ok
+    print(json.dumps(result, indent=2))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+#
+# Camera registry benchmark and check with a large simulated camera set
+#
+# - times lookups by number, name and address for registries of different sizes (each
+#   should take the same time whatever the number of cameras)
+# - configures a registry with --cameras simulated cameras, recalls a different preset on
+#   each one through the camera workers, by number and by name, and checks that every
+#   simulated camera received its own preset
+#
+# Usage:
+#   python benchmarks/registry_bench.py [--cameras 64] [--sizes 8,32,128]
+#
+import argparse
+import json
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ptz_control
+from camera_registry import CameraRegistry
+from visca_sim import SimCamera
+
+
+def lookup_times(size: int, repeat: int = 200000) -> dict:
+    registry = CameraRegistry(size)
+    for n in range(1, size + 1):
+        registry.update(n, name=f'Position {n}', host=f'10.0.{n // 256}.{n % 256}', port=52381)
+    last = size
+    result = {}
+    for name, stmt in (('number', lambda: registry.get(last).address),
+                       ('name', lambda: registry.number(f'position {last}')),
+                       ('address', lambda: registry.number_at(f'10.0.{last // 256}.{last % 256}', 52381))):
+        result[f'{name}_ns'] = round(min(timeit.repeat(stmt, number=repeat, repeat=3)) / repeat * 1e9)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Camera registry benchmark')
+    parser.add_argument('--cameras', type=int, default=64, help='simulated cameras for the check')
+    parser.add_argument('--sizes', default='8,32,128', help='registry sizes for the lookup times (up to MAX_CAMS)')
+    args = parser.parse_args()
+
+    result = {'lookups': {size: lookup_times(int(size)) for size in args.sizes.split(',')}}
+
+    sims = [SimCamera() for _ in range(args.cameras)]
+    registry = CameraRegistry(args.cameras)
+    for n, sim in enumerate(sims, 1):
+        registry.update(n, name=f'Position {n}', host=sim.address[0], port=sim.address[1])
+    pool = ptz_control.CameraPool(lambda n: registry.get(n).address if registry.get(n) else (None, 0))
+
+    start = time.perf_counter()
+    for n in range(1, args.cameras + 1):
+        # half by number, half by name, as OSC /ptz/preset allows
+        cam_num = n if n % 2 else registry.number(f' POSITION {n} ')
+        pool.worker(cam_num).command('recall_preset', n % 16)
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline and any(sim.preset != n % 16 for n, sim in enumerate(sims, 1)):
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - start
+
+    wrong = [n for n, sim in enumerate(sims, 1) if sim.preset != n % 16]
+    addressed = all(registry.number_at(*sim.address) == n for n, sim in enumerate(sims, 1))
+    result['check'] = {'cameras': args.cameras, 'presets_recalled_s': round(elapsed, 3),
+                       'wrong_cameras': wrong, 'address_lookup_correct': addressed}
+    ok = not wrong and addressed
+    result['ok'] = ok
+    print(json.dumps(result, indent=2))
+
+    pool.reset()
+    for sim in sims:
+        sim.close()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
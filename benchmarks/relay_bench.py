@@ -0,0 +1,124 @@
+#
+# Throughput and latency benchmark for the VISCA relay, against a simulated camera
+#
+# Usage:
+#   python benchmarks/relay_bench.py [--count N] [--module path/to/viscarelay.py]
+#
+# --module loads the relay from another file, e.g. an older version extracted with
+#   git show <commit>:viscarelay.py > /tmp/viscarelay_old.py
+# so that the two can be compared on the same machine.
+#
+import argparse
+import importlib.util
+import json
+import os
+import socket
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from visca_sim import SimCamera
+
+
+def load_relay_module(path):
+    if path is None:
+        import viscarelay
+        return viscarelay
+    spec = importlib.util.spec_from_file_location('viscarelay_under_test', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def command(seq: int) -> bytes:
+    """ pan/tilt stop command with the given sequence number """
+    payload = bytes.fromhex('81 01 06 01 05 05 03 03 ff')
+    return b'\x01\x00' + len(payload).to_bytes(2, 'big') + seq.to_bytes(4, 'big') + payload
+
+
+def latency_test(client, relay_address, count):
+    """ Send one command at a time and wait for its ACK and completion """
+    samples = []
+    for seq in range(1, count + 1):
+        t0 = time.perf_counter()
+        client.sendto(command(seq), relay_address)
+        client.recv(64)     # ACK
+        client.recv(64)     # completion
+        samples.append((time.perf_counter() - t0) * 1e6)
+    samples.sort()
+    return {
+        'round_trips': count,
+        'p50_us': round(samples[len(samples) // 2], 1),
+        'p99_us': round(samples[int(len(samples) * 0.99) - 1], 1),
+        'mean_us': round(statistics.mean(samples), 1),
+    }
+
+
+def throughput_test(client, relay_address, count, window):
+    """ Keep 'window' commands in flight and count the replies relayed back """
+    replies = 0
+    sent = 0
+    t0 = time.perf_counter()
+    while sent < min(window, count):
+        sent += 1
+        client.sendto(command(sent), relay_address)
+    while replies < 2 * count:
+        try:
+            client.recv(64)
+        except socket.timeout:
+            break
+        replies += 1
+        if replies % 2 == 0 and sent < count:
+            sent += 1
+            client.sendto(command(sent), relay_address)
+    elapsed = time.perf_counter() - t0
+    return {
+        'commands': count,
+        'window': window,
+        'replies': replies,
+        'lost': 2 * count - replies,
+        'commands_per_s': round(sent / elapsed),
+        'relayed_packets_per_s': round((sent + replies) / elapsed),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='VISCA relay benchmark')
+    parser.add_argument('--count', type=int, default=5000)
+    parser.add_argument('--window', type=int, default=16)
+    parser.add_argument('--port', type=int, default=0, help='relay port, 0 for any free port')
+    parser.add_argument('--module', default=None, help='load ViscaRelay from this file')
+    args = parser.parse_args()
+
+    relay_module = load_relay_module(args.module)
+    camera = SimCamera()
+
+    port = args.port
+    if port == 0:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.bind(('127.0.0.1', 0))
+            port = s.getsockname()[1]
+    relay = relay_module.ViscaRelay(rcv_port=port)
+    relay.ptz_set('127.0.0.1', camera.port)
+
+    client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    client.settimeout(1.0)
+    relay_address = ('127.0.0.1', port)
+
+    result = {
+        'relay': args.module or 'viscarelay.py',
+        'latency': latency_test(client, relay_address, min(args.count, 2000)),
+        'throughput': throughput_test(client, relay_address, args.count, args.window),
+    }
+    print(json.dumps(result, indent=2))
+
+    client.close()
+    if hasattr(relay, 'close'):
+        relay.close()
+    camera.close()
+
+
+if __name__ == '__main__':
+    main()
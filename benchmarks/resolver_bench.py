@@ -0,0 +1,99 @@
+#
+# Checks that host name resolution stays off the control path: a stub resolver that takes
+# --delay seconds per name is installed, and the time taken by Camera commands, relay camera
+# switches and Companion sends that use names is measured against that delay. A name that
+# has failed to resolve must not be waited for again while the failure is remembered.
+#
+# Usage:
+#   python benchmarks/resolver_bench.py [--delay 0.5] [--count N]
+#
+import argparse
+import json
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import resolver
+import viscarelay
+from camera import Camera
+from companion import Companion
+from visca_sim import SimCamera
+
+NAMES = {'camera1.test': '127.0.0.1', 'companion.test': '127.0.0.1'}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Resolver cache check')
+    parser.add_argument('--delay', type=float, default=0.5, help='seconds taken by the stub resolver')
+    parser.add_argument('--count', type=int, default=1000)
+    args = parser.parse_args()
+
+    calls = []
+
+    def slow_resolve(host):
+        calls.append(host)
+        time.sleep(args.delay)
+        if host not in NAMES:
+            raise socket.gaierror(socket.EAI_NONAME, 'unknown host')
+        return NAMES[host]
+
+    resolver.shared = resolver.Resolver(slow_resolve)
+    result = {'stub_delay_ms': args.delay * 1000}
+
+    def timed(func, *func_args):
+        t0 = time.perf_counter()
+        try:
+            func(*func_args)
+        except OSError:
+            pass
+        return (time.perf_counter() - t0) * 1000
+
+    sim = SimCamera()
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind(('127.0.0.1', 0))
+        relay_port = s.getsockname()[1]
+    relay = viscarelay.ViscaRelay(rcv_port=relay_port)
+
+    # Cold cache: nothing waits for the resolver
+    result['cold_camera_connect_ms'] = round(timed(Camera, 'camera1.test', sim.port), 3)
+    result['cold_relay_switch_ms'] = round(timed(relay.ptz_set, 'camera1.test', sim.port), 3)
+    companion = Companion('companion.test', sim.port)
+    result['cold_companion_send_ms'] = round(timed(companion.pushbutton, 1, 1, 1), 3)
+
+    # The relay destination is set once the name has been resolved
+    time.sleep(args.delay * 1.5)
+    result['relay_destination_after_resolution'] = relay.current.ptz_sockaddr
+
+    # Warm cache: commands through names
+    cam = Camera('camera1.test', sim.port)
+    times = sorted(timed(cam.pantilt, 0, 0) for _ in range(args.count))
+    result['warm_camera_command_ms'] = {'p50': round(times[len(times) // 2], 3), 'max': round(times[-1], 3)}
+    times = sorted(timed(companion.pushbutton, 1, 1, 1) for _ in range(args.count))
+    result['warm_companion_send_ms'] = {'p50': round(times[len(times) // 2], 3), 'max': round(times[-1], 3)}
+    cam.close_connection()
+
+    # Negative caching: an unknown name is only looked up once per NEGATIVE_TTL
+    for _ in range(args.count):
+        resolver.shared.lookup('unknown.test')
+    time.sleep(args.delay * 1.5)
+    for _ in range(args.count):
+        resolver.shared.lookup('unknown.test')
+    result['unknown_name_resolutions'] = calls.count('unknown.test')
+
+    # Waiting for a name: only while it is being resolved, not again once it has failed
+    result['failed_name_first_resolve_ms'] = round(timed(resolver.shared.resolve, 'failed.test', 2.0), 3)
+    result['failed_name_second_resolve_ms'] = round(timed(resolver.shared.resolve, 'failed.test', 2.0), 3)
+    result['resolutions'] = len(calls)
+    result['ok'] = (result['unknown_name_resolutions'] == 1 and
+                    result['failed_name_second_resolve_ms'] < args.delay * 100)
+
+    print(json.dumps(result, indent=2))
+    relay.close()
+    sim.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+#
+# Simulated multi-camera rig: connects Cameras to a number of simulated cameras through the
+# shared transport, and reports the sockets, threads and memory used on the controller side
+# as the number of cameras grows, and the command rate with several threads driving them.
+#
+# Usage:
+#   python benchmarks/rig_bench.py [--cameras 8,16,32] [--workers 4] [--count N]
+#
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import visca_transport
+from camera import Camera
+from visca_sim import SimCamera
+
+
+def drive(cameras: list[Camera], count: int, workers: int) -> dict:
+    """ Each worker sends count pan/tilt commands, round robin over its share of the cameras """
+    def worker(mine):
+        for i in range(count):
+            mine[i % len(mine)].pantilt(1, 0) if i % 2 else mine[i % len(mine)].pantilt(0, 0)
+
+    shares = [cameras[i::workers] for i in range(workers)]
+    threads = [threading.Thread(target=worker, args=(share,)) for share in shares if share]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    return {'commands': count * len(threads),
+            'commands_per_s': round(count * len(threads) / elapsed),
+            'missed_responses': sum(c.num_missed_responses for c in cameras)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulated multi-camera rig')
+    parser.add_argument('--cameras', default='8,16,32', help='comma separated camera counts')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--count', type=int, default=2000, help='commands per worker')
+    args = parser.parse_args()
+
+    counts = [int(n) for n in args.cameras.split(',')]
+    sims = [SimCamera() for _ in range(max(counts))]
+    transport = visca_transport.shared_transport()
+
+    results = []
+    for n in counts:
+        threads_before = threading.active_count()
+        tracemalloc.start()
+        cameras = [Camera(*sim.address) for sim in sims[:n]]
+        memory, _peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result = {
+            'cameras': n,
+            'transport_sockets': len(transport.channels),
+            'transport_channels': transport.num_channels(),
+            'threads_added': threading.active_count() - threads_before,
+            'memory_per_camera_bytes': memory // n,
+        }
+        result.update(drive(cameras, args.count, args.workers))
+        results.append(result)
+        for cam in cameras:
+            cam.close_connection()
+
+    print(json.dumps(results, indent=2))
+    for sim in sims:
+        sim.close()
+
+
+if __name__ == '__main__':
+    main()
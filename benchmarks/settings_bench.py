@@ -0,0 +1,102 @@
+#
+# Settings persistence benchmark: the time and number of file writes for saving and loading
+# the whole configuration, as PySimpleGUI's user settings do it (the file rewritten for
+# every entry set), and with the settings store (one atomic write per save).
+#
+# The settings are those read by config.load_config(), with their default values.
+#
+# Usage:
+#   python benchmarks/settings_bench.py [--repeat 20]
+#
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+import settings_store
+
+
+class EntryByEntryStore(settings_store.SettingsStore):
+    """ PySimpleGUI's behaviour: set() rewrites the whole file """
+    def set(self, key, value):
+        if not self.loaded:
+            self.load()
+        self.values[key] = value
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(self.values, f, indent=4)
+        self.stats['writes'] += 1
+
+    def commit(self):
+        pass
+
+
+class RecordingStore(settings_store.SettingsStore):
+    """ Records the settings read by load_config(), with their defaults """
+    def __init__(self, path):
+        super().__init__(path)
+        self.defaults = {}
+
+    def get(self, key, default=None):
+        self.defaults[key] = default
+        return super().get(key, default)
+
+
+def settings_used() -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        recorder = RecordingStore(os.path.join(directory, 'settings.json'))
+        config.settings = recorder
+        recorder.set('-configured-', True)   # no configuration window
+        config.load_config()
+        return recorder.defaults
+
+
+def measure(store_class, values: dict, path: str) -> dict:
+    store = store_class(path)
+    start = time.perf_counter()
+    for key, value in values.items():
+        store.set(key, value)
+    store.commit()
+    save = time.perf_counter() - start
+    writes = store.stats['writes']
+
+    store = store_class(path)
+    start = time.perf_counter()
+    for key in values:
+        store.get(key)
+    load = time.perf_counter() - start
+    return {'save_s': save, 'load_s': load, 'save_writes': writes, 'load_reads': store.stats['reads']}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Settings persistence benchmark')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    values = settings_used()
+    # a save changes every value
+    values = {key: (f'changed {key}' if value is None else value) for key, value in values.items()}
+
+    result = {'settings': len(values)}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, store_class in (('entry_by_entry', EntryByEntryStore), ('settings_store', settings_store.SettingsStore)):
+            runs = []
+            for i in range(args.repeat):
+                path = os.path.join(directory, f'{name}.json')
+                if os.path.exists(path):
+                    os.remove(path)
+                runs.append(measure(store_class, values, path))
+            result[name] = {'save_ms_p50': round(statistics.median(r['save_s'] for r in runs) * 1000, 3),
+                            'load_ms_p50': round(statistics.median(r['load_s'] for r in runs) * 1000, 3),
+                            'file_writes_per_save': runs[0]['save_writes'],
+                            'file_reads_per_load': runs[0]['load_reads']}
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+#
+# Show file benchmark and check
+#
+# - saves the settings of a configuration with --cameras cameras and a few speed profiles as
+#   a show file, switches to a second venue's show file and back, and checks that the
+#   settings come back as they were
+# - checks that show files with problems are rejected, with the settings unchanged
+# - times reading (and checking) a show file, and switching to it
+#
+# Usage:
+#   python benchmarks/show_file_bench.py [--cameras 32] [--repeat 20]
+#
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+import settings_store
+import show_file
+from camera_profiles import CameraProfile
+
+
+def venue(cameras: int, subnet: int) -> dict:
+    """ The show of a venue with this many cameras """
+    profiles = {'P100': CameraProfile('P100', speeds={'pan': '1,2,4,8,12,16'}, max_speeds={'pan': 18}),
+                'Tail Air': CameraProfile('Tail Air', max_speeds={'zoom': 5}, commands=['presets']),
+                'Ceiling': CameraProfile('Ceiling', reverse_tilt=True)}
+    names = list(profiles) + ['Default']
+    return {'cameras': [{'number': n, 'name': f'Venue {subnet} camera {n}', 'host': f'10.0.{subnet}.{n}',
+                         'port': 52381, 'profile': names[n % len(names)]} for n in range(1, cameras + 1)],
+            'bank_size': 4,
+            'profiles': profiles,
+            'controller': {'long_press_time': 0.5 + subnet / 10, 'dead_zone': None, 'invert_tilt': False, 'swap_pan': False},
+            'companion': {'page': 90 + subnet, 'host': f'10.0.{subnet}.250', 'backup_host': '', 'tcp': False, 'tbar_rate': 30},
+            'osc_feedback': '',
+            'relay': {'shaping': True, 'rate_limit': 0}}
+
+
+def comparable(show: dict) -> str:
+    show = dict(show, profiles={name: profile.to_dict() for name, profile in show['profiles'].items()})
+    return json.dumps(show, sort_keys=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Show file benchmark')
+    parser.add_argument('--cameras', type=int, default=32)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    checks = {}
+    with tempfile.TemporaryDirectory() as directory:
+        config.settings = settings_store.SettingsStore(os.path.join(directory, 'settings.json'))
+        config.settings.set('-configured-', True)
+        config.load_config()
+
+        first = os.path.join(directory, 'first.json')
+        second = os.path.join(directory, 'second.json')
+        show_file.write(first, venue(args.cameras, 1), name='First')
+        show_file.write(second, venue(args.cameras // 2, 2), name='Second')
+
+        config.apply_show(show_file.read(first))
+        before = comparable(config.show_settings())
+        exported = os.path.join(directory, 'exported.json')
+        show_file.write(exported, config.show_settings())
+        config.apply_show(show_file.read(second))
+        checks['switched'] = config.cameras.get(1).address == ('10.0.2.1', 52381) and config.g_num_cams == args.cameras // 2
+        config.apply_show(show_file.read(exported))
+        checks['round_trip'] = comparable(config.show_settings()) == before
+        checks['profiles_applied'] = config.cam_profile(1).name == 'Tail Air' and not config.cam_profile(1).supports('focus')
+
+        bad_files = {
+            'not_json': '{"format": ',
+            'wrong_format': json.dumps({'format': 'something else', 'version': 1}),
+            'newer_version': json.dumps({'format': show_file.FORMAT, 'version': show_file.VERSION + 1}),
+            'bad_port': json.dumps({'format': show_file.FORMAT, 'version': 1, 'cameras': [{'number': 1, 'port': 70000}]}),
+            'duplicate_camera': json.dumps({'format': show_file.FORMAT, 'version': 1,
+                                            'cameras': [{'number': 1}, {'number': 1}]}),
+            'unknown_profile': json.dumps({'format': show_file.FORMAT, 'version': 1,
+                                           'cameras': [{'number': 1, 'profile': 'Missing'}]}),
+            'bad_speeds': json.dumps({'format': show_file.FORMAT, 'version': 1,
+                                      'profiles': {'P': {'speeds': {'zoom': '1,2,3,4,5,9'}}}}),
+            'unknown_setting': json.dumps({'format': show_file.FORMAT, 'version': 1, 'companion': {'hots': 'x'}}),
+        }
+        problems = {}
+        for name, text in bad_files.items():
+            path = os.path.join(directory, f'{name}.json')
+            with open(path, 'w') as f:
+                f.write(text)
+            try:
+                config.apply_show(show_file.read(path))
+                problems[name] = None
+            except show_file.ShowFileError as exc:
+                problems[name] = exc.problems
+        checks['bad_files_rejected'] = all(problems.values())
+        checks['unchanged_after_bad_files'] = comparable(config.show_settings()) == before
+
+        reads, switches = [], []
+        for i in range(args.repeat):
+            start = time.perf_counter()
+            show = show_file.read(first if i % 2 else second)
+            reads.append(time.perf_counter() - start)
+            config.apply_show(show)
+            switches.append(time.perf_counter() - start)
+
+    result = {'cameras': args.cameras,
+              'read_ms_p50': round(statistics.median(reads) * 1000, 3),
+              'switch_ms_p50': round(statistics.median(switches) * 1000, 3),
+              'problems_found': {name: found[0] if found else None for name, found in problems.items()},
+              'checks': checks}
+    ok = all(checks.values())
+    result['ok'] = ok
+    print(json.dumps(result, indent=2))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
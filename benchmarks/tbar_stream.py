@@ -0,0 +1,66 @@
+#
+# T-bar streaming test: simulates fast T-bar throws (an axis event every millisecond) to a
+# fake Companion UDP listener, and reports how many values were sent, the send rate, and
+# whether the last value of each throw reached Companion.
+#
+# Usage:
+#   python benchmarks/tbar_stream.py [--rate 30] [--throws 4] [--events 500]
+#
+import argparse
+import json
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from companion import Companion
+
+
+def received_values(sock: socket.socket) -> list[int]:
+    values = []
+    while True:
+        try:
+            data = sock.recv(2048)
+        except socket.timeout:
+            return values
+        values.append(int(data.decode().rsplit(' ', 1)[1]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='T-bar streaming test')
+    parser.add_argument('--rate', type=float, default=30, help='maximum T-bar values per second')
+    parser.add_argument('--throws', type=int, default=4)
+    parser.add_argument('--events', type=int, default=500, help='axis events per throw')
+    args = parser.parse_args()
+
+    listener = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    listener.bind(('127.0.0.1', 0))
+    listener.settimeout(0.3)
+    companion = Companion('127.0.0.1', listener.getsockname()[1], tbar_rate=args.rate)
+
+    result = {'rate': args.rate, 'throws': []}
+    ok = True
+    start = time.perf_counter()
+    for throw in range(args.throws):
+        # full throws end at 100, which flips the T-bar; partial throws stop part way
+        end = 100 if throw % 2 == 0 else 63
+        for i in range(args.events + 1):
+            companion.t_bar(round(end * i / args.events))
+            time.sleep(0.001)
+        values = received_values(listener)
+        correct = bool(values) and values[-1] == end
+        ok = ok and correct
+        result['throws'].append({'events': args.events + 1, 'sent': len(values), 'last': values[-1] if values else None,
+                                 'expected_last': end, 'last_correct': correct})
+    elapsed = time.perf_counter() - start
+    result['stats'] = companion.tbar.stats
+    result['ok'] = ok
+    print(json.dumps(result, indent=2))
+    print(f'{companion.tbar.stats["sent"] / elapsed:.1f} values/s sent overall', file=sys.stderr)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
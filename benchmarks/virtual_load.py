@@ -0,0 +1,342 @@
+#
+# Load test with virtual game controllers: many virtual controllers (see virtual_joystick)
+# move their sticks, press camera buttons and (optionally) the preset hat at a configurable
+# rate, through the program's own event handling, to simulated cameras:
+#
+#   virtual controllers -> pygame event queue -> main.pygame_task (with its axis event
+#   flushing) -> window event queue -> main.handle_pygame_event -> handlers -> Camera
+#
+# The window is a stand-in whose event queue is read by a thread in place of the main
+# loop. The controllers are attached with JOYDEVICEADDED events, as real ones are, and
+# each one is set up from the controller map of its name.
+#
+# Patterns:
+# - sweep: the sticks sweep back and forth, and a camera button is pressed every second
+# - random: random stick movements and button presses, repeatable with --seed
+# - a JSON file (--script FILE): a list of steps played in a loop, one per tick, e.g.
+#     [{"axis": "pan", "value": 0.5}, {"press": "camera2"}, {"release": "camera2"},
+#      {"hat": "presets", "value": [0, 1]}, {"hat": "presets", "value": [0, 0]}]
+#   axes are "pan", "tilt", "zoom" or a number, buttons "camera1"... or a number and
+#   hats "presets" or a number
+# The preset hat is only used with --hats: every hat event holds the event handling for
+# 0.1s (the hat debounce), so it dominates the throughput.
+#
+# Reports the events generated, handled and flushed, the event rate, the latency from a
+# controller movement to the end of its handling, the backlog of window events and the
+# VISCA commands received by each simulated camera, and checks that every controller was
+# set up, that no handler failed and that the camera stopped when the sticks were released.
+#
+# Usage:
+#   python benchmarks/virtual_load.py [--controllers 8] [--rate 100] [--seconds 5]
+#                                     [--pattern sweep|random] [--script FILE] [--seed 1]
+#                                     [--hats] [--cameras 4] [--name 'Virtual gamepad']
+#
+import argparse
+import heapq
+import json
+import math
+import os
+import queue
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import traceback
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')    # no display needed
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import settings_store
+
+# never the user's settings, and no configuration dialog
+_settings_dir = tempfile.TemporaryDirectory()
+settings_store.shared = settings_store.SettingsStore(os.path.join(_settings_dir.name, 'settings.json'))
+settings_store.shared.set('-configured-', True)
+
+import socket
+import pygame
+import config
+from controller import ControlFunc, ControllerList
+from virtual_joystick import VirtualJoysticks
+from visca_sim import SimCamera
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+# the main module, without binding the relay's fixed port
+config.g_visca_relay_port = free_port()
+import main as program
+
+
+class StandInWindow:
+    """ In place of the main window: its events are queued for the main loop thread """
+    metadata = None     # no system tray
+
+    def __init__(self):
+        self.events = queue.Queue()
+        self.max_backlog = 0
+
+    def write_event_value(self, key, value):
+        self.events.put((key, value))
+        self.max_backlog = max(self.max_backlog, self.events.qsize())
+
+
+def controls(controller) -> dict:
+    """ The controls of a controller, by name, from its controller map """
+    axes = {'pan': controller.pan_axis.value if controller.pan_axis else None,
+            'tilt': controller.tilt_axis.value if controller.tilt_axis else None}
+    for axis in controller.axes:
+        if axis.control_func == ControlFunc.ZOOM:
+            axes['zoom'] = axis.value
+    buttons = {f'camera{button.value}': index for index, button in enumerate(controller.buttons)
+               if button.controller_func == ControlFunc.CAMERA_SELECT}
+    hats = {'presets': index for index, hat in enumerate(controller.hats)
+            if hat.button.controller_func == ControlFunc.PRESET}
+    return {'axes': {k: v for k, v in axes.items() if v is not None}, 'buttons': buttons, 'hats': hats}
+
+
+def sweep(joystick, named: dict, _rng, rate: float, hats: bool):
+    """ The sticks sweep back and forth, a camera button is pressed every second and,
+        with hats, the preset hat is tapped every five seconds
+    """
+    axes = list(named['axes'].values())
+    buttons = sorted(named['buttons'].values())
+    hat = next(iter(named['hats'].values()), None) if hats else None
+    tick = 0
+    while True:
+        if buttons and tick % max(int(rate), 2) == 0:
+            button = buttons[(tick // max(int(rate), 2)) % len(buttons)]
+            yield joystick.press(button)
+            yield joystick.release(button)
+        elif hat is not None and tick % max(int(rate * 5), 2) == 1:
+            yield joystick.move_hat(hat, (0, 1))
+            yield joystick.move_hat(hat, (0, 0))
+        else:
+            axis = axes[tick % len(axes)]
+            yield joystick.move_axis(axis, math.sin(tick / rate * 2 + axis))
+        tick += 1
+
+
+def random_walk(joystick, named: dict, rng: random.Random, _rate: float, hats: bool):
+    """ Random stick movements, with an occasional button press or hat tap """
+    axes = list(named['axes'].values())
+    buttons = list(named['buttons'].values())
+    hat_list = list(named['hats'].values()) if hats else []
+    while True:
+        r = rng.random()
+        if buttons and r < 0.05:
+            button = rng.choice(buttons)
+            yield joystick.press(button)
+            yield joystick.release(button)
+        elif hat_list and r < 0.07:
+            hat = rng.choice(hat_list)
+            yield joystick.move_hat(hat, rng.choice([(0, 1), (1, 0), (0, -1), (-1, 0)]))
+            yield joystick.move_hat(hat, (0, 0))
+        else:
+            axis = rng.choice(axes)
+            yield joystick.move_axis(axis, joystick.get_axis(axis) + rng.uniform(-0.3, 0.3))
+
+
+def scripted(steps: list):
+    """ A pattern playing a list of steps in a loop """
+    def play(joystick, named: dict, _rng, _rate: float, _hats: bool):
+        def control(kind, name):
+            return name if isinstance(name, int) else named[kind][name]
+        while True:
+            for step in steps:
+                if 'axis' in step:
+                    yield joystick.move_axis(control('axes', step['axis']), step['value'])
+                elif 'press' in step:
+                    yield joystick.press(control('buttons', step['press']))
+                elif 'release' in step:
+                    yield joystick.release(control('buttons', step['release']))
+                elif 'hat' in step:
+                    yield joystick.move_hat(control('hats', step['hat']), step['value'])
+    return play
+
+
+PATTERNS = {'sweep': sweep, 'random': random_walk}
+
+
+def percentile(samples: list, p: float) -> float:
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))] if samples else 0.0
+
+
+def main_loop(window: StandInWindow, stats: dict):
+    """ The PYGAME_EVENT handling of main.main_loop(), timing each event """
+    while True:
+        key, ev = window.events.get()
+        if key is None:
+            return
+        if key != 'PYGAME_EVENT':
+            continue
+        started = time.perf_counter()
+        try:
+            program.pygame_lock(lambda: program.handle_pygame_event(ev))
+        except Exception:
+            stats['errors'] += 1
+            if stats['first_error'] is None:
+                stats['first_error'] = traceback.format_exc()
+        done = time.perf_counter()
+        stats['handled'][pygame.event.event_name(ev.type)] = stats['handled'].get(pygame.event.event_name(ev.type), 0) + 1
+        created = getattr(ev, 'created', None)
+        if created is not None:
+            stats['latency'].append(done - created)
+        stats['handling'].append(done - started)
+        stats['last_done'] = done
+
+
+def post(ev):
+    ev.created = time.perf_counter()
+    pygame.event.post(ev)
+
+
+def wait_idle(window: StandInWindow, timeout: float = 10):
+    """ Wait until the pygame and window event queues are empty """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if window.events.empty() and not pygame.event.peek():
+            time.sleep(0.2)
+            if window.events.empty() and not pygame.event.peek():
+                return
+        time.sleep(0.01)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test with virtual game controllers')
+    parser.add_argument('--controllers', type=int, default=8)
+    parser.add_argument('--rate', type=float, default=100, help='events per second, per controller')
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--pattern', choices=sorted(PATTERNS), default='sweep')
+    parser.add_argument('--script', help='JSON file of steps, in place of --pattern')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--hats', action='store_true', help='use the preset hat')
+    parser.add_argument('--cameras', type=int, default=4)
+    parser.add_argument('--name', default='Virtual gamepad', help='controller name, selects the controller map')
+    args = parser.parse_args()
+
+    if args.script:
+        with open(args.script, 'r', encoding='utf-8') as f:
+            pattern = scripted(json.load(f))
+    else:
+        pattern = PATTERNS[args.pattern]
+
+    sims = [SimCamera() for _ in range(args.cameras)]
+    config.set_num_cams(args.cameras)
+    for n, sim in enumerate(sims, 1):
+        config.cameras.update(n, name=f'Sim {n}', host=sim.address[0], port=sim.address[1])
+    config.publish_snapshot()
+    program.bitfocus.port = free_port()    # Companion button presses go nowhere
+
+    window = StandInWindow()
+    program.main_window = window
+    joysticks = VirtualJoysticks()
+    snapshot = config.snapshot
+    program.controller_list = ControllerList(program.controller_callbacks, snapshot.long_press_time, snapshot.dead_zone,
+                                          snapshot.generation, open_joystick=joysticks.open)
+    stats = {'handled': {}, 'latency': [], 'handling': [], 'errors': 0, 'first_error': None, 'last_done': 0.0}
+    loop = threading.Thread(target=main_loop, args=(window, stats), name='main loop')
+    loop.start()
+    program.pygame_task_start(window)
+    time.sleep(0.5)     # pygame initialized
+
+    virtual = []
+    for _ in range(args.controllers):
+        joystick, added = joysticks.attach(args.name)
+        post(added)
+        virtual.append(joystick)
+    wait_idle(window)
+    attached = [program.controller_list.lookup(joystick.instance_id) for joystick in virtual]
+    checks = {'controllers_set_up': all(c is not None and c.pan_axis is not None for c in attached)}
+    if not checks['controllers_set_up']:
+        print(json.dumps({'checks': checks, 'ok': False}, indent=2))
+        sys.exit(1)
+
+    generators = [pattern(joystick, controls(controller), random.Random(args.seed * 1000 + i), args.rate, args.hats)
+                  for i, (joystick, controller) in enumerate(zip(virtual, attached))]
+    interval = 1.0 / args.rate
+    start = time.perf_counter()
+    # each controller's ticks are spread over the interval
+    ticks = [(start + i * interval / len(virtual), i) for i in range(len(virtual))]
+    heapq.heapify(ticks)
+    generated = 0
+    end = start + args.seconds
+    while ticks:
+        at, i = heapq.heappop(ticks)
+        if at >= end:
+            break
+        delay = at - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        post(next(generators[i]))
+        generated += 1
+        heapq.heappush(ticks, (at + interval, i))
+    elapsed = time.perf_counter() - start
+
+    # release everything
+    for joystick in virtual:
+        for axis in controls(program.controller_list.lookup(joystick.instance_id))['axes'].values():
+            post(joystick.move_axis(axis, 0.0))
+            generated += 1
+        for button, down in enumerate(joystick.buttons):
+            if down:
+                post(joystick.release(button))
+                generated += 1
+    wait_idle(window)
+    time.sleep(0.2)
+    # the rate at which the events were handled, until the last one
+    handled_per_s = round(sum(stats['handled'].values()) / (stats['last_done'] - start))
+    current = sims[program.current_cam_num - 1] if 1 <= program.current_cam_num <= len(sims) else None
+    checks['no_handler_errors'] = stats['errors'] == 0
+    checks['camera_stopped'] = current is None or (current.pan_speed, current.tilt_speed, current.zoom_speed) == (0, 0, 0)
+
+    for joystick in virtual:
+        post(joysticks.detach(joystick))
+    wait_idle(window)
+    checks['controllers_removed'] = not list(program.controller_list)
+
+    program.pygame_task_end()
+    window.events.put((None, None))
+    loop.join()
+
+    handled = sum(stats['handled'].values())
+    latency = sorted(stats['latency'])
+    handling = sorted(stats['handling'])
+    result = {
+        'controllers': args.controllers,
+        'pattern': os.path.basename(args.script) if args.script else args.pattern,
+        'rate_per_controller': args.rate,
+        'events_generated': generated,
+        'events_generated_per_s': round(generated / elapsed),
+        'events_handled': stats['handled'],
+        'events_flushed': generated + 2 * args.controllers - handled,
+        'events_handled_per_s': handled_per_s,
+        'latency_ms': {'p50': round(percentile(latency, 50) * 1000, 3), 'p99': round(percentile(latency, 99) * 1000, 3),
+                       'max': round(latency[-1] * 1000, 3) if latency else 0.0},
+        'handling_us': {'p50': round(percentile(handling, 50) * 1e6, 1), 'p99': round(percentile(handling, 99) * 1e6, 1),
+                        'mean': round(statistics.mean(handling) * 1e6, 1) if handling else 0.0},
+        'max_window_backlog': window.max_backlog,
+        'camera_commands': {f'Sim {n}': sim.num_commands for n, sim in enumerate(sims, 1)},
+        'checks': checks,
+    }
+    if stats['first_error']:
+        result['first_error'] = stats['first_error']
+    ok = all(checks.values())
+    result['ok'] = ok
+    print(json.dumps(result, indent=2))
+
+    program.visca_relay.close()
+    for sim in sims:
+        sim.close()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,11 @@ from typing import Optional, Tuple
 
 #from visca_over_ip.exceptions import ViscaException, NoQueryResponse
 from visca_exceptions import ViscaException, NoQueryResponse
+import latency
+import metrics
+import tracing
+import viscarelay
+import visca_transport
 
 SEQUENCE_NUM_MAX = 2 ** 32 - 1
 
@@ -15,21 +20,25 @@ class Camera:
     Represents a camera that has a VISCA-over-IP interface.
     Provides methods to control a camera over that interface.
 
-    Only one camera can be connected on a given port at a time.
-    If you wish to use multiple cameras, you will need to switch between them (use :meth:`close_connection`)
-    or set them up to use different ports.
+    All cameras share the sockets and I/O thread of visca_transport, which passes each reply to
+    the Camera it came from, so any number of cameras can be connected at once.
+    Use :meth:`close_connection` when a camera is no longer needed.
     """
-    def __init__(self, ip: str, port=52381):
+    def __init__(self, ip: str, port=52381, camera_num: Optional[int] = None):
         """:param ip: the IP address or hostname of the camera you want to talk to.
         :param port: the port number to use. 52381 is the default for most cameras.
+        :param camera_num: the camera number latency probes are recorded against, None for the current camera
         """
         self._location = (ip, port)
-        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)  # for UDP stuff
-        self._sock.bind(('', 0))
-        self._port = self._sock.getsockname()[1]  
-        self._sock.settimeout(0.1)
+        self.camera_num = camera_num
+        # A relay port of this process is used in memory, rather than through the loopback,
+        # otherwise the camera is reached through the shared transport
+        self._channel = viscarelay.local_client(ip, port)
+        if self._channel is None:
+            self._channel = visca_transport.shared_transport().channel(ip, port)
 
         self.num_missed_responses = 0
+        self.responding = False  # True if the camera answered the most recent command
         self.sequence_number = 0  # This number is encoded in each message and incremented after sending each message
         self.num_retries = 5
         try:
@@ -38,9 +47,18 @@ class Camera:
         except ViscaException:
             pass
         except Exception as exc:
-            self._sock.close()
+            self.close_connection()
             raise exc
 
+    def _send(self, message):
+        channel = self._channel
+        if not channel.send(message):
+            # the relay port has been closed, go through the network from now on
+            channel = self._channel = visca_transport.shared_transport().channel(*self._location)
+            channel.send(message)
+        if channel.__class__ is not viscarelay.LocalClient:
+            # sent straight to the camera, past any relay port shaping its commands
+            viscarelay.forget_drives(channel.sockaddr)
 
     def _send_command(self, command_hex: str, query=False) -> Optional[bytes]:
         """Constructs a message based ong the given payload, sends it to the camera,
@@ -58,26 +76,45 @@ class Camera:
         payload_length = len(payload_bytes).to_bytes(2, 'big')
 
         exception = None
-        for retry_num in range(self.num_retries):
-            self._increment_sequence_number()
-            sequence_bytes = self.sequence_number.to_bytes(4, 'big')
-            message = payload_type + payload_length + sequence_bytes + payload_bytes
-
-            self._sock.sendto(message, self._location)
-
-            try:
-                response = self._receive_response()
-            except ViscaException as exc:
-                exception = exc
-            else:
-                if response is not None:
-                    return response[1:-1]
-                elif not query:
-                    return None
-        if exception:
-            raise exception
+        if tracing.enabled:
+            span = tracing.span(f'VISCA {command_hex}', 'camera',
+                                {'camera': self._location[0], 'port': self._location[1]})
         else:
-            raise NoQueryResponse(f'Could not get a response after {self.num_retries} tries')
+            span = tracing.null_span
+        with span:
+            for retry_num in range(self.num_retries):
+                self._increment_sequence_number()
+                sequence_bytes = self.sequence_number.to_bytes(4, 'big')
+                message = payload_type + payload_length + sequence_bytes + payload_bytes
+
+                if retry_num:
+                    metrics.inc('visca_retries_total')
+                    tracing.instant('retry', 'camera', {'command': command_hex, 'retry': retry_num})
+                metrics.inc('visca_commands_total')
+
+                probe = latency.enabled
+                if probe:
+                    latency.since_origin('send', self.camera_num)
+                    t_send = latency.now()
+
+                self._send(message)
+
+                try:
+                    response = self._receive_response()
+                except ViscaException as exc:
+                    metrics.inc('visca_exceptions_total', status=f'0x{exc.status_code:02x}')
+                    exception = exc
+                else:
+                    if probe and response is not None:
+                        latency.since('ack', t_send, self.camera_num)
+                    if response is not None:
+                        return response[1:-1]
+                    elif not query:
+                        return None
+            if exception:
+                raise exception
+            else:
+                raise NoQueryResponse(f'Could not get a response after {self.num_retries} tries')
 
     def _receive_response(self) -> Optional[bytes]:
         """Attempts to receive the response of the most recent command.
@@ -87,27 +124,34 @@ class Camera:
         """
         while True:
             try:
-                response = self._sock.recv(32)
+                response = self._channel.recv(0.1)
                 response_sequence_number = int.from_bytes(response[4:8], 'big')
 
-                if response_sequence_number < self.sequence_number:
+                if response[0:2] == b'\x02\x01':
+                    # control reply, to reset_sequence_number()
+                    self.responding = True
+                    return response[8:]
+                elif response_sequence_number < self.sequence_number:
                     continue
                 else:
                     response_payload = response[8:]
                     if len(response_payload) > 2:
                         status_byte = response_payload[1]
+                        self.responding = True
                         if status_byte >> 4 not in [5, 4]:
                             raise ViscaException(response_payload)
                         else:
                             return response_payload
 
             except socket.timeout:  # Occasionally we don't get a response because this is UDP
+                self.responding = False
                 self.num_missed_responses += 1
+                metrics.inc('visca_missed_responses_total')
                 break
 
     def reset_sequence_number(self):
         message = bytearray.fromhex('02 00 00 01 00 00 00 01 01')
-        self._sock.sendto(message, self._location)
+        self._send(message)
         self._receive_response()
         self.sequence_number = 1
 
@@ -117,11 +161,8 @@ class Camera:
             self.sequence_number = 0
 
     def close_connection(self):
-        """Only one camera can be bound to a socket at once.
-        If you want to connect to another camera which uses the same communication port,
-        first call this method on the first camera.
-        """
-        self._sock.close()
+        """Stop receiving replies for this camera"""
+        self._channel.close()
 
     def set_power(self, power_state: bool):
         """Powers on or off the camera based on the value of power_state"""
@@ -0,0 +1,153 @@
+#
+# Camera speed profiles
+#
+# Cameras differ in their top speeds, zoom ranges and in the commands they accept, so one
+# speed curve is too slow on some and too twitchy on others. A profile describes one kind
+# of camera:
+# - the speed curve for each kind of movement: the camera speeds at fixed joystick
+#   breakpoints, as edited in the configuration dialog
+# - the highest speed the camera accepts for each kind of movement
+# - whether its pan or tilt is reversed (e.g. a ceiling mounted camera)
+# - the optional commands it supports (focus, presets, brightness, white balance)
+#
+# A profile is compiled, when it is created, into a lookup table of STEPS + 1 speeds per
+# kind of movement, so converting a joystick or OSC position into a camera speed is a
+# single list index. Profiles are never changed once made, a changed profile replaces the
+# old one. Each camera entry in the registry holds its profile, so selecting a camera
+# switches curves by taking a reference.
+#
+import functools
+
+DEFAULT = 'Default'
+
+STEPS = 256     # lookup table entries per unit of joystick travel
+
+# Joystick positions (0 to 1) at which the camera speeds of a curve apply. The speed at
+# the first two is always 0 (the dead band), the user sets the others
+BREAKPOINTS = {
+    'pan':   [0, 0.15, 0.2, 0.3, 0.5, 0.8, 0.9, 1],
+    'tilt':  [0, 0.15, 0.2, 0.3, 0.5, 0.8, 0.9, 1],
+    'zoom':  [0, 0.15, 0.2, 0.3, 0.4, 0.5, 0.7, 1],
+    'focus': [0, 0.2, 0.3, 0.7, 1],
+}
+
+# the highest speed of each kind in the VISCA commands
+VISCA_MAX = {'pan': 24, 'tilt': 24, 'zoom': 7, 'focus': 7}
+
+DEFAULT_SPEEDS = {'pan': '1,1,3,5,7,9', 'tilt': '1,1,3,5,7,9', 'zoom': '1,1,1,3,5,7', 'focus': '2,5,7'}
+
+# optional commands; pan/tilt and zoom are supported by every camera
+COMMANDS = ('focus', 'presets', 'brightness', 'white_balance')
+
+
+# ------------------------------------------------------------------
+# Phil Rose (2026-06-24)
+# Parse, validate, and apply comma-separated speed response lists.
+# ------------------------------------------------------------------
+def parse_speed_list(text, expected_count, max_value, label):
+    try:
+        values = [int(x.strip()) for x in text.split(',')]
+    except ValueError:
+        raise ValueError(f"{label} must contain only comma-separated whole numbers.")
+
+    if len(values) != expected_count:
+        raise ValueError(
+            f"{label} must contain exactly {expected_count} comma-separated values.\n"
+            f"Example: {'1,1,3,5,7,9' if expected_count == 6 else '2,5,7'}"
+        )
+
+    for value in values:
+        if value < 0 or value > max_value:
+            raise ValueError(f"{label} values must be between 0 and {max_value}.")
+
+    return values
+
+
+@functools.lru_cache(maxsize=256)
+def _compile(joy: tuple, cam: tuple, max_speed: int) -> tuple:
+    """ The speed for each of STEPS + 1 positions, interpolated in the curve and limited to max_speed
+        (cached: switching between show files compiles the same curves again)
+    """
+    lut = []
+    j = 1   # the breakpoint after x
+    last = len(joy) - 1
+    for i in range(STEPS + 1):
+        x = i / STEPS
+        while j < last and x >= joy[j]:
+            j += 1
+        speed = cam[j - 1] + (cam[j] - cam[j - 1]) * (x - joy[j - 1]) / (joy[j] - joy[j - 1])
+        lut.append(min(round(speed), max_speed))
+    return tuple(lut)
+
+
+class CameraProfile:
+    def __init__(self, name: str = DEFAULT, speeds: dict | None = None, max_speeds: dict | None = None,
+                 reverse_pan: bool = False, reverse_tilt: bool = False, commands=COMMANDS):
+        """ :param speeds: kind -> comma-separated camera speeds, as in the configuration dialog
+            :param max_speeds: kind -> highest speed the camera accepts
+            :param commands: the optional commands (see COMMANDS) the camera supports
+            :raises ValueError: for a bad speed list or maximum speed
+        """
+        self.name = name
+        self.speeds = dict(DEFAULT_SPEEDS, **(speeds or {}))
+        self.max_speeds = dict(VISCA_MAX, **(max_speeds or {}))
+        self.reverse_pan = bool(reverse_pan)
+        self.reverse_tilt = bool(reverse_tilt)
+        self.commands = frozenset(c for c in commands if c in COMMANDS)
+        self.luts = {}
+        for kind, joy in BREAKPOINTS.items():
+            max_speed = self.max_speeds[kind]
+            if not isinstance(max_speed, int) or not 1 <= max_speed <= VISCA_MAX[kind]:
+                raise ValueError(f"{name}: maximum {kind} speed must be between 1 and {VISCA_MAX[kind]}.")
+            cam = parse_speed_list(self.speeds[kind], len(joy) - 2, VISCA_MAX[kind],
+                                   f"{name}: {kind.capitalize()} Speeds")
+            self.luts[kind] = _compile(tuple(joy), (0, 0, *cam), max_speed)
+        # the tables with the signs applied, for positive and negative positions
+        self.forward = {}
+        self.backward = {}
+        for kind, lut in self.luts.items():
+            sign = -1 if (kind == 'pan' and self.reverse_pan) or (kind == 'tilt' and self.reverse_tilt) else 1
+            self.forward[kind] = tuple(sign * speed for speed in lut)
+            self.backward[kind] = tuple(-sign * speed for speed in lut)
+
+    def speed(self, kind: str, position: float) -> int:
+        """ Camera speed for an axis position (-1 to 1), with the sign of the position
+            (reversed if the camera's pan or tilt is)
+        """
+        if position >= 0:
+            lut = self.forward[kind]
+        else:
+            lut = self.backward[kind]
+            position = -position
+        i = int(position * STEPS + 0.5)
+        return lut[i] if i <= STEPS else lut[STEPS]
+
+    def supports(self, command: str) -> bool:
+        return command in self.commands
+
+    def to_dict(self) -> dict:
+        """ The profile's settings, as saved """
+        return {'speeds': dict(self.speeds), 'max_speeds': dict(self.max_speeds),
+                'reverse_pan': self.reverse_pan, 'reverse_tilt': self.reverse_tilt,
+                'commands': [c for c in COMMANDS if c in self.commands]}
+
+    @classmethod
+    def from_dict(cls, name: str, values: dict) -> 'CameraProfile':
+        """ A profile from saved settings
+            :raises ValueError: if they aren't valid
+        """
+        if not isinstance(values, dict):
+            raise ValueError(f"{name}: profile settings must be a dictionary")
+        speeds = values.get('speeds', {})
+        max_speeds = values.get('max_speeds', {})
+        commands = values.get('commands', COMMANDS)
+        if not isinstance(speeds, dict) or not isinstance(max_speeds, dict) or not isinstance(commands, list | tuple):
+            raise ValueError(f"{name}: bad profile settings")
+        return cls(name, {k: str(v) for k, v in speeds.items() if k in BREAKPOINTS},
+                   {k: v for k, v in max_speeds.items() if k in BREAKPOINTS},
+                   reverse_pan=values.get('reverse_pan', False),
+                   reverse_tilt=values.get('reverse_tilt', False),
+                   commands=commands)
+
+
+default_profile = CameraProfile()
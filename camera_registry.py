@@ -0,0 +1,130 @@
+#
+# Registry of the configured cameras
+#
+# Cameras are numbered from 1. The registry keeps a list indexed by camera number, and
+# dictionaries from (normalized) name and from address to camera number, so every lookup
+# made on the control path (camera to address, name to camera, address to camera) is a
+# single index or dictionary access, however many cameras are configured. Each entry also
+# holds the camera's speed profile (camera_profiles), so it is found with the address.
+#
+# Changes (from the configuration dialog or OSC /setcamname) are made under a lock, and
+# update the indexes incrementally. Lookups don't take the lock: entries and the lists of
+# numbers in the indexes are replaced, never changed in place.
+#
+import bisect
+import threading
+from camera_profiles import CameraProfile, default_profile
+
+DEFAULT_PORT = 52381
+MAX_CAMS = 128
+
+
+def normalize_name(name) -> str:
+    return str(name).strip().lower()
+
+
+class CameraEntry:
+    def __init__(self, number: int, name: str = '', host: str = '', port: int = DEFAULT_PORT,
+                 profile: CameraProfile = default_profile):
+        self.number = number
+        self.name = name or f'Camera {number}'
+        self.host = host
+        self.port = port
+        self.profile = profile
+
+    @property
+    def address(self) -> tuple[str, int]:
+        return self.host, self.port
+
+
+class CameraRegistry:
+    def __init__(self, num_cams: int = 8):
+        self.lock = threading.Lock()
+        self.cameras: list[CameraEntry] = []
+        # normalized name -> numbers of the cameras with that name, lowest first
+        self.by_name: dict[str, list[int]] = {}
+        # (host, port) -> numbers of the cameras with that address, lowest first
+        self.by_address: dict[tuple[str, int], list[int]] = {}
+        self.resize(num_cams)
+
+    def __len__(self):
+        return len(self.cameras)
+
+    def __iter__(self):
+        return iter(list(self.cameras))
+
+    def resize(self, num_cams: int):
+        """ Set the number of cameras. New cameras are unconfigured, removed ones forgotten """
+        if not 1 <= num_cams <= MAX_CAMS:
+            raise ValueError(f'number of cameras must be between 1 and {MAX_CAMS}, not {num_cams}')
+        with self.lock:
+            while len(self.cameras) > num_cams:
+                entry = self.cameras.pop()
+                self._unindex(entry)
+            while len(self.cameras) < num_cams:
+                entry = CameraEntry(len(self.cameras) + 1)
+                self.cameras.append(entry)
+                self._index(entry)
+
+    def get(self, cam_num: int) -> CameraEntry | None:
+        if 1 <= cam_num <= len(self.cameras):
+            return self.cameras[cam_num - 1]
+        return None
+
+    def update(self, cam_num: int, name: str | None = None, host: str | None = None, port: int | None = None,
+               profile: CameraProfile | None = None):
+        """ Change the name, host, port and/or profile of camera cam_num
+            :raises IndexError: if there is no such camera
+        """
+        if not 1 <= cam_num <= len(self.cameras):
+            raise IndexError(cam_num)
+        with self.lock:
+            old = self.cameras[cam_num - 1]
+            # entries aren't changed once in the list, so a lookup sees the old or the new one
+            entry = CameraEntry(cam_num,
+                                old.name if name is None else name,
+                                old.host if host is None else host,
+                                old.port if port is None else port,
+                                old.profile if profile is None else profile)
+            self.cameras[cam_num - 1] = entry
+            for index, old_key, key in ((self.by_name, normalize_name(old.name), normalize_name(entry.name)),
+                                        (self.by_address, old.address, entry.address)):
+                if key != old_key:
+                    _add(index, key, cam_num)
+                    _remove(index, old_key, cam_num)
+
+    def number(self, name) -> int | None:
+        """ The number of the (first) camera with this name, ignoring case and surrounding spaces """
+        numbers = self.by_name.get(normalize_name(name))
+        return numbers[0] if numbers else None
+
+    def number_at(self, host: str, port: int) -> int | None:
+        """ The number of the (first) camera with this address """
+        numbers = self.by_address.get((host, port))
+        return numbers[0] if numbers else None
+
+    def duplicates(self) -> list[list[int]]:
+        """ The groups of cameras configured with the same address """
+        return [list(numbers) for (host, _port), numbers in list(self.by_address.items()) if host and len(numbers) > 1]
+
+    def _index(self, entry: CameraEntry):
+        _add(self.by_name, normalize_name(entry.name), entry.number)
+        _add(self.by_address, entry.address, entry.number)
+
+    def _unindex(self, entry: CameraEntry):
+        _remove(self.by_name, normalize_name(entry.name), entry.number)
+        _remove(self.by_address, entry.address, entry.number)
+
+
+def _add(index: dict, key, cam_num: int):
+    numbers = list(index.get(key, ()))
+    bisect.insort(numbers, cam_num)
+    index[key] = numbers
+
+
+def _remove(index: dict, key, cam_num: int):
+    numbers = [n for n in index.get(key, ()) if n != cam_num]
+    if numbers:
+        index[key] = numbers
+    else:
+        index.pop(key, None)
@@ -6,48 +6,478 @@
 # - Companion is running on the local machine - 127.0.0.1
 # - The UDP API is configured on the default port (16759)
 #
+# Host names are resolved through the resolver cache. They are resolved when the hosts are
+# configured (waiting up to RESOLVE_TIMEOUT), a send to a name that still hasn't been
+# resolved fails (and starts its resolution again)
+#
+# Commands are queued, and sent by one sender thread to each Companion host (e.g. a
+# primary and a backup), so the control path never waits for Companion. They are sent
+# either as UDP datagrams (the default), or over a persistent connection to Companion's
+# TCP API (CompanionTCP), which answers each command with +OK or -ERR. The TCP connection
+# is served by its own thread, and commands written together are pipelined.
+#
+import selectors
 import socket
+import threading
 import time
+from collections import deque
+import metrics
+import resolver
+from latency import Histogram
+from win_print import win_print
 
-class Companion:
-    def __init__(self, host='127.0.0.1', port:int=16759):
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.port = port
+RESOLVE_TIMEOUT = 2.0   # seconds to wait for the Companion host names when they are configured
+
+metrics.describe('tbar_updates_total', 'counter', 'T-bar positions reported by the controller')
+metrics.describe('tbar_sends_total', 'counter', 'T-bar values sent to Bitfocus Companion')
+metrics.describe('tbar_coalesced_total', 'counter', 'T-bar values replaced by a later one before being sent')
+metrics.describe('companion_tcp_responses_total', 'counter', 'Responses from the Companion TCP API, by result')
+metrics.describe('companion_tcp_connects_total', 'counter', 'Connections made to the Companion TCP API')
+metrics.describe('companion_coalesced_total', 'counter', 'Companion custom variable updates replaced by a later one before being sent')
+
+
+class TbarStream:
+    """ Streams T-bar positions to Companion: only changed values are sent, at most rate
+        per second, and the latest value is always sent at the end of the interval (the
+        trailing edge), so the last position of a fader throw always reaches Companion.
+        The end points (0 and 100) are sent at once, as reaching 100 completes the transition.
+    """
+    def __init__(self, companion: 'Companion', rate: float = 30):
+        self.companion = companion
+        self.interval = 1.0 / rate if rate else 0.0
+        self.cond = threading.Condition()
+        self.pending = None             # value waiting for the end of the interval
+        self.sent = None                # last value sent
+        self.next_allowed = 0.0         # time.monotonic() of the next send
+        self.send_times = deque()       # time.monotonic() of the sends in the last second
+        self.stats = {'updates': 0, 'sent': 0, 'unchanged': 0, 'coalesced': 0}
+        self.thread = None
+
+    def set_rate(self, rate: float):
+        """ :param rate: maximum values sent per second, 0 for no limit """
+        with self.cond:
+            self.interval = 1.0 / rate if rate else 0.0
+            self.next_allowed = 0.0
+            self.cond.notify()
+
+    def update(self, value: int):
+        """ Report a T-bar position (0 - 100) """
+        self.stats['updates'] += 1
+        metrics.inc('tbar_updates_total')
+        with self.cond:
+            if self.pending is not None:
+                self.stats['coalesced'] += 1
+                metrics.inc('tbar_coalesced_total')
+                self.pending = None
+            if value == self.sent:
+                self.stats['unchanged'] += 1
+                return
+            now = time.monotonic()
+            if now < self.next_allowed and value not in (0, 100):
+                self.pending = value
+                self._start()
+                self.cond.notify()
+                return
+            self._send(value, now)
+
+    def rate(self) -> int:
+        """ Values sent in the last second """
+        with self.cond:
+            self._expire(time.monotonic())
+            return len(self.send_times)
+
+    def _send(self, value, now):
+        """ Send a value, called with the condition held so that values are sent in order """
+        self.companion.send_tbar(value)
+        self.sent = value
+        self.next_allowed = now + self.interval
+        self.send_times.append(now)
+        self._expire(now)
+        self.stats['sent'] += 1
+
+    def _expire(self, now):
+        while self.send_times and self.send_times[0] < now - 1.0:
+            self.send_times.popleft()
+
+    def _start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._trailing_edge, name='T-bar')
+            self.thread.daemon = True
+            self.thread.start()
+
+    def _trailing_edge(self):
+        while True:
+            with self.cond:
+                while self.pending is None or time.monotonic() < self.next_allowed:
+                    self.cond.wait(None if self.pending is None else self.next_allowed - time.monotonic())
+                value = self.pending
+                self.pending = None
+                self._send(value, time.monotonic())
+
+
+class CompanionTCP:
+    """ Persistent connection to Companion's TCP API, with automatic reconnection.
+        Responses come back in the order of the commands, so each one is matched to the
+        oldest command waiting for a response, and the time between writing the command
+        and its response is recorded in a histogram.
+    """
+    MAX_QUEUED = 1000       # commands kept while not connected, the oldest are dropped
+    MAX_AGE = 2.0           # seconds, commands queued longer than this (while not connected) are dropped
+    ACK_TIMEOUT = 5.0       # seconds without a response before the connection is dropped
+    RETRY_MIN = 0.5         # seconds between connection attempts, doubling up to RETRY_MAX
+    RETRY_MAX = 5.0
+
+    def __init__(self, host: str, port: int = 16759):
         self.host = host
+        self.port = port
+        self.lock = threading.Lock()
+        self.queue = deque()            # (command, time.monotonic() queued) waiting to be written
+        self.in_flight = deque()        # (command, time.perf_counter_ns() written) waiting for a response
+        self.histogram = Histogram()    # command written -> response, microseconds
+        self.stats = {'sent': 0, 'ok': 0, 'errors': 0, 'dropped': 0, 'unanswered': 0, 'connects': 0}
+        self.connected = False
+        self.running = True
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._wakeup_w.setblocking(False)
+        self.thread = threading.Thread(target=self._run, name=f'Companion TCP {host}')
+        self.thread.daemon = True
+        self.thread.start()
 
-    def startup(self, host=None):
-        # Set a custom variable at startup to trigger load of camera names etc
-        value = time.time()
-        buffer = f'CUSTOM-VARIABLE VISCAControllerRestart SET-VALUE {value}'
-        if host is None:
-            host = self.host
-        address = (host, self.port)
+    def send(self, command: str):
+        """ Queue a command, never blocks """
+        with self.lock:
+            if len(self.queue) >= self.MAX_QUEUED:
+                self.queue.popleft()
+                self.stats['dropped'] += 1
+            self.queue.append((command.encode('utf-8') + b'\n', time.monotonic()))
+        self._wakeup()
+
+    def _wakeup(self):
         try:
-            self.socket.sendto(buffer.encode('utf-8'), address)
+            self._wakeup_w.send(b'\0')
         except OSError:
-            print("companion send failed")
+            pass    # already pending
 
-    def pushbutton(self,  page:int, row:int, column:int, host=None):
-        buffer = f"LOCATION {page}/{row}/{column} PRESS"
-        if host is None:
-            host = self.host
-        address = (host, self.port)
+    def _run(self):
+        retry = self.RETRY_MIN
+        while self.running:
+            address = resolver.shared.resolve(self.host, timeout=2.0)
+            try:
+                if address is None:
+                    raise socket.gaierror(socket.EAI_AGAIN, f'{self.host} not resolved')
+                sock = socket.create_connection((address, self.port), timeout=2.0)
+            except OSError:
+                self._sleep(retry)
+                retry = min(retry * 2, self.RETRY_MAX)
+                continue
+            retry = self.RETRY_MIN
+            self.connected = True
+            self.stats['connects'] += 1
+            metrics.inc('companion_tcp_connects_total')
+            win_print(f'Companion: connected to {self.host}:{self.port}')
+            try:
+                self._serve(sock)
+            except OSError as exc:
+                win_print(f'Companion: connection to {self.host}:{self.port} lost: {exc}')
+            finally:
+                self.connected = False
+                sock.close()
+                with self.lock:
+                    # a command may or may not have been carried out, they aren't sent again
+                    self.stats['unanswered'] += len(self.in_flight)
+                    self.in_flight.clear()
+
+    def _sleep(self, seconds: float):
+        """ Wait before reconnecting, returning early on close """
+        with selectors.DefaultSelector() as sel:
+            sel.register(self._wakeup_r, selectors.EVENT_READ)
+            end = time.monotonic() + seconds
+            while self.running and time.monotonic() < end:
+                if sel.select(end - time.monotonic()):
+                    self._drain_wakeup()
+
+    def _drain_wakeup(self):
         try:
-            self.socket.sendto(buffer.encode('utf-8'), address)
+            while self._wakeup_r.recv(512):
+                pass
         except OSError:
-            print("companion send failed")
-
-    def t_bar(self, value, host=None):
-        """ Set a value for a t-bar custom variable """
-        buffer = f'CUSTOM-VARIABLE tbar_value SET-VALUE {value}'
-        if host is None:
-            host = self.host
-        address = (host, self.port)
+            pass
+
+    def _serve(self, sock: socket.socket):
+        sock.settimeout(self.ACK_TIMEOUT)
+        buffer = b''
+        with selectors.DefaultSelector() as sel:
+            sel.register(sock, selectors.EVENT_READ, 'sock')
+            sel.register(self._wakeup_r, selectors.EVENT_READ, 'wakeup')
+            while self.running:
+                with self.lock:
+                    queued = list(self.queue)
+                    self.queue.clear()
+                # e.g. a button pressed while Companion was unreachable isn't replayed much later
+                stale = time.monotonic() - self.MAX_AGE
+                commands = [command for command, queued_at in queued if queued_at >= stale]
+                self.stats['dropped'] += len(queued) - len(commands)
+                if commands:
+                    # pipelined: everything queued is written at once, without waiting for responses
+                    sock.sendall(b''.join(commands))
+                    now = time.perf_counter_ns()
+                    with self.lock:
+                        self.in_flight.extend((command, now) for command in commands)
+                    self.stats['sent'] += len(commands)
+                    metrics.inc('companion_sends_total', len(commands), host=self.host)
+
+                for key, _events in sel.select(1.0):
+                    if key.data == 'wakeup':
+                        self._drain_wakeup()
+                        continue
+                    data = sock.recv(4096)
+                    if not data:
+                        raise ConnectionResetError('closed by Companion')
+                    buffer += data
+                    *lines, buffer = buffer.split(b'\n')
+                    for line in lines:
+                        self._response(line.strip())
+
+                with self.lock:
+                    oldest = self.in_flight[0][1] if self.in_flight else None
+                if oldest is not None and time.perf_counter_ns() - oldest > self.ACK_TIMEOUT * 1e9:
+                    raise TimeoutError('no response')
+
+    def _response(self, line: bytes):
+        if not line:
+            return
+        with self.lock:
+            if not self.in_flight:
+                return      # not an answer to a command
+            command, written = self.in_flight.popleft()
+        self.histogram.record((time.perf_counter_ns() - written) // 1000)
+        if line.startswith(b'+OK'):
+            self.stats['ok'] += 1
+            metrics.inc('companion_tcp_responses_total', result='ok')
+        else:
+            self.stats['errors'] += 1
+            metrics.inc('companion_tcp_responses_total', result='error')
+            win_print(f"Companion: {command.decode('utf-8').strip()}: {line.decode('utf-8', 'replace')}")
+
+    def ack_latency(self) -> dict:
+        """ Command to response latency percentiles, microseconds """
+        h = self.histogram
+        return {(('host', self.host), ('quantile', q)): h.percentile(p)
+                for q, p in (('0.5', 50), ('0.9', 90), ('0.99', 99))} if h.count else {}
+
+    def close(self):
+        self.running = False
+        self._wakeup()
+        self.thread.join()
+        self._wakeup_r.close()
+        self._wakeup_w.close()
+
+
+class Companion:
+    """ Sends commands to one or more Companion instances (e.g. a primary and a backup).
+        Commands are queued and sent by a single sender thread, so callers (the main loop,
+        the T-bar stream) never wait for a send. Button presses are sent in order; an update
+        of a custom variable replaces an update of the same variable that hasn't been sent yet
+        (unless a press has been queued since, so the order of updates and presses is kept).
+    """
+    def __init__(self, host='127.0.0.1', port:int=16759, tbar_rate: float = 30, tcp: bool = False,
+                 backup_host: str = ''):
+        """ :param tcp: use Companion's TCP API instead of UDP
+            :param backup_host: a second Companion, which is sent every command too
+        """
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.port = port
+        # (primary host, all the hosts, use TCP), replaced as a whole by reconfigure() and
+        # read once per command, so a command goes to the old targets or the new ones
+        self.targets = _targets(host, backup_host, tcp)
+        self.connections: dict[str, CompanionTCP] = {}
+        self.lock = threading.Lock()
+        self.failing: set[str] = set()     # hosts whose last UDP send failed
+        self.host_stats: dict[str, dict] = {}
+        self.cond = threading.Condition()
+        self.outbox = deque()               # [command, hosts, variable or None, tcp], in order
+        self.variables: dict[tuple, list] = {}  # (variable, hosts) -> its outbox entry, while queued
+        self.coalesced = 0
+        self.running = True
+        self.tbar = TbarStream(self, tbar_rate)
+        self._connect(self.targets)
+        self.thread = threading.Thread(target=self._sender, name='Companion')
+        self.thread.daemon = True
+        self.thread.start()
+        metrics.register('tbar_send_rate', self.tbar.rate, text='T-bar values sent to Companion in the last second')
+        metrics.register('companion_tcp_ack_latency_us', self.ack_latency,
+                         text='Companion TCP API command to response latency')
+        metrics.register('companion_outbox_length', lambda: len(self.outbox),
+                         text='Commands waiting to be sent to Companion')
+
+    def _connect(self, targets):
+        _host, hosts, tcp = targets
+        resolver.shared.prefetch(hosts)
+        # configuration time: wait (a bounded time) for the names, so that the first
+        # commands don't fail because a name hasn't been resolved yet
+        deadline = time.monotonic() + RESOLVE_TIMEOUT
+        for h in hosts:
+            resolver.shared.resolve(h, timeout=max(0.0, deadline - time.monotonic()))
+        for h in hosts:
+            self._stats(h)
+            if tcp and h not in self.connections:
+                with self.lock:
+                    self.connections[h] = CompanionTCP(h, self.port)
+
+    def reconfigure(self, host: str, backup_host: str = '', tcp: bool = False, tbar_rate: float | None = None):
+        """ Change the Companion hosts and protocol. Commands already queued go to the hosts
+            they were queued for; connections no longer needed are closed
+        """
+        targets = _targets(host, backup_host, tcp)
+        if tbar_rate is not None:
+            self.tbar.set_rate(tbar_rate)
+        if targets == self.targets:
+            return
+        self._connect(targets)
+        self.targets = targets
+        with self.lock:
+            unused = [h for h in self.connections if not (tcp and h in targets[1])]
+            closing = [self.connections.pop(h) for h in unused]
+        for connection in closing:
+            connection.close()
+
+    def _address(self, host):
+        address = resolver.shared.lookup(host)
+        if address is None:
+            raise socket.gaierror(socket.EAI_AGAIN, f'{host} not resolved')
+        return address, self.port
+
+    def _stats(self, host: str) -> dict:
+        stats = self.host_stats.get(host)
+        if stats is None:
+            stats = self.host_stats.setdefault(host, {'sent': 0, 'failed': 0})
+        return stats
+
+    def _queue(self, command: str, host=None, variable: str | None = None):
+        """ Queue a command for host, or for all the hosts if host is None or the primary host
+            :param variable: the custom variable the command sets, for coalescing
+        """
+        primary, hosts, tcp = self.targets
+        if host is not None and host != primary:
+            hosts = (host,)
+        with self.cond:
+            if variable is not None:
+                entry = self.variables.get((variable, hosts))
+                if entry is not None:
+                    # still queued: send the new value in its place
+                    entry[0] = command
+                    entry[3] = tcp
+                    self.coalesced += 1
+                    metrics.inc('companion_coalesced_total')
+                    return
+                entry = [command, hosts, variable, tcp]
+                self.variables[(variable, hosts)] = entry
+            else:
+                entry = [command, hosts, None, tcp]
+                # later variable updates must not overtake the press, so they aren't coalesced
+                # with those queued before it
+                self.variables.clear()
+            self.outbox.append(entry)
+            self.cond.notify()
+
+    def _sender(self):
+        while True:
+            with self.cond:
+                while self.running and not self.outbox:
+                    self.cond.wait()
+                if not self.outbox:
+                    return
+                entry = self.outbox.popleft()
+                command, hosts, variable, tcp = entry
+                if variable is not None and self.variables.get((variable, hosts)) is entry:
+                    del self.variables[(variable, hosts)]
+            for host in hosts:
+                self._send(command, host, tcp)
+            if variable == 'tbar_value':
+                metrics.inc('tbar_sends_total')
+
+    def _send(self, buffer: str, host: str, tcp: bool = False) -> bool:
+        stats = self._stats(host)
+        if tcp:
+            connection = self.connections.get(host)
+            if connection is None:
+                with self.lock:
+                    connection = self.connections.get(host)
+                    if connection is None:
+                        connection = self.connections[host] = CompanionTCP(host, self.port)
+            connection.send(buffer)
+            stats['sent'] += 1
+            return True
         try:
+            address = self._address(host)
             self.socket.sendto(buffer.encode('utf-8'), address)
-        except OSError:
-            print("companion send failed")
+            metrics.inc('companion_sends_total', host=host)
+            stats['sent'] += 1
+            self.failing.discard(host)
+            return True
+        except OSError as exc:
+            metrics.inc('companion_send_failures_total', host=host)
+            stats['failed'] += 1
+            if host not in self.failing:
+                # reported once, not for every T-bar value
+                self.failing.add(host)
+                win_print(f"Companion {host} send failed: {exc}")
+            return False
+
+    def startup(self, host=None):
+        # Set a custom variable at startup to trigger load of camera names etc
+        value = time.time()
+        self._queue(f'CUSTOM-VARIABLE VISCAControllerRestart SET-VALUE {value}', host, 'VISCAControllerRestart')
+
+    def pushbutton(self,  page:int, row:int, column:int, host=None):
+        self._queue(f"LOCATION {page}/{row}/{column} PRESS", host)
+
+    def t_bar(self, value):
+        """ Set the t-bar custom variable, rate limited (see TbarStream) """
+        self.tbar.update(value)
+
+    def send_tbar(self, value, host=None):
+        """ Set a value for a t-bar custom variable, without rate limiting """
+        self._queue(f'CUSTOM-VARIABLE tbar_value SET-VALUE {value}', host, 'tbar_value')
+
+    def ack_latency(self) -> dict:
+        result = {}
+        for connection in list(self.connections.values()):
+            result.update(connection.ack_latency())
+        return result
+
+    def stats(self) -> dict:
+        """ Delivery statistics per host """
+        result = {}
+        for host, stats in list(self.host_stats.items()):
+            result[host] = dict(stats)
+            connection = self.connections.get(host)
+            if connection is not None:
+                result[host].update(connection.stats, connected=connection.connected)
+                h = connection.histogram
+                if h.count:
+                    result[host].update(ack_p50_us=h.percentile(50), ack_p99_us=h.percentile(99))
+        return result
 
+    def summary(self) -> str:
+        """ Human readable delivery statistics """
+        lines = [f'{len(self.outbox)} queued, {self.coalesced} variable updates coalesced']
+        for host, stats in self.stats().items():
+            lines.append(f'{host}: ' + ', '.join(f'{k} {v}' for k, v in stats.items()))
+        return '\n'.join(lines)
 
+    def close(self):
+        """ Send what is queued, then stop """
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+        self.thread.join()
+        for connection in list(self.connections.values()):
+            connection.close()
+        self.connections = {}
 
 
+def _targets(host: str, backup_host: str, tcp: bool) -> tuple:
+    hosts = (host,) + ((backup_host,) if backup_host and backup_host != host else ())
+    return host, hosts, tcp
@@ -2,22 +2,80 @@
 # Configuration Functions for VISCA Joystick
 #
 import gc
+from typing import NamedTuple
 import PySimpleGUI as Sg
+from camera_registry import CameraRegistry, MAX_CAMS, normalize_name
+from camera_profiles import CameraProfile, COMMANDS, DEFAULT as DEFAULT_PROFILE, default_profile
+import settings_store
+
+# All the settings are read at startup, and written together when the configuration is saved
+settings = settings_store.shared
 
 g_Debug = False
+g_Trace = False
 
 g_Progname = "VISCA Game Controller"
 g_ProgVers = "1.0beta7"
 
 g_num_cams = 8
-cam_ips = ['127.0.0.1']*g_num_cams
-cam_ports = [52381]*g_num_cams
 
-# Phil Rose: user-friendly camera names for display consistency.
-cam_names = [f'Camera {x+1}' for x in range(g_num_cams)]
+# The configured cameras, indexed by number, name and address
+cameras = CameraRegistry(g_num_cams)
+
+# Camera selection buttons: a short press selects camera <button> of the current bank of
+# g_bank_size cameras, a long press the same camera in the next bank. The current bank
+# (1 ...) can be changed with OSC /setbank
+g_bank_size = 4
+current_bank = 1
+
+
+def normalize_cam_name(name) -> str:
+    return normalize_name(name)
+
+
+def set_cam_name(cam_num: int, name: str):
+    """ Set the name of camera cam_num (1 to g_num_cams), called from the OSC thread and the GUI """
+    cameras.update(cam_num, name=name)
+
+
+def cam_number(name) -> int | None:
+    """ The number of the (first) camera with this name, ignoring case and surrounding spaces """
+    return cameras.number(name)
+
+
+def set_num_cams(num_cams: int):
+    global g_num_cams
+    cameras.resize(num_cams)
+    g_num_cams = num_cams
+
+
+def bank_camera(button: int, long_press: bool = False) -> int:
+    """ The camera number selected by a camera button """
+    bank = current_bank + (1 if long_press else 0)
+    return (bank - 1) * g_bank_size + button
+
 
 g_visca_relay_port = 10000  # currently hardwired
 
+# VISCA relay traffic shaping, and maximum drive commands per second per camera (0 == no limit)
+g_relay_shaping = True
+g_relay_rate_limit = 0
+
+# Local metrics endpoint (Prometheus text format), 0 == disabled
+g_metrics_port = 0
+
+# OSC state feedback subscribers, "host:port, host:port ..."
+g_osc_feedback = ''
+
+# Maximum T-bar values sent to Companion per second (0 == no limit)
+g_tbar_rate = 30
+
+# Second Companion instance, sent every command too ('' == none)
+g_companion_backup_host = ''
+
+# Send to Companion over its TCP API (persistent connection, responses checked) instead of UDP
+g_companion_tcp = False
+
 # ------------------------------------------------------------------
 # Phil Rose (2026-06-24)
 # Tune Xbox joystick sensitivity for smoother PTZ control.
@@ -42,12 +100,9 @@ g_tilt_speeds = "1,1,3,5,7,9"
 g_zoom_speeds = "1,1,1,3,5,7"
 g_focus_speeds = "2,5,7"
 
-sensitivity_tables = {
-    'pan': {'joy': [0, 0.15, 0.2, 0.3, 0.5, 0.8, 0.9, 1], 'cam': [0, 0, 1, 2, 6,  8, 12, 18]},
-    'tilt': {'joy': [0, 0.15, 0.2, 0.3, 0.5, 0.8, 0.9, 1], 'cam': [0, 0, 1, 3, 6, 8, 12, 18]},
-    'zoom': {'joy': [0, 0.15, 0.2, 0.3, 0.4, 0.5, 0.7, 1], 'cam': [0, 0, 1, 1, 1, 3, 5, 7]},
-    'focus': {'joy': [0, 0.2, 0.3, 0.7, 1], 'cam':[0, 0, 2, 5, 7]},
-}
+# Camera speed profiles by name (see camera_profiles), replaced as a whole when changed.
+# The speed curves of the Default profile are the g_*_speeds above
+profiles: dict[str, CameraProfile] = {DEFAULT_PROFILE: default_profile}
 
 g_long_press_time = 0
 g_invert_tilt = False
@@ -59,69 +114,104 @@ g_dead_zone = 0.0
 g_companion_page = 0
 g_companion_host = "127.0.0.1"
 
-# ------------------------------------------------------------------
-# Phil Rose (2026-06-24)
-# Parse, validate, and apply comma-separated speed response lists.
-# ------------------------------------------------------------------
-def parse_speed_list(text, expected_count, max_value, label):
+def set_profiles(new_profiles: dict[str, CameraProfile]):
+    """ Replace the speed profiles, and give each camera the new version of its profile
+        (the Default profile if its profile has been removed)
+    """
+    global profiles, g_pan_speeds, g_tilt_speeds, g_zoom_speeds, g_focus_speeds
+    default = new_profiles[DEFAULT_PROFILE]
+    profiles = new_profiles
+    g_pan_speeds = default.speeds['pan']
+    g_tilt_speeds = default.speeds['tilt']
+    g_zoom_speeds = default.speeds['zoom']
+    g_focus_speeds = default.speeds['focus']
+    for entry in cameras:
+        cameras.update(entry.number, profile=profiles.get(entry.profile.name, default))
+
+
+def load_profiles():
+    """ Load the saved speed profiles. The Default profile's speed curves are kept in the
+        settings that held the only curves before there were profiles
+    """
+    loaded = {}
+    for name, values in settings.get('-camera-profiles-', {}).items():
+        try:
+            loaded[name] = CameraProfile.from_dict(name, values)
+        except ValueError as exc:
+            Sg.popup(f'Speed profile {name} ignored: {exc}', title='Invalid Speed Profile', keep_on_top=True)
+    default = loaded.get(DEFAULT_PROFILE, default_profile)
+    speeds = {'pan': settings.get('-pan_speeds-', g_pan_speeds),
+              'tilt': settings.get('-tilt_speeds-', g_tilt_speeds),
+              'zoom': settings.get('-zoom_speeds-', g_zoom_speeds),
+              'focus': settings.get('-focus_speeds-', g_focus_speeds)}
     try:
-        values = [int(x.strip()) for x in text.split(',')]
-    except ValueError:
-        raise ValueError(f"{label} must contain only comma-separated whole numbers.")
-
-    if len(values) != expected_count:
-        raise ValueError(
-            f"{label} must contain exactly {expected_count} comma-separated values.\n"
-            f"Example: {'1,1,3,5,7,9' if expected_count == 6 else '2,5,7'}"
-        )
-
-    for value in values:
-        if value < 0 or value > max_value:
-            raise ValueError(f"{label} values must be between 0 and {max_value}.")
-
-    return values
-
-
-# ------------------------------------------------------------------
-# Phil Rose (2026-06-24)
-#
-# The user edits only the camera speed values.
-# The joystick breakpoints and leading zero values remain fixed.
-#
-# Example:
-#   User enters: 1,1,3,5,7,9
-#
-# Resulting table:
-#   [0, 0, 1, 1, 3, 5, 7, 9]
-# ------------------------------------------------------------------
-
-def rebuild_sensitivity_tables():
-    global sensitivity_tables
-
-    pan = parse_speed_list(g_pan_speeds, 6, 24, "Pan Speeds")
-    tilt = parse_speed_list(g_tilt_speeds, 6, 24, "Tilt Speeds")
-    zoom = parse_speed_list(g_zoom_speeds, 6, 7, "Zoom Speeds")
-    focus = parse_speed_list(g_focus_speeds, 3, 7, "Focus Speeds")
-
-    sensitivity_tables = {
-        'pan':   {'joy': [0, 0.15, 0.2, 0.3, 0.5, 0.8, 0.9, 1], 'cam': [0, 0] + pan},
-        'tilt':  {'joy': [0, 0.15, 0.2, 0.3, 0.5, 0.8, 0.9, 1], 'cam': [0, 0] + tilt},
-        'zoom':  {'joy': [0, 0.15, 0.2, 0.3, 0.4, 0.5, 0.7, 1], 'cam': [0, 0] + zoom},
-        'focus': {'joy': [0, 0.2, 0.3, 0.7, 1], 'cam': [0, 0] + focus},
-    }
+        loaded[DEFAULT_PROFILE] = CameraProfile.from_dict(DEFAULT_PROFILE, dict(default.to_dict(), speeds=speeds))
+    except ValueError as exc:
+        Sg.popup(f'Default speeds ignored: {exc}', title='Invalid Speed Profile', keep_on_top=True)
+        loaded[DEFAULT_PROFILE] = default
+    set_profiles(loaded)
+
+
+def cam_profile(cam_num: int) -> CameraProfile:
+    """ The speed profile of camera cam_num """
+    entry = cameras.get(cam_num)
+    return entry.profile if entry is not None else profiles[DEFAULT_PROFILE]
+
+
+class ConfigSnapshot(NamedTuple):
+    """ The settings used while the program runs, as they were when last loaded or saved """
+    generation: int
+    long_press_time: float
+    dead_zone: float | None
+    invert_tilt: bool
+    swap_pan: bool
+    debug: bool
+    trace: bool
+    metrics_port: int
+    companion_page: int
+    companion_host: str
+    companion_backup_host: str
+    companion_tcp: bool
+    tbar_rate: float
+    osc_feedback: str
+    relay_shaping: bool
+    relay_rate_limit: float
+    num_cams: int
+    bank_size: int
+
+
+# Configuration changes are published by replacing the snapshot, never by changing it, so a
+# reader that takes config.snapshot once for an event sees all of a change or none of it.
+# The generation increases with each change, for readers to tell that they are out of date.
+snapshot: ConfigSnapshot | None = None
+
+
+def publish_snapshot():
+    """ Publish the current settings as a new snapshot """
+    global snapshot
+    snapshot = ConfigSnapshot(generation=snapshot.generation + 1 if snapshot is not None else 1,
+                              long_press_time=g_long_press_time, dead_zone=g_dead_zone,
+                              invert_tilt=g_invert_tilt, swap_pan=g_swap_pan,
+                              debug=g_Debug, trace=g_Trace, metrics_port=g_metrics_port,
+                              companion_page=g_companion_page, companion_host=g_companion_host,
+                              companion_backup_host=g_companion_backup_host, companion_tcp=g_companion_tcp,
+                              tbar_rate=g_tbar_rate, osc_feedback=g_osc_feedback,
+                              relay_shaping=g_relay_shaping, relay_rate_limit=g_relay_rate_limit,
+                              num_cams=g_num_cams, bank_size=g_bank_size)
 
 
 def configure():
     """ Configuration dialog """
     global g_long_press_time, g_Debug, g_companion_page, g_companion_host, g_swap_pan, g_invert_tilt
-    global g_dead_zone
+    global g_dead_zone, g_metrics_port, g_Trace
+    global g_relay_shaping, g_relay_rate_limit, g_osc_feedback, g_tbar_rate, g_companion_tcp
+    global g_companion_backup_host, g_bank_size
 # ------------------------------------------------------------------
 # Phil Rose (2026-06-24)
 #
 # Added globals to support changes
 # ------------------------------------------------------------------
     global g_swap_pan, g_invert_tilt
-    global g_pan_speeds, g_tilt_speeds, g_zoom_speeds, g_focus_speeds
 
 
 # ------------------------------------------------------------------
@@ -132,47 +222,34 @@ def configure():
 # - Companion integration help
 # ------------------------------------------------------------------
 
+    default = profiles[DEFAULT_PROFILE]
+    camera_rows = [[Sg.Text(f'{entry.number}', size=(3, 1)),
+                    Sg.Input(default_text=entry.name, key=f'NAME{entry.number}', size=15),
+                    Sg.Input(default_text=entry.host, key=f'CAM{entry.number}', size=20),
+                    Sg.Input(default_text=str(entry.port), key=f'PORT{entry.number}', size=8),
+                    Sg.Combo(list(profiles), default_value=entry.profile.name, key=f'PROFILE{entry.number}',
+                             readonly=True, size=15)]
+                   for entry in cameras]
+    if len(camera_rows) > 8:
+        camera_rows = [[Sg.Column(camera_rows, scrollable=True, vertical_scroll_only=True, size=(None, 240))]]
+
     layout = [
-        [Sg.Text('Cameras', font=('Any', 10, 'bold'))],
-        [Sg.Text("Name", size=(15, 1)),
+        [Sg.Text('Cameras', font=('Any', 10, 'bold')),
+        Sg.Text('Number of cameras'),
+        Sg.Input(default_text=str(g_num_cams), key='-NUM-CAMS-', size=4,
+                 tooltip=f'1 - {MAX_CAMS}, reopen Configure after saving to set up added cameras'),
+        Sg.Text('Bank size'),
+        Sg.Input(default_text=str(g_bank_size), key='-BANK-SIZE-', size=4,
+                 tooltip='Cameras per bank of camera select buttons, a long press selects from the next bank')],
+        [Sg.Text("", size=(3, 1)),
+        Sg.Text("Name", size=(15, 1)),
         Sg.Text("IP Address", size=(20, 1)),
-        Sg.Text("Port", size=(8, 1))],
-
-        [Sg.Input(default_text=cam_names[0], key='NAME1', size=15),
-        Sg.Input(default_text=cam_ips[0], key='CAM1', size=20),
-        Sg.Input(default_text=str(cam_ports[0]), key='PORT1', size=8)],
-
-        [Sg.Input(default_text=cam_names[1], key='NAME2', size=15),
-        Sg.Input(default_text=cam_ips[1], key='CAM2', size=20),
-        Sg.Input(default_text=str(cam_ports[1]), key='PORT2', size=8)],
-
-        [Sg.Input(default_text=cam_names[2], key='NAME3', size=15),
-        Sg.Input(default_text=cam_ips[2], key='CAM3', size=20),
-        Sg.Input(default_text=str(cam_ports[2]), key='PORT3', size=8)],
-
-        [Sg.Input(default_text=cam_names[3], key='NAME4', size=15),
-        Sg.Input(default_text=cam_ips[3], key='CAM4', size=20),
-        Sg.Input(default_text=str(cam_ports[3]), key='PORT4', size=8)],
-
-        [Sg.Input(default_text=cam_names[4], key='NAME5', size=15),
-        Sg.Input(default_text=cam_ips[4], key='CAM5', size=20),
-        Sg.Input(default_text=str(cam_ports[4]), key='PORT5', size=8)],
-
-        [Sg.Input(default_text=cam_names[5], key='NAME6', size=15),
-        Sg.Input(default_text=cam_ips[5], key='CAM6', size=20),
-        Sg.Input(default_text=str(cam_ports[5]), key='PORT6', size=8)],
-
-        [Sg.Input(default_text=cam_names[6], key='NAME7', size=15),
-        Sg.Input(default_text=cam_ips[6], key='CAM7', size=20),
-        Sg.Input(default_text=str(cam_ports[6]), key='PORT7', size=8)],
-
-        [Sg.Input(default_text=cam_names[7], key='NAME8', size=15),
-        Sg.Input(default_text=cam_ips[7], key='CAM8', size=20),
-        Sg.Input(default_text=str(cam_ports[7]), key='PORT8', size=8)],
+        Sg.Text("Port", size=(8, 1)),
+        Sg.Text("Speed Profile", size=(15, 1))],
+    ] + camera_rows + [
 
         [Sg.HorizontalSeparator()],
         [Sg.Text('Controller', font=('Any', 10, 'bold'))],
-        [Sg.Text('(Changes take effect after restart)', font=('Any', 10, 'italic'))],
         [Sg.Text('Long Press'),
         Sg.Input(default_text=str(g_long_press_time), key='-LONG-PRESS-', size=4),
         Sg.Text('seconds')],
@@ -182,14 +259,24 @@ def configure():
 
         [Sg.Checkbox('Invert Tilt', default=g_invert_tilt, key='-INVERT-TILT-'),
         Sg.Checkbox('Swap Pan', default=g_swap_pan, key='-SWAP-PAN-'),
-        Sg.Checkbox('Debug Mode', default=g_Debug, key='-DEBUG-')],
+        Sg.Checkbox('Debug Mode', default=g_Debug, key='-DEBUG-'),
+        Sg.Checkbox('Trace Mode', default=g_Trace, key='-TRACE-',
+                    tooltip='Record a timeline of control events, exportable for Perfetto/chrome://tracing')],
+
+        [Sg.Text('Metrics port'),
+        Sg.Input(default_text=str(g_metrics_port), key='-METRICS-PORT-', size=6),
+        Sg.Text('(0 = off) serves http://host:port/metrics')],
 
         # ------------------------------------------------------------------
         # Phil Rose (2026-06-24)
         # User-configurable response curves.
         # ------------------------------------------------------------------
         [Sg.HorizontalSeparator()],
-        [Sg.Text('Speed Profiles', font=('Any', 10, 'bold'))],
+        [Sg.Text('Speed Profiles', font=('Any', 10, 'bold')),
+        Sg.Combo(list(profiles), default_value=DEFAULT_PROFILE, key='-PROFILE-', enable_events=True,
+                 readonly=True, size=20),
+        Sg.Button('New Profile', tooltip='A new profile, starting from the one shown'),
+        Sg.Button('Delete Profile')],
         [Sg.Text('Comma-separated values. Higher numbers = faster movement.')],
          
         [Sg.Text('Pan Speeds', size=18),
@@ -208,13 +295,44 @@ def configure():
         Sg.Input(default_text=g_focus_speeds, key='-FOCUS-SPEEDS-', size=20),
         Sg.Text('e.g. 2,5,7')],
 
+        [Sg.Text('Maximum Speeds', size=18)] +
+        [element for kind in ('pan', 'tilt', 'zoom', 'focus')
+         for element in (Sg.Text(kind.capitalize()),
+                         Sg.Input(default_text=str(default.max_speeds[kind]), key=f'-MAX-{kind.upper()}-', size=3))],
+
+        [Sg.Checkbox('Reversed Pan', default=default.reverse_pan, key='-REVERSE-PAN-',
+                     tooltip='The camera pans the other way, e.g. when ceiling mounted'),
+        Sg.Checkbox('Reversed Tilt', default=default.reverse_tilt, key='-REVERSE-TILT-')],
+
+        [Sg.Text('Supports', size=18)] +
+        [Sg.Checkbox(command.replace('_', ' ').capitalize(), default=default.supports(command),
+                     key=f'-SUPPORTS-{command}-') for command in COMMANDS],
+
         [Sg.HorizontalSeparator()],
         [Sg.Text('Companion', font=('Any', 10, 'bold'))],
-        [Sg.Text('(Changes take effect after restart)', font=('Any', 10, 'italic'))],
         [Sg.Text('Bitfocus Companion Page '),
         Sg.Input(default_text=str(g_companion_page), key='-COMPANION-PAGE-', size=4),
         Sg.Text('Bitfocus Companion Host '),
-        Sg.Input(default_text=g_companion_host, key='-COMPANION-HOST-', size=15)],
+        Sg.Input(default_text=g_companion_host, key='-COMPANION-HOST-', size=15),
+        Sg.Checkbox('TCP', default=g_companion_tcp, key='-COMPANION-TCP-',
+                    tooltip="Use Companion's TCP API: one connection, commands acknowledged")],
+        [Sg.Text('Backup Companion Host '),
+        Sg.Input(default_text=g_companion_backup_host, key='-COMPANION-BACKUP-HOST-', size=15,
+                 tooltip='A second Companion which is sent the same commands (empty for none)')],
+        [Sg.Text('OSC feedback to '),
+        Sg.Input(default_text=g_osc_feedback, key='-OSC-FEEDBACK-', size=30,
+                 tooltip='host:port list; state changes (camera, gamepad, presets) are sent as OSC bundles')],
+        [Sg.Text('T-bar updates'),
+        Sg.Input(default_text=str(g_tbar_rate), key='-TBAR-RATE-', size=4),
+        Sg.Text('per second (0 = no limit)')],
+
+        [Sg.HorizontalSeparator()],
+        [Sg.Text('VISCA Relay', font=('Any', 10, 'bold'))],
+        [Sg.Checkbox('Traffic shaping', default=g_relay_shaping, key='-RELAY-SHAPING-',
+                     tooltip='Send stop commands first and collapse repeated drive commands'),
+        Sg.Text('Rate limit'),
+        Sg.Input(default_text=str(g_relay_rate_limit), key='-RELAY-RATE-LIMIT-', size=4),
+        Sg.Text('drive commands/s per camera (0 = no limit)')],
 
         [Sg.HorizontalSeparator()],
         [Sg.Button('Relay', tooltip='Fill in values for VISCA Relay'),
@@ -224,32 +342,116 @@ def configure():
 
     window = Sg.Window(title='Configure', layout=layout, finalize=True, keep_on_top=True)
 
+    # the profiles as edited, and the one shown
+    edited = dict(profiles)
+    editing = DEFAULT_PROFILE
+
+    def edited_profile(values) -> CameraProfile:
+        """ The profile shown, as edited
+            :raises ValueError: if a value isn't valid
+        """
+        max_speeds = {}
+        for kind in ('pan', 'tilt', 'zoom', 'focus'):
+            try:
+                max_speeds[kind] = int(values[f'-MAX-{kind.upper()}-'])
+            except ValueError:
+                raise ValueError(f"Maximum {kind} speed must be a whole number.")
+        return CameraProfile(editing,
+                             speeds={'pan': values['-PAN-SPEEDS-'], 'tilt': values['-TILT-SPEEDS-'],
+                                     'zoom': values['-ZOOM-SPEEDS-'], 'focus': values['-FOCUS-SPEEDS-']},
+                             max_speeds=max_speeds,
+                             reverse_pan=values['-REVERSE-PAN-'], reverse_tilt=values['-REVERSE-TILT-'],
+                             commands=[c for c in COMMANDS if values[f'-SUPPORTS-{c}-']])
+
+    def show_profile(profile: CameraProfile, values):
+        names = list(edited)
+        window['-PROFILE-'].update(values=names, value=profile.name)
+        for entry in cameras:
+            name = values[f'PROFILE{entry.number}']
+            window[f'PROFILE{entry.number}'].update(values=names, value=name if name in edited else DEFAULT_PROFILE)
+        for kind in ('pan', 'tilt', 'zoom', 'focus'):
+            window[f'-{kind.upper()}-SPEEDS-'].update(value=profile.speeds[kind])
+            window[f'-MAX-{kind.upper()}-'].update(value=str(profile.max_speeds[kind]))
+        window['-REVERSE-PAN-'].update(value=profile.reverse_pan)
+        window['-REVERSE-TILT-'].update(value=profile.reverse_tilt)
+        for command in COMMANDS:
+            window[f'-SUPPORTS-{command}-'].update(value=profile.supports(command))
+
     while True:
         event, values = window.read()
 
         if event == 'Cancel' or event == Sg.WINDOW_CLOSED:
             break
 
+        elif event in ('-PROFILE-', 'New Profile', 'Save'):
+            # keep the changes to the profile shown
+            try:
+                edited[editing] = edited_profile(values)
+            except ValueError as exc:
+                Sg.popup(str(exc), title="Invalid Speed Settings", keep_on_top=True)
+                window['-PROFILE-'].update(value=editing)
+                continue
+
+        if event == '-PROFILE-':
+            editing = values['-PROFILE-']
+            show_profile(edited[editing], values)
+
+        elif event == 'New Profile':
+            name = Sg.popup_get_text('Name of the new speed profile (e.g. the camera model)',
+                                     title='New Profile', keep_on_top=True)
+            name = (name or '').strip()
+            if not name or name in edited:
+                continue
+            edited[name] = CameraProfile.from_dict(name, edited[editing].to_dict())
+            editing = name
+            show_profile(edited[editing], values)
+
+        elif event == 'Delete Profile':
+            if editing == DEFAULT_PROFILE:
+                Sg.popup("The Default profile can't be deleted", title='Delete Profile', keep_on_top=True)
+                continue
+            # cameras using it get the Default profile
+            del edited[editing]
+            editing = DEFAULT_PROFILE
+            show_profile(edited[editing], values)
+
         elif event == 'Relay':
-            for x in range(g_num_cams):
-                window['CAM'+str(x+1)].update(value='127.0.0.1')
-                window['PORT'+str(x+1)].update(value=str(10000+x+1))
+            for entry in cameras:
+                window[f'CAM{entry.number}'].update(value='127.0.0.1')
+                window[f'PORT{entry.number}'].update(value=str(10000+entry.number))
 
         elif event == 'Save':
+            set_profiles(edited)
             
             # ------------------------------------------------------------------
             # Phil Rose (2026-06-24)
             # Save user-configured camera names.
             # ------------------------------------------------------------------
 
-            for x in range(g_num_cams):
-                cam_names[x] = values['NAME' + str(x+1)] or f'Camera {x+1}'
-                cam_ips[x] = values['CAM' + str(x+1)]
-                cam_ports[x] = int(values['PORT' + str(x+1)])
-
-                Sg.user_settings_set_entry('-NAME' + str(x+1) + '-', cam_names[x])
-                Sg.user_settings_set_entry('-CAM' + str(x+1) + '-', cam_ips[x])
-                Sg.user_settings_set_entry('-PORT' + str(x+1) + '-', cam_ports[x])
+            for entry in cameras:
+                n = entry.number
+                try:
+                    port = int(values[f'PORT{n}'])
+                except ValueError:
+                    port = entry.port
+                cameras.update(n, name=values[f'NAME{n}'] or f'Camera {n}', host=values[f'CAM{n}'].strip(), port=port,
+                               profile=profiles.get(values[f'PROFILE{n}'], profiles[DEFAULT_PROFILE]))
+            for numbers in cameras.duplicates():
+                Sg.popup(f'Cameras {", ".join(map(str, numbers))} have the same address',
+                         title='Duplicate Camera Address', keep_on_top=True)
+            try:
+                num_cams = min(max(int(values['-NUM-CAMS-']), 1), MAX_CAMS)
+            except ValueError:
+                num_cams = g_num_cams
+            try:
+                g_bank_size = max(int(values['-BANK-SIZE-']), 1)
+            except ValueError:
+                pass
+            if num_cams != g_num_cams:
+                # load_cameras() reads the camera settings: set the edited ones first, so that
+                # they aren't replaced by the saved ones
+                save_settings()
+                load_cameras(num_cams)
             # ------------------------
 
             try:
@@ -257,50 +459,39 @@ def configure():
             except ValueError:
                 g_long_press_time = 0.5
             g_Debug = values['-DEBUG-']
+            g_Trace = values['-TRACE-']
             g_invert_tilt = values['-INVERT-TILT-']
             g_swap_pan = values['-SWAP-PAN-']
             try:
                 g_dead_zone = float(values['-DEAD-ZONE-'])
             except ValueError:
                 g_dead_zone = 0.0
-
-            
-            # ------------------------------------------------------------------
-            # Phil Rose (2026-06-24)
-            # Validate, save, and apply user-configurable response curves.
-            # ------------------------------------------------------------------
             try:
-                parse_speed_list(values['-PAN-SPEEDS-'], 6, 24, "Pan Speeds")
-                parse_speed_list(values['-TILT-SPEEDS-'], 6, 24, "Tilt Speeds")
-                parse_speed_list(values['-ZOOM-SPEEDS-'], 6, 7, "Zoom Speeds")
-                parse_speed_list(values['-FOCUS-SPEEDS-'], 3, 7, "Focus Speeds")
-            except ValueError as exc:
-                Sg.popup(str(exc), title="Invalid Speed Settings", keep_on_top=True)
-                continue
-
-            g_pan_speeds = values['-PAN-SPEEDS-']
-            g_tilt_speeds = values['-TILT-SPEEDS-']
-            g_zoom_speeds = values['-ZOOM-SPEEDS-']
-            g_focus_speeds = values['-FOCUS-SPEEDS-']
-
-            Sg.user_settings_set_entry('-pan_speeds-', g_pan_speeds)
-            Sg.user_settings_set_entry('-tilt_speeds-', g_tilt_speeds)
-            Sg.user_settings_set_entry('-zoom_speeds-', g_zoom_speeds)
-            Sg.user_settings_set_entry('-focus_speeds-', g_focus_speeds)
+                g_metrics_port = int(values['-METRICS-PORT-'])
+            except ValueError:
+                g_metrics_port = 0
+            g_relay_shaping = values['-RELAY-SHAPING-']
+            try:
+                g_relay_rate_limit = max(0.0, float(values['-RELAY-RATE-LIMIT-']))
+            except ValueError:
+                g_relay_rate_limit = 0
+            try:
+                g_tbar_rate = max(0.0, float(values['-TBAR-RATE-']))
+            except ValueError:
+                g_tbar_rate = 30
 
-            rebuild_sensitivity_tables()
-             # ------------------------------------------------------------------
-           
+            
             g_companion_page = int(values['-COMPANION-PAGE-'])
             g_companion_host = values['-COMPANION-HOST-']
-            Sg.user_settings_set_entry('-long_press_time-', g_long_press_time)
-            Sg.user_settings_set_entry('-companion_page-', g_companion_page)
-            Sg.user_settings_set_entry('-companion_host-', g_companion_host)
-            Sg.user_settings_set_entry('-invert-tilt-', g_invert_tilt)
-            Sg.user_settings_set_entry('-swap-pan-', g_swap_pan)
-            Sg.user_settings_set_entry('-debug-', g_Debug)
-            Sg.user_settings_set_entry('-dead-zone-', g_dead_zone)
-            Sg.user_settings_set_entry('-configured-', True)
+            g_companion_tcp = values['-COMPANION-TCP-']
+            g_companion_backup_host = values['-COMPANION-BACKUP-HOST-'].strip()
+            g_osc_feedback = values['-OSC-FEEDBACK-'].strip()
+            save_settings()
+            publish_snapshot()
+            try:
+                settings.commit()
+            except OSError as exc:
+                Sg.popup(f'Settings could not be saved: {exc}', title='Settings Not Saved', keep_on_top=True)
             break
 
     window.close()
@@ -310,45 +501,151 @@ def configure():
     gc.collect()
 
 
+def load_cameras(num_cams: int):
+    """ Set the number of cameras, and load their settings """
+    set_num_cams(num_cams)
+    for n in range(1, num_cams + 1):
+        cameras.update(n, name=settings.get(f'-NAME{n}-', f'Camera {n}'),
+                       host=settings.get(f'-CAM{n}-', ''),
+                       port=settings.get(f'-PORT{n}-', 52381),
+                       profile=profiles.get(settings.get(f'-PROFILE{n}-', DEFAULT_PROFILE), profiles[DEFAULT_PROFILE]))
+
+
+def save_settings():
+    """ Set all the settings from the current configuration, for the next settings.commit() """
+    settings.set('-num-cams-', g_num_cams)
+    for entry in cameras:
+        n = entry.number
+        settings.set(f'-NAME{n}-', entry.name)
+        settings.set(f'-CAM{n}-', entry.host)
+        settings.set(f'-PORT{n}-', entry.port)
+        settings.set(f'-PROFILE{n}-', entry.profile.name)
+    settings.set('-bank-size-', g_bank_size)
+    settings.set('-camera-profiles-', {name: profile.to_dict() for name, profile in profiles.items()})
+    settings.set('-pan_speeds-', g_pan_speeds)
+    settings.set('-tilt_speeds-', g_tilt_speeds)
+    settings.set('-zoom_speeds-', g_zoom_speeds)
+    settings.set('-focus_speeds-', g_focus_speeds)
+    settings.set('-long_press_time-', g_long_press_time)
+    settings.set('-companion_page-', g_companion_page)
+    settings.set('-companion_host-', g_companion_host)
+    settings.set('-companion-tcp-', g_companion_tcp)
+    settings.set('-companion-backup-host-', g_companion_backup_host)
+    settings.set('-osc-feedback-', g_osc_feedback)
+    settings.set('-invert-tilt-', g_invert_tilt)
+    settings.set('-swap-pan-', g_swap_pan)
+    settings.set('-debug-', g_Debug)
+    settings.set('-trace-', g_Trace)
+    settings.set('-dead-zone-', g_dead_zone)
+    settings.set('-metrics-port-', g_metrics_port)
+    settings.set('-relay-shaping-', g_relay_shaping)
+    settings.set('-relay-rate-limit-', g_relay_rate_limit)
+    settings.set('-tbar-rate-', g_tbar_rate)
+    settings.set('-configured-', True)
+
+
+def show_settings() -> dict:
+    """ The settings that make up a show file (see show_file) """
+    return {
+        'cameras': [{'number': entry.number, 'name': entry.name, 'host': entry.host, 'port': entry.port,
+                     'profile': entry.profile.name} for entry in cameras],
+        'bank_size': g_bank_size,
+        'profiles': dict(profiles),
+        'controller': {'long_press_time': g_long_press_time, 'dead_zone': g_dead_zone,
+                       'invert_tilt': g_invert_tilt, 'swap_pan': g_swap_pan},
+        'companion': {'page': g_companion_page, 'host': g_companion_host, 'backup_host': g_companion_backup_host,
+                      'tcp': g_companion_tcp, 'tbar_rate': g_tbar_rate},
+        'osc_feedback': g_osc_feedback,
+        'relay': {'shaping': g_relay_shaping, 'rate_limit': g_relay_rate_limit},
+    }
+
+
+def apply_show(show: dict):
+    """ Use the settings of a show file, as returned by show_file.read(), and save them.
+        Settings the show file doesn't have are kept
+    """
+    global g_long_press_time, g_dead_zone, g_invert_tilt, g_swap_pan, g_bank_size
+    global g_companion_page, g_companion_host, g_companion_backup_host, g_companion_tcp, g_tbar_rate
+    global g_osc_feedback, g_relay_shaping, g_relay_rate_limit
+
+    if 'profiles' in show:
+        set_profiles(dict(show['profiles'], **{DEFAULT_PROFILE: show['profiles'].get(DEFAULT_PROFILE,
+                                                                                     profiles[DEFAULT_PROFILE])}))
+    if 'cameras' in show:
+        numbered = {camera['number']: camera for camera in show['cameras']}
+        set_num_cams(max(numbered))
+        for n in range(1, g_num_cams + 1):
+            camera = numbered.get(n)
+            if camera is None:
+                cameras.update(n, name=f'Camera {n}', host='', port=52381, profile=profiles[DEFAULT_PROFILE])
+            else:
+                cameras.update(n, name=camera['name'], host=camera['host'], port=camera['port'],
+                               profile=profiles[camera['profile']])
+    g_bank_size = show.get('bank_size', g_bank_size)
+
+    controller = show.get('controller', {})
+    g_long_press_time = controller.get('long_press_time', g_long_press_time)
+    g_dead_zone = controller.get('dead_zone', g_dead_zone)
+    g_invert_tilt = controller.get('invert_tilt', g_invert_tilt)
+    g_swap_pan = controller.get('swap_pan', g_swap_pan)
+
+    companion = show.get('companion', {})
+    g_companion_page = companion.get('page', g_companion_page)
+    g_companion_host = companion.get('host', g_companion_host)
+    g_companion_backup_host = companion.get('backup_host', g_companion_backup_host)
+    g_companion_tcp = companion.get('tcp', g_companion_tcp)
+    g_tbar_rate = companion.get('tbar_rate', g_tbar_rate)
+    g_osc_feedback = show.get('osc_feedback', g_osc_feedback)
+
+    relay = show.get('relay', {})
+    g_relay_shaping = relay.get('shaping', g_relay_shaping)
+    g_relay_rate_limit = relay.get('rate_limit', g_relay_rate_limit)
+
+    save_settings()
+    publish_snapshot()
+    settings.commit()
+
+
 def load_config():
     """ Load the saved configuration values at startup """
     global g_long_press_time, g_invert_tilt, g_swap_pan, g_companion_page
-    global g_companion_host, g_Debug, g_dead_zone
-# Phil Rose (2026-06024 added globals)
-    global g_pan_speeds, g_tilt_speeds, g_zoom_speeds, g_focus_speeds
+    global g_companion_host, g_Debug, g_dead_zone, g_metrics_port, g_Trace
+    global g_relay_shaping, g_relay_rate_limit, g_osc_feedback, g_tbar_rate, g_companion_tcp
+    global g_companion_backup_host, g_bank_size
 
     # ------------------------------------------------------------------
     # Phil Rose (2026-06-24)
-    # Load user-configured camera names.
+    # Load saved user-configurable response curves.
     # ------------------------------------------------------------------
+    load_profiles()
 
-    for x in range(g_num_cams):
-        cam_names[x] = Sg.user_settings_get_entry('-NAME' + str(x+1) + '-', f'Camera {x+1}')
-        cam_ips[x] = Sg.user_settings_get_entry('-CAM' + str(x+1) + '-', '')
-        port = Sg.user_settings_get_entry('-PORT' + str(x+1) + '-', 52381)
-        cam_ports[x] = port
-
-    g_companion_page = Sg.user_settings_get_entry('-companion_page-', 99)
-    g_companion_host = Sg.user_settings_get_entry('-companion_host-', '127.0.0.1')
-    g_long_press_time = Sg.user_settings_get_entry('-long_press_time-', .5)
-    g_invert_tilt = Sg.user_settings_get_entry('-invert-tilt-', False)
-    g_swap_pan = Sg.user_settings_get_entry('-swap-pan-', False)
-    g_Debug = Sg.user_settings_get_entry('-debug-', False)
-    g_dead_zone = Sg.user_settings_get_entry('-dead-zone-', None)
-    
     # ------------------------------------------------------------------
     # Phil Rose (2026-06-24)
-    # Load saved user-configurable response curves.
+    # Load user-configured camera names.
     # ------------------------------------------------------------------
-    g_pan_speeds = Sg.user_settings_get_entry('-pan_speeds-', g_pan_speeds)
-    g_tilt_speeds = Sg.user_settings_get_entry('-tilt_speeds-', g_tilt_speeds)
-    g_zoom_speeds = Sg.user_settings_get_entry('-zoom_speeds-', g_zoom_speeds)
-    g_focus_speeds = Sg.user_settings_get_entry('-focus_speeds-', g_focus_speeds)
 
-    
-    rebuild_sensitivity_tables()
-
-    if not Sg.user_settings_get_entry('-configured-', False):
+    load_cameras(settings.get('-num-cams-', 8))
+    g_bank_size = settings.get('-bank-size-', 4)
+
+    g_companion_page = settings.get('-companion_page-', 99)
+    g_companion_host = settings.get('-companion_host-', '127.0.0.1')
+    g_companion_tcp = settings.get('-companion-tcp-', False)
+    g_companion_backup_host = settings.get('-companion-backup-host-', '')
+    g_osc_feedback = settings.get('-osc-feedback-', '')
+    g_long_press_time = settings.get('-long_press_time-', .5)
+    g_invert_tilt = settings.get('-invert-tilt-', False)
+    g_swap_pan = settings.get('-swap-pan-', False)
+    g_Debug = settings.get('-debug-', False)
+    g_Trace = settings.get('-trace-', False)
+    g_dead_zone = settings.get('-dead-zone-', None)
+    g_metrics_port = settings.get('-metrics-port-', 0)
+    g_relay_shaping = settings.get('-relay-shaping-', True)
+    g_relay_rate_limit = settings.get('-relay-rate-limit-', 0)
+    g_tbar_rate = settings.get('-tbar-rate-', 30)
+
+    publish_snapshot()
+
+    if not settings.get('-configured-', False):
         configure()
 
 credits_text = """
@@ -389,10 +686,14 @@ class Config:
         try:
             # should we save this in the config?
             # for now, make it temporary change and let config override
-            cam_names[idx-1] = name
+            set_cam_name(idx, name)
         except IndexError:
             pass    # do nothing
 
+    @staticmethod
+    def cam_number(name):
+        return cam_number(name)
+
     @staticmethod
     def companion(row:int, column:int):
         return [g_companion_page, row, column, g_companion_host]
@@ -401,9 +702,17 @@ class Config:
     def companion_host():
         return g_companion_host
 
+    @property
+    def companion_tcp(self):
+        return g_companion_tcp
+
+    @property
+    def companion_backup_host(self):
+        return g_companion_backup_host
+
     @staticmethod
-    def sensitivity(table: str):
-        return sensitivity_tables[table]
+    def cam_profile(cam_num: int) -> CameraProfile:
+        return cam_profile(cam_num)
 
     @property
     def progname(self):
@@ -426,10 +735,10 @@ class Config:
 
     @staticmethod
     def cam_address(idx):
-        try:
-            return cam_ips[idx], cam_ports[idx]
-        except IndexError:
+        entry = cameras.get(idx + 1)
+        if entry is None:
             return None, 0
+        return entry.address
 
     
     # ------------------------------------------------------------------
@@ -438,24 +747,45 @@ class Config:
     # ------------------------------------------------------------------
     @staticmethod
     def cam_name(idx):
-        try:
-            return cam_names[idx-1]
-        except IndexError:
+        entry = cameras.get(idx)
+        if entry is None:
             return f"Camera {idx}"
+        return entry.name
     # ------------------------------------------------------------------
 
     @staticmethod
     def configure():
         configure()
 
+    @property
+    def snapshot(self) -> ConfigSnapshot:
+        return snapshot
+
     @property
     def num_cams(self):
         return g_num_cams
 
+    @staticmethod
+    def bank_camera(button: int, long_press: bool = False) -> int:
+        return bank_camera(button, long_press)
+
+    @property
+    def bank(self):
+        return current_bank
+
+    @staticmethod
+    def set_bank(bank: int):
+        global current_bank
+        current_bank = bank
+
     @property
     def debug(self):
         return g_Debug
 
+    @property
+    def trace(self):
+        return g_Trace
+
     @property
     def dead_zone(self):
         return g_dead_zone
@@ -464,6 +794,26 @@ class Config:
     def visca_relay_port(self):
         return g_visca_relay_port
 
+    @property
+    def relay_shaping(self):
+        return g_relay_shaping
+
+    @property
+    def relay_rate_limit(self):
+        return g_relay_rate_limit
+
+    @property
+    def metrics_port(self):
+        return g_metrics_port
+
+    @property
+    def osc_feedback(self):
+        return g_osc_feedback
+
+    @property
+    def tbar_rate(self):
+        return g_tbar_rate
+
     @property
     def credits_text(self):
         return f"{g_Progname} {g_ProgVers}\n"+credits_text
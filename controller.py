@@ -16,17 +16,23 @@ Windows = platform.system() == 'Windows'
 Linux = platform.system() == 'Linux'
 
 class ControllerList:
-    def __init__(self, callbacks, long_press, dead_zone):
+    def __init__(self, callbacks, long_press, dead_zone, generation=0, open_joystick=pygame.joystick.Joystick):
+        """ :param open_joystick: opens the joystick at a device index: pygame's, or
+            e.g. VirtualJoysticks.open (see virtual_joystick)
+        """
         self.dict: Dict[int, Controller] = {}
+        self.open_joystick = open_joystick
         self.callbacks = callbacks
         self.long_press = long_press
         self.dead_zone = dead_zone
+        # the configuration generation the settings came from
+        self.generation = generation
 
     def __iter__(self):
         return iter(self.dict)
 
     def add(self, index):
-        joy = pygame.joystick.Joystick(index)
+        joy = self.open_joystick(index)
         instance_id = joy.get_instance_id()
         self.remove(instance_id)
         controller = Controller(self.callbacks,
@@ -49,6 +55,14 @@ class ControllerList:
     def lookup(self, instance_id):
         return self.dict.get(instance_id)
 
+    def configure(self, long_press, dead_zone, generation=0):
+        """ Change the settings of the attached controllers, and of those attached later """
+        self.long_press = long_press
+        self.dead_zone = dead_zone
+        self.generation = generation
+        for controller in self.dict.values():
+            controller.configure(long_press, dead_zone)
+
 help_text_controller = """
 
 Pan & Tilt    
@@ -196,6 +210,7 @@ class Controller:
         self.pan_axis = None
         self.tilt_axis = None
         self.dead_zone = dead_zone # override device default
+        self.device_dead_zone = 0
 
         #
         # lists of defined buttons/axes/hats per controller
@@ -241,6 +256,17 @@ class Controller:
     def get_pygame_joystick(self):
         return self.joystick
 
+    def configure(self, long_press_limit, dead_zone):
+        """ Change the long press time and dead zone override, without setting up the controller again """
+        self.long_press_limit = long_press_limit
+        self.dead_zone = dead_zone
+        if dead_zone is None:
+            dead_zone = self.device_dead_zone
+        for axis in self.axes:
+            # the T-bar has no dead zone, see setup_controller()
+            if axis is not None and axis.control_func not in (ControlFunc.TBAR, ControlFunc.NONE):
+                axis.dead_zone = dead_zone
+
     def pygame_event(self, ev:pygame.event.Event):
         handle_pygame_event(self, ev)
 
@@ -398,6 +424,7 @@ def setup_controller(controller: Controller):
     controller.hats = [null_hat] * joystick.get_numhats()
 
     dead_zone = device.value("DEAD_ZONE")
+    controller.device_dead_zone = dead_zone
     if controller.dead_zone is not None:
         dead_zone = controller.dead_zone # configuration override default
     controller.set_help_text(device.value("HELP"))
@@ -15,8 +15,12 @@ def file_path(f : str) -> str:
     return os.path.abspath(os.path.join(os.path.dirname(__file__), f))
 
 def search_path(f : str) -> str:
-    for file in [localappdata_path(f), appdata_path(f), file_path(f)]:
-        if os.access(file, os.R_OK):
+    # the app data folders are only set on Windows
+    folders = [localappdata_path(f) if local_app_data else None,
+               appdata_path(f) if app_data else None,
+               file_path(f)]
+    for file in folders:
+        if file is not None and os.access(file, os.R_OK):
             return file
     return None
 
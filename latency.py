@@ -0,0 +1,173 @@
+#
+# Latency probes for the control path
+#
+# Each probe records the time from the origin of a control event (the moment the pygame
+# thread receives it from SDL) to a given stage of the control path, into a log-linear
+# ("HDR style") histogram per camera and per stage.
+#
+# Probes are gated by the module level 'enabled' flag. Call sites test the flag before
+# taking a timestamp, so the cost when disabled is one attribute lookup and a branch.
+#
+import json
+import threading
+import time
+
+enabled = False
+
+# Camera number that probes are recorded against, set when the current camera changes.
+# Probes made for another camera (e.g. by a camera worker) give its number instead
+camera = 0
+
+# Origin timestamp (ns) of the event currently being handled on the main loop, or None
+origin = None
+
+# Stages, in control path order. All except 'ack' and 'cam_speed' are measured from the origin.
+STAGES = {
+    'write_event': 'pygame event -> write_event_value done',
+    'main_loop': 'pygame event -> main_loop dispatch',
+    'handle_event': 'pygame event -> handle_pygame_event',
+    'cam_speed': 'joy_pos_to_cam_speed duration',
+    'send': 'pygame event -> Camera sendto',
+    'ack': 'Camera sendto -> response received',
+}
+
+now = time.perf_counter_ns
+
+
+class Histogram:
+    """ Log-linear histogram of microsecond values.
+        Values below 16us are counted exactly, above that each power of two is split into
+        16 linear sub-buckets, giving a worst case error of about 6%.
+        Values are recorded from several threads (the main loop, camera workers), so updates
+        and reads hold the histogram's lock.
+    """
+    SUB_BUCKETS = 16
+    MAX_BITS = 40   # ~ 12 days in microseconds
+
+    def __init__(self):
+        self.counts = [0] * (self.SUB_BUCKETS * self.MAX_BITS)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def _index(cls, v: int) -> int:
+        if v < cls.SUB_BUCKETS:
+            return v
+        shift = v.bit_length() - 5
+        return min((shift + 1) * cls.SUB_BUCKETS + (v >> shift) - cls.SUB_BUCKETS,
+                   cls.SUB_BUCKETS * cls.MAX_BITS - 1)
+
+    @classmethod
+    def _value(cls, idx: int) -> int:
+        """ Highest value counted in a bucket """
+        if idx < cls.SUB_BUCKETS:
+            return idx
+        shift = idx // cls.SUB_BUCKETS - 1
+        return (((idx % cls.SUB_BUCKETS) + cls.SUB_BUCKETS + 1) << shift) - 1
+
+    def record(self, us: int):
+        if us < 0:
+            us = 0
+        idx = self._index(us)
+        with self.lock:
+            self.counts[idx] += 1
+            self.count += 1
+            self.total += us
+            if self.min is None or us < self.min:
+                self.min = us
+            if us > self.max:
+                self.max = us
+
+    def percentile(self, p: float) -> int:
+        with self.lock:
+            return self._percentile(p)
+
+    def _percentile(self, p: float) -> int:
+        """ Called with the lock held """
+        if self.count == 0:
+            return 0
+        target = max(1, round(self.count * p / 100))
+        running = 0
+        for idx, n in enumerate(self.counts):
+            running += n
+            if running >= target:
+                return min(self._value(idx), self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            return {
+                'count': self.count,
+                'min_us': self.min or 0,
+                'mean_us': round(self.total / self.count, 1) if self.count else 0,
+                'p50_us': self._percentile(50),
+                'p90_us': self._percentile(90),
+                'p99_us': self._percentile(99),
+                'max_us': self.max,
+                'buckets': {self._value(i): n for i, n in enumerate(self.counts) if n},
+            }
+
+
+_histograms: dict[tuple[int, str], Histogram] = {}
+_lock = threading.Lock()
+
+
+def record(stage: str, elapsed_ns: int, cam: int | None = None):
+    """ Record an elapsed time for a stage
+        :param cam: the camera number, None for the current camera
+    """
+    key = (camera if cam is None else cam, stage)
+    h = _histograms.get(key)
+    if h is None:
+        with _lock:
+            h = _histograms.setdefault(key, Histogram())
+    h.record(elapsed_ns // 1000)
+
+
+def since(stage: str, t0: int, cam: int | None = None):
+    """ Record the time elapsed since t0 """
+    record(stage, now() - t0, cam)
+
+
+def since_origin(stage: str, cam: int | None = None):
+    """ Record the time since the origin of the event being handled, if any """
+    t0 = origin
+    if t0 is not None:
+        record(stage, now() - t0, cam)
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+
+
+def snapshot() -> dict:
+    """ Return the histograms as a dictionary: camera -> stage -> statistics """
+    with _lock:
+        items = list(_histograms.items())
+    result = {}
+    for (cam, stage), h in sorted(items, key=lambda x: (x[0][0], list(STAGES).index(x[0][1]))):
+        result.setdefault(f'camera {cam}', {})[stage] = h.to_dict()
+    return result
+
+
+def summary() -> str:
+    """ Human readable summary of the histograms """
+    lines = []
+    for cam, stages in snapshot().items():
+        lines.append(cam)
+        for stage, s in stages.items():
+            lines.append(f"  {stage:<13} n={s['count']:<6} p50={s['p50_us']}us "
+                         f"p90={s['p90_us']}us p99={s['p99_us']}us max={s['max_us']}us")
+    if not lines:
+        return "No latency data recorded"
+    return '\n'.join(lines)
+
+
+def dump(path: str):
+    """ Write the histograms to a JSON file """
+    with open(path, 'w') as f:
+        json.dump({'stages': STAGES, 'cameras': snapshot()}, f, indent=2)
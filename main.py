@@ -1,8 +1,11 @@
 
 # TODO: re-enable typing inspection and figure out how to get rid of all the "X|None" complaints
 
+import argparse
+import os
 import platform
 import threading
+import time
 from typing import Optional
 from enum import IntEnum
 
@@ -10,17 +13,26 @@ from visca_exceptions import ViscaException
 from file_paths import controller_icon, search_path
 import PySimpleGUI as Sg
 from camera import Camera
-from osc import OSCTask
+from osc import OSCTask, take_actions as osc_take_actions
 
 # from exceptions import ViscaException
 # Use pygame-ce
 import pygame
-from numpy import interp
 from config import Config
 from companion import Companion
 from controller import ControllerList,  ControllerAxis, ControllerButton
 from viscarelay import ViscaRelay
+import ptz_control
+import osc_state
+from ptz_control import CameraPool
+from camera_profiles import CameraProfile, default_profile
 from win_print import win_print, win_print_init
+import latency
+import metrics
+import resolver
+import settings_store
+import show_file
+import tracing
 
 Windows = platform.system() == 'Windows'
 
@@ -34,6 +46,8 @@ if Windows and UsePsgTray:
 cam: Optional[Camera] = None
 current_cam = "Unknown"
 current_cam_num = 0
+# the speed profile of the current camera (see camera_profiles)
+current_profile: CameraProfile = default_profile
 
 # ------------------------------------------------------------------
 # Phil Rose (2026-06-24)
@@ -44,9 +58,13 @@ gamepad_enabled = True
 
 main_window:Optional[Sg.Window] = None
 config: Config = Config()
-bitfocus: Companion = Companion(config.companion_host())
+bitfocus: Companion = Companion(config.companion_host(), tbar_rate=config.tbar_rate, tcp=config.companion_tcp,
+                                backup_host=config.companion_backup_host)
 visca_relay: ViscaRelay = ViscaRelay(rcv_port=config.visca_relay_port)
+# Camera workers for OSC PTZ commands
+ptz_pool: CameraPool = CameraPool(lambda cam_num: config.cam_address(cam_num - 1))
 controller_list: Optional[ControllerList]  = None
+metrics_server: Optional[metrics.MetricsServer] = None
 
 pygame_thread_lock: threading.Lock = threading.Lock()
 
@@ -57,6 +75,13 @@ def pygame_lock(f):
     with pygame_thread_lock:
         f()
 
+def supported(command: str) -> bool:
+    """ Whether the current camera supports an optional command (see camera_profiles.COMMANDS) """
+    if current_profile.supports(command):
+        return True
+    win_print(f"{current_cam}: no {command.replace('_', ' ')} control")
+    return False
+
 def handle_brightness_up(button: ControllerButton):
     handle_brightness(button, True)
 
@@ -76,6 +101,9 @@ def handle_brightness(button: ControllerButton, up):
         # only act on button push
         return
 
+    if not supported('brightness'):
+        return
+
     try:
         #
         # change brightness only works when in auto exposure mode?
@@ -93,10 +121,12 @@ def handle_brightness(button: ControllerButton, up):
 
 def connect_to_camera(cam_num) -> Optional[Camera]:
     """Connects to the camera specified by cam_index and returns it"""
-    global cam, current_cam, current_cam_num, main_window
+    global cam, current_cam, current_cam_num, current_profile, main_window
 
     win = main_window
 
+    tracing.instant('camera switch', 'camera', {'from': current_cam_num, 'to': cam_num})
+
     if cam is not None:
         try:
             cam.zoom(0)
@@ -114,7 +144,8 @@ def connect_to_camera(cam_num) -> Optional[Camera]:
     cam_ip, cam_port = config.cam_address(cam_num - 1)
     if cam_ip is not None:
         try:
-            newcam = Camera(cam_ip, cam_port)
+            with tracing.span('camera connect', 'camera', {'camera': cam_num}):
+                newcam = Camera(cam_ip, cam_port, cam_num)
         except Exception as exc:
             win_print(f'Camera {cam_num} not available: {exc}')
             pass
@@ -140,6 +171,12 @@ def connect_to_camera(cam_num) -> Optional[Camera]:
     win_print(f'{cam_name}')
     current_cam = cam_name
     current_cam_num = cam_num
+    current_profile = config.cam_profile(cam_num)
+    latency.camera = cam_num
+    ptz_control.current_camera = cam_num if newcam is not None else 0
+    osc_state.publish(f'/state/camera/{cam_num}/reachable', newcam is not None and newcam.responding)
+    osc_state.publish('/state/camera', cam_num if newcam is not None else 0)
+    osc_state.publish('/state/camera/name', cam_name)
 
     if UsePsgTray:
         tray = win.metadata
@@ -148,22 +185,94 @@ def connect_to_camera(cam_num) -> Optional[Camera]:
     
     return cam
 
+def update_relay_ports():
+    """ Open (or close) the per-camera VISCA relay ports to match the configuration,
+        resolving the camera and Companion host names ahead of their use
+    """
+    cameras = {n: config.cam_address(n - 1) for n in range(1, config.num_cams + 1)}
+    resolver.shared.prefetch([host for host, _port in cameras.values()] +
+                             [h for h in (config.companion_host(), config.companion_backup_host) if h])
+    for problem in visca_relay.set_camera_ports(cameras):
+        win_print(problem)
+    visca_relay.set_shaping(config.relay_shaping, config.relay_rate_limit)
+
+def update_metrics_server():
+    """ Start, stop or move the metrics server to match the configured port """
+    global metrics_server
+    port = config.snapshot.metrics_port
+    if metrics_server is not None and metrics_server.port == port:
+        return
+    if metrics_server is not None:
+        metrics_server.shutdown()
+        metrics_server = None
+    if port:
+        try:
+            metrics_server = metrics.MetricsServer(port)
+        except OSError as exc:
+            win_print(f'Metrics port {port}: {exc}')
+
+def main_menu() -> list:
+    """ The window menu, with the Debug menu in debug or trace mode """
+    menu_items = ['Minimize', 'Configure', 'Open Show...', 'Save Show...', 'Help', 'Companion Help', 'Credits']
+    if config.debug or config.trace:
+        menu_items += ['Debug', ['Latency Stats', 'Save Latency Stats', 'Reset Latency Stats', 'Relay Stats', 'Companion Stats',
+                                 'Start Relay Capture', 'Stop Relay Capture', 'Export Trace']]
+    return [['Menu', menu_items + ['Exit']]]
+
+def apply_config():
+    """ Apply a changed configuration to what doesn't pick it up from config.snapshot itself:
+        relay ports, OSC feedback, Companion, metrics and the debug features.
+        (Controllers pick it up on their next event, camera workers when next used)
+    """
+    global current_profile
+    snapshot = config.snapshot
+    current_profile = config.cam_profile(current_cam_num)
+    update_relay_ports()
+    update_osc_feedback()
+    bitfocus.reconfigure(snapshot.companion_host, snapshot.companion_backup_host,
+                         tcp=snapshot.companion_tcp, tbar_rate=snapshot.tbar_rate)
+    update_metrics_server()
+    latency.enabled = snapshot.debug
+    tracing.enabled = snapshot.trace
+    main_window['-MENU-'].update(menu_definition=main_menu())
+
+def open_show(path: str) -> bool:
+    """ Switch to the settings of a show file. Returns False (with the settings unchanged) if it can't be used """
+    try:
+        show = show_file.read(path)
+    except show_file.ShowFileError as exc:
+        for problem in exc.problems:
+            win_print(f'Show {path}: {problem}')
+        return False
+    try:
+        config.apply_show(show)
+    except OSError as exc:
+        win_print(f'Show {path}: settings not saved: {exc}')
+    win_print(f"Show {show.get('name') or os.path.basename(path)}")
+    return True
+
+def update_osc_feedback():
+    """ Send state changes to the configured OSC feedback subscribers """
+    subscribers, problems = osc_state.parse_subscribers(config.osc_feedback)
+    for problem in problems:
+        win_print(problem)
+    osc_state.set_subscribers(subscribers)
+
 def handle_select_cam(button: Optional[ControllerButton] = None):
     """
     Handle a button push to select a camera
-    activates on button uup. Long press selects 2nd bank of cameras
+    activates on button uup. Long press selects the camera in the next bank
     """
     # Phil Rose - added gamepad_enabled
     global cam, gamepad_enabled
 
     gamepad_enabled = True
+    osc_state.publish('/state/gamepad', True)
 
     if button is None or button.is_down:
         return
 
-    cam_num = button.value
-    if button.long_press:
-        cam_num += 4
+    cam_num = config.bank_camera(button.value, button.long_press)
     if cam_num < 1 or cam_num > config.num_cams:
         win_print(f"Bad camera number {cam_num}")
     else:
@@ -228,6 +337,9 @@ def handle_preset(button: ControllerButton):
     if button.is_down:
         return
 
+    if not supported('presets'):
+        return
+
     #
     # Long press = set preset
     # Short press = recall preset
@@ -239,28 +351,29 @@ def handle_preset(button: ControllerButton):
         else:
             win_print(f"Preset {preset_num}")
             cam.recall_preset(preset_num-1)
+            osc_state.publish('/state/preset', preset_num)
     except ViscaException:
         win_print("Preset failed")
 
 
 def joy_pos_to_cam_speed(axis_position: float, table_name: str, invert=True) -> int:
-    """Converts from a joystick axis position to a camera speed using the given mapping
+    """Converts from a joystick axis position to a camera speed using the current camera's profile
 
     :param axis_position: the raw value of an axis of the joystick -1 to 1
-    :param table_name: one of the keys in sensitivity_tables
+    :param table_name: the kind of movement: 'pan', 'tilt', 'zoom' or 'focus'
     :param invert: if True, the sign of the output will be flipped
     :return: an integer which can be fed to a Camera driver method
     """
-    sign = 1 if axis_position >= 0 else -1
-    if invert:
-        sign *= -1
-
-    table = config.sensitivity(table_name)
+    probe = latency.enabled
+    if probe:
+        t0 = latency.now()
 
-    # noinspection PyTypeChecker
-    val =sign * round(
-        interp(abs(axis_position), table['joy'], table['cam'])
-    )
+    # same curve as the OSC PTZ commands
+    val = current_profile.speed(table_name, axis_position)
+    if invert:
+        val = -val
+    if probe:
+        latency.since('cam_speed', t0)
     if config.debug:
         win_print(f"joystick: {axis_position} -> {val}")
     return val
@@ -280,6 +393,9 @@ def handle_focus(axis: ControllerAxis, far):
     if cam is None or axis is None:
         return
 
+    if not current_profile.supports('focus'):
+        return
+
     #
     # select manual focus and start camera movement
     cam.set_focus_mode('manual')
@@ -316,6 +432,9 @@ def handle_autofocus(button: ControllerButton):
     if not button.is_down:
         return
 
+    if not supported('focus'):
+        return
+
     cam.set_focus_mode('auto')
     win_print("AutoFocus mode")
 
@@ -332,6 +451,7 @@ def osc_clear_cam():
 
     gamepad_enabled = False
     current_cam = "No Active Camera"
+    osc_state.publish('/state/gamepad', False)
 
     win_print(current_cam)
 
@@ -366,6 +486,9 @@ def handle_focus_hat(button: ControllerButton):
     if cam is None or button is None:
         return
 
+    if not current_profile.supports('focus'):
+        return
+
     focus_command, focus_pos = focus_map[button.value]
     if not button.is_down:
         focus_pos = 0
@@ -405,6 +528,8 @@ def handle_white_balance(button:ControllerButton):
     if button.is_down:
         # Activate on release
         return
+    if not supported('white_balance'):
+        return
     #
     # Short press == ONE PUSH white balance
     # Long press == Auto
@@ -434,10 +559,12 @@ def handle_pantilt(axis: Optional[ControllerAxis]=None):
     pan_axis = axis.controller.pan_axis
     tilt_axis = axis.controller.tilt_axis
 
+    # both from the same configuration snapshot, never half of a change
+    snapshot = config.snapshot
     pan_speed = joy_pos_to_cam_speed(pan_axis.get_position(),
-                                 'pan', config.swap_pan)
+                                 'pan', snapshot.swap_pan)
     tilt_speed = joy_pos_to_cam_speed(tilt_axis.get_position(),
-                                  'tilt', config.invert_tilt)
+                                  'tilt', snapshot.invert_tilt)
     #
     # It is possible (depending on controller?) to get a string of axis events after the
     # joystick has returned to 0. Filter these out to avoid excess 'stop' commands
@@ -470,6 +597,14 @@ def handle_pygame_event(ev:pygame.event.Event):
     Handle a single pygame event. This is called as a closure via pygame_lock(), to make
     sure that the serialization lock is properly released
     """
+    if latency.enabled:
+        latency.since_origin('handle_event')
+
+    snapshot = config.snapshot
+    if controller_list.generation != snapshot.generation:
+        # the configuration has changed since the last event
+        controller_list.configure(snapshot.long_press_time, snapshot.dead_zone, snapshot.generation)
+
     if ev.type == pygame.JOYDEVICEADDED:
         controller_list.add(ev.device_index)
     elif ev.type == pygame.JOYDEVICEREMOVED:
@@ -516,6 +651,16 @@ controller_callbacks = {
     "flushaxis":flush_axis_events
 }
 
+def handle_osc_action(event: str, value):
+    """ Apply an action queued by the OSC task """
+    if event == "OSC_CLEAR_CAMERA":
+        with tracing.span('osc clearcam', 'main_loop'):
+            pygame_lock(lambda: osc_clear_cam())
+
+    elif event == "OSC_SET_CAMERA":
+        with tracing.span('osc setcam', 'main_loop', {'camera': value}):
+            pygame_lock(lambda: osc_select_cam(value))
+
 def main_loop():
     """
     Main program loop
@@ -523,9 +668,11 @@ def main_loop():
     """
     global main_window, controller_list
 
+    snapshot = config.snapshot
     controller_list = ControllerList(callbacks=controller_callbacks,
-                                     long_press=config.long_press_time,
-                                     dead_zone=config.dead_zone)
+                                     long_press=snapshot.long_press_time,
+                                     dead_zone=snapshot.dead_zone,
+                                     generation=snapshot.generation)
 
     win = main_window
     tray = win.metadata
@@ -656,10 +803,92 @@ enclose the camera name string in double quotes (as above), in case it contains
 
         elif event == 'Configure':
             config.configure()
+            apply_config()
+
+        elif event == 'Open Show...':
+            path = Sg.popup_get_file('Open show file', keep_on_top=True,
+                                     file_types=(('Show files', '*.json'),))
+            if path and open_show(path):
+                apply_config()
+
+        elif event == 'Save Show...':
+            path = Sg.popup_get_file('Save the settings as a show file', save_as=True, keep_on_top=True,
+                                     default_extension='.json',
+                                     file_types=(('Show files', '*.json'),))
+            if path:
+                try:
+                    show_file.write(path, config.show_settings(), name=os.path.splitext(os.path.basename(path))[0])
+                    win_print(f'Show saved to {path}')
+                except OSError as exc:
+                    win_print(f'Show save failed: {exc}')
+
+        elif event == 'Relay Stats':
+            lines = []
+            for relay_port in visca_relay.ports():
+                lines.append(f'Port {relay_port.rcv_port} -> {relay_port.ptz_sockaddr}: '
+                             f'{relay_port.packets_to_camera} to camera, '
+                             f'{relay_port.packets_to_controller} to controllers, '
+                             f'{relay_port.packets_dropped} dropped, {len(relay_port.clients)} clients')
+                if relay_port.shaper is not None:
+                    lines.append('    shaped: ' + ', '.join(f'{k} {v}' for k, v in relay_port.shaper.stats.items()))
+            Sg.popup_scrolled('\n'.join(lines), title="Relay Stats", keep_on_top=True, size=(90, 15))
+
+        elif event == 'Companion Stats':
+            Sg.popup_scrolled(bitfocus.summary(), title="Companion Stats", keep_on_top=True, size=(90, 10))
+
+        elif event == 'Start Relay Capture':
+            path = Sg.popup_get_file('Capture relay traffic to', save_as=True, keep_on_top=True,
+                                     default_extension='.bin',
+                                     default_path=f'relay-{time.strftime("%Y%m%d-%H%M%S")}.bin',
+                                     file_types=(('Relay capture', '*.bin'),))
+            if path:
+                try:
+                    visca_relay.start_capture(path)
+                    win_print(f'Relay capture to {path}')
+                except OSError as exc:
+                    win_print(f'Relay capture failed: {exc}')
+
+        elif event == 'Stop Relay Capture':
+            visca_relay.stop_capture()
+            win_print('Relay capture stopped')
+
+        elif event == 'Export Trace':
+            path = Sg.popup_get_file('Export trace (Chrome trace_event JSON)', save_as=True, keep_on_top=True,
+                                     default_extension='.json',
+                                     default_path=tracing.default_export_path(),
+                                     file_types=(('JSON', '*.json'),))
+            if path:
+                try:
+                    n = tracing.export(path)
+                    win_print(f'Trace: {n} events saved to {path}')
+                except OSError as exc:
+                    win_print(f'Trace export failed: {exc}')
+
+        elif event == 'Latency Stats':
+            Sg.popup_scrolled(latency.summary(), title="Latency Stats", keep_on_top=True, size=(90, 25))
+
+        elif event == 'Save Latency Stats':
+            path = Sg.popup_get_file('Save latency histograms', save_as=True, keep_on_top=True,
+                                     default_extension='.json',
+                                     default_path=f'latency-{time.strftime("%Y%m%d-%H%M%S")}.json',
+                                     file_types=(('JSON', '*.json'),))
+            if path:
+                try:
+                    latency.dump(path)
+                    win_print(f'Latency saved to {path}')
+                except OSError as exc:
+                    win_print(f'Latency save failed: {exc}')
+
+        elif event == 'Reset Latency Stats':
+            latency.reset()
 
         elif event == Sg.WINDOW_CLOSED or event == 'Exit':
-            Sg.user_settings_set_entry('-location-', win.current_location())
-            Sg.user_settings_set_entry('-hidden-', win.is_hidden())
+            settings_store.shared.set('-location-', win.current_location())
+            settings_store.shared.set('-hidden-', win.is_hidden())
+            try:
+                settings_store.shared.commit()
+            except OSError as exc:
+                win_print(f'Settings could not be saved: {exc}')
             return False
 
         elif event == 'PYGAME_EVENT':
@@ -671,17 +900,25 @@ enclose the camera name string in double quotes (as above), in case it contains
             except IndexError:
                 ev = values[0]
 
-            pygame_lock(lambda: handle_pygame_event(ev))
+            if latency.enabled:
+                latency.origin = getattr(ev, 'probe_t0', None)
+                latency.since_origin('main_loop')
+
+            if tracing.enabled:
+                t0 = getattr(ev, 'probe_t0', None)
+                if t0 is not None:
+                    # time spent waiting for the main loop
+                    tracing.complete('event queued', 'main_loop', t0 // 1000, tracing.now_us())
+                with tracing.span('pygame event', 'main_loop', {'type': pygame.event.event_name(ev.type)}):
+                    pygame_lock(lambda: handle_pygame_event(ev))
+            else:
+                pygame_lock(lambda: handle_pygame_event(ev))
+            latency.origin = None
 
 # Companion /clearcam support
-        elif event == "OSC_CLEAR_CAMERA":
-            pygame_lock(lambda: osc_clear_cam())
-
-        elif event == "OSC_SET_CAMERA":
-            pygame_lock(lambda: osc_select_cam(values['OSC_SET_CAMERA']))
-
-        elif event == "OSC_SET_CAMERA_NAME":
-            config.set_cam_name(*values['OSC_SET_CAMERA_NAME'])
+        elif event == "OSC_ACTIONS":
+            for osc_event, osc_value in osc_take_actions():
+                handle_osc_action(osc_event, osc_value)
 
 pygame_task_exit = False
 pygame_thread: Optional[threading.Thread] = None
@@ -704,7 +941,11 @@ def pygame_task(win):
 
     while not pygame_task_exit:
         if pygame_flush_axis:
-            pygame.event.clear(pygame.JOYAXISMOTION)
+            # keep only the latest event of each axis: the handlers read the current positions,
+            # but the last event of a movement (the stick back in the centre) must get through
+            latest = {(ev.instance_id, ev.axis): ev for ev in pygame.event.get(pygame.JOYAXISMOTION)}
+            for ev in latest.values():
+                pygame.event.post(ev)
             pygame_flush_axis = False
 
         try:
@@ -723,7 +964,15 @@ def pygame_task(win):
             pass_event = True
 
         if pass_event:
-            win.write_event_value('PYGAME_EVENT', ev)
+            if latency.enabled or tracing.enabled:
+                # origin of the latency probes and trace for this event
+                t0 = latency.now()
+                ev.probe_t0 = t0
+                win.write_event_value('PYGAME_EVENT', ev)
+                if latency.enabled:
+                    latency.since('write_event', t0)
+            else:
+                win.write_event_value('PYGAME_EVENT', ev)
 
     # exited loop, return to terminate task
     pygame.quit()
@@ -755,9 +1004,19 @@ def main():
     """
     global cam, main_window
 
-    settings = Sg.UserSettings()
-    window_location = settings.get('-location-')
-    window_hidden = settings.get('-hidden-')
+    parser = argparse.ArgumentParser(description=config.progname)
+    parser.add_argument('--show', metavar='FILE', help='switch to the settings of a show file')
+    parser.add_argument('--export-show', metavar='FILE', help='save the settings as a show file, and exit')
+    args = parser.parse_args()
+    if args.export_show:
+        show_file.write(args.export_show, config.show_settings(),
+                        name=os.path.splitext(os.path.basename(args.export_show))[0])
+        return
+    if args.show and not open_show(args.show):
+        return
+
+    window_location = settings_store.shared.get('-location-')
+    window_hidden = settings_store.shared.get('-hidden-')
 
     if config.debug:
         # Bigger window when debugging
@@ -774,8 +1033,7 @@ def main():
                             size=output_size,
                             key='OUTPUT')
 
-    menu_def = [['Menu', ['Minimize', 'Configure', 'Help', 'Companion Help', 'Credits', 'Exit']]]
-    layout = [[Sg.Menu(menu_def)], [output]]
+    layout = [[Sg.Menu(main_menu(), key='-MENU-')], [output]]
 
     window = Sg.Window( title=config.progname, layout=layout,
                         no_titlebar=True, grab_anywhere=True, location=window_location,
@@ -799,13 +1057,30 @@ def main():
 
     main_window = window
 
+    # latency probes are enabled in debug mode
+    latency.enabled = config.debug
+    tracing.enabled = config.trace
+
+    metrics.register('current_camera', lambda: current_cam_num, text='Currently selected camera number')
+    metrics.register('gamepad_enabled', lambda: int(gamepad_enabled), text='Gamepad PTZ control enabled')
+    metrics.register('current_camera_missed_responses',
+                     lambda: cam.num_missed_responses if cam is not None else None,
+                     text='Missed VISCA responses on the current camera connection')
+    metrics.register('gui_event_queue_depth',
+                     lambda: window.thread_queue.qsize(),
+                     text='Events waiting for the main loop')
+
     win_print(f'{config.progname}({config.progvers})')
 
+    apply_config()
+    osc_state.publish('/state/gamepad', gamepad_enabled)
+    osc_state.publish('/state/bank', config.bank)
+
     cam = connect_to_camera(1)
 
     pygame_task_start(window)
 
-    osc_task = OSCTask(window)
+    osc_task = OSCTask(window, pool=ptz_pool)
 
     bitfocus.startup()
 
@@ -823,6 +1098,10 @@ def main():
 #    window.timer_stop(timer_id)
 
     osc_task.shutdown()
+    ptz_pool.reset()
+    bitfocus.close()
+    if metrics_server is not None:
+        metrics_server.shutdown()
 
     pygame_task_end()
 
@@ -0,0 +1,126 @@
+#
+# Local metrics endpoint for live monitoring
+#
+# Counters are incremented in place by the code that owns them, from any thread, under a
+# lock (a few hundred ns when uncontended). Values that already exist as attributes
+# elsewhere (e.g. the relay packet counts, the current camera) are registered as callables
+# and only read when the endpoint is scraped.
+#
+# The endpoint serves Prometheus text format from a background thread:
+#   http://<host>:<port>/metrics
+# A scrape copies the counter dictionary under the lock and calls each registered callable
+# once. Nothing on the control path waits for more than that copy.
+#
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Callable
+
+_counters: dict[tuple[str, tuple], float] = {}
+_collectors: list[tuple[str, str, Callable]] = []
+_help: dict[str, tuple[str, str]] = {}
+_lock = threading.Lock()
+
+
+def describe(name: str, mtype: str, text: str):
+    """ Set the TYPE and HELP lines for a metric """
+    _help[name] = (mtype, text)
+
+
+def inc(name: str, n=1, **labels):
+    """ Increment a counter """
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + n
+
+
+def register(name: str, func: Callable, mtype='gauge', text=''):
+    """ Register a callable evaluated at scrape time.
+        func returns either a number, or a dictionary of {label tuple: number}
+        where label tuple is ((label, value), ...)
+    """
+    _collectors.append((name, mtype, func))
+    describe(name, mtype, text)
+
+
+def _escape(v) -> str:
+    return str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _sample(name: str, labels: tuple, value) -> str:
+    if labels:
+        label_str = ','.join(f'{k}="{_escape(v)}"' for k, v in labels)
+        return f'{name}{{{label_str}}} {value}'
+    return f'{name} {value}'
+
+
+def snapshot() -> dict[str, list[tuple[tuple, float]]]:
+    """ Take a snapshot of all metrics: name -> [(labels, value)] """
+    result: dict[str, list[tuple[tuple, float]]] = {}
+    with _lock:
+        counters = dict(_counters)
+    for (name, labels), value in counters.items():
+        result.setdefault(name, []).append((labels, value))
+    for name, _mtype, func in list(_collectors):
+        try:
+            value = func()
+        except Exception:
+            continue
+        if value is None:
+            continue
+        if isinstance(value, dict):
+            result.setdefault(name, []).extend(value.items())
+        else:
+            result.setdefault(name, []).append(((), value))
+    return result
+
+
+def prometheus_text() -> str:
+    lines = []
+    for name, samples in sorted(snapshot().items()):
+        mtype, text = _help.get(name, ('untyped', ''))
+        if text:
+            lines.append(f'# HELP {name} {text}')
+        lines.append(f'# TYPE {name} {mtype}')
+        for labels, value in sorted(samples):
+            lines.append(_sample(name, labels, value))
+    return '\n'.join(lines) + '\n'
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = prometheus_text().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass    # no console in a windowed app
+
+
+class MetricsServer:
+    def __init__(self, port: int, host=''):
+        self.port = port
+        self.server = ThreadingHTTPServer((host, port), _Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def shutdown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+
+describe('visca_commands_total', 'counter', 'VISCA commands sent to cameras, including retries')
+describe('visca_retries_total', 'counter', 'VISCA command retries')
+describe('visca_missed_responses_total', 'counter', 'VISCA responses not received before timeout')
+describe('visca_exceptions_total', 'counter', 'VISCA error responses by status code')
+describe('osc_messages_total', 'counter', 'OSC messages handled by address')
+describe('companion_sends_total', 'counter', 'Messages sent to Bitfocus Companion')
+describe('companion_send_failures_total', 'counter', 'Messages that could not be sent to Bitfocus Companion')
@@ -3,27 +3,100 @@
 # Task which receives OSC messages and turns them into control
 # messages
 #
+# The server runs an asyncio event loop on its own thread. All the messages of a datagram
+# (a message, or a bundle and its nested bundles) are dispatched together, and the actions
+# they produce are added to a mailbox in one step, so the main loop always applies a
+# bundle as a whole. The main loop is woken by a single OSC_ACTIONS window event however
+# many actions are waiting, and consecutive camera selections are collapsed to the last
+# one (as are repeated /clearcam), so a burst of messages from Companion doesn't build up a backlog of window events.
+#
+# Bundle time tags are honored: /ptz commands with a time tag in the future are queued on
+# the camera workers, which carry them out at that time, each camera in parallel, and
+# main loop actions (e.g. /setcam) are posted at that time by the event loop.
+#
 from typing import Optional
+import asyncio
 import threading
+import time
 import PySimpleGUI as Sg
 from pythonosc.dispatcher import Dispatcher
-from pythonosc.osc_server import BlockingOSCUDPServer
+from pythonosc.osc_packet import OscPacket, ParseError
 from win_print import win_print
 import socket
+import metrics
+import osc_state
+import tracing
+from ptz_control import CameraPool, CameraWorker
 
 #from time import sleep
 
 # Phil Rose: allow OSC /setcam to use camera names as well as numbers.
-from config import cam_names, g_num_cams
+import config
 
 OSC_Port = 9999
+MAX_DELAY = 600     # seconds, bundles time tagged further ahead than this are not accepted
 
 window : Optional[Sg.Window]  = None
+ptz_pool: Optional[CameraPool] = None
+
+metrics.describe('osc_invalid_packets_total', 'counter', 'Datagrams received on the OSC port that are not OSC')
+metrics.describe('osc_actions_collapsed_total', 'counter', 'OSC camera selections replaced by a later one')
+
+# Actions (time, window event, value) produced by the handlers for the datagram being dispatched
+_batch: Optional[list] = None
+# When the message being dispatched is to take effect: a time.monotonic(), or None for now
+_fire_at: Optional[float] = None
+
+# Actions waiting for the main loop
+_actions: list = []
+_actions_lock = threading.Lock()
+_wakeup_pending = False
+
+# Actions of which only the last of a run of the same action matters
+_COLLAPSED_ACTIONS = ('OSC_SET_CAMERA', 'OSC_CLEAR_CAMERA')
+
+
+def post(event: str, value):
+    """ Queue an action for the main loop, from a handler """
+    if _batch is not None:
+        _batch.append((_fire_at, event, value))
+    else:
+        _post([(event, value)])
+
+
+def _post(actions: list):
+    global _wakeup_pending
+    with _actions_lock:
+        _actions.extend(actions)
+        if _wakeup_pending:
+            return
+        _wakeup_pending = True
+    window.write_event_value('OSC_ACTIONS', None)
+
+
+def take_actions() -> list:
+    """ Called by the main loop on OSC_ACTIONS: the waiting actions, in order """
+    global _wakeup_pending
+    with _actions_lock:
+        actions = _actions[:]
+        _actions.clear()
+        _wakeup_pending = False
+
+    result = []
+    for action in actions:
+        if result and action[0] in _COLLAPSED_ACTIONS and result[-1][0] == action[0]:
+            metrics.inc('osc_actions_collapsed_total')
+            result[-1] = action
+        else:
+            result.append(action)
+    return result
 
 def camera_handler(_address, *args):
     """ Dispatcher handler for setcam command """
     global window
 
+    metrics.inc('osc_messages_total', address=_address)
+
     if len(args) == 0:
         win_print("OSC Set Camera: missing argument")
         return
@@ -33,19 +106,13 @@ def camera_handler(_address, *args):
  
     except ValueError:
         # Phil Mod: allow /setcam "Lathe" or /setcam "Front"
-        requested_name = str(args[0]).strip().lower()
-        cam_num = None
-
-        for i in range(g_num_cams):
-            if cam_names[i].strip().lower() == requested_name:
-                cam_num = i + 1
-                break
+        cam_num = config.cam_number(args[0])
 
         if cam_num is None:
             win_print(f"OSC Set Camera: unknown camera name '{args[0]}'")
             return
 
-    window.write_event_value('OSC_SET_CAMERA', cam_num)
+    post('OSC_SET_CAMERA', cam_num)
 
 def camera_name_handler(_address, *args):
     """ Dispatcher handler for setcamname command
@@ -54,13 +121,15 @@ def camera_name_handler(_address, *args):
         """
     global window
 
+    metrics.inc('osc_messages_total', address=_address)
+
     if len(args) < 2:
         win_print("OSC Set Camera Name: missing argument")
         return
 
     try:
         cam_num = int(args[0])
-        if cam_num < 0 or cam_num > g_num_cams:
+        if config.cameras.get(cam_num) is None:
             cam_num = None
     except ValueError:
         cam_num = None
@@ -69,22 +138,153 @@ def camera_name_handler(_address, *args):
         win_print("OSC Set Camera Name: invalid camera number")
         return
 
-    cam_name = args[1].replace('"', '') # in case the string came over with double quotes
+    cam_name = str(args[1]).replace('"', '') # in case the string came over with double quotes
 
+    # applied here rather than in the main loop, so that a /setcam later in the same
+    # bundle can already use the new name
+    config.set_cam_name(cam_num, cam_name)
     win_print(f"Set Camera {cam_num} Name: {cam_name}")
-    window.write_event_value('OSC_SET_CAMERA_NAME', (cam_num, cam_name))
+
+def bank_handler(_address, *args):
+    """ Dispatcher handler for setbank command
+        arg1: bank number (1 ...), the bank of cameras the camera select buttons choose from
+        """
+    metrics.inc('osc_messages_total', address=_address)
+
+    try:
+        bank = int(args[0])
+    except (IndexError, ValueError):
+        bank = 0
+    if bank < 1 or (bank - 1) * config.g_bank_size >= config.g_num_cams:
+        win_print(f"OSC Set Bank: invalid bank {args[0] if args else ''}")
+        return
+    config.Config.set_bank(bank)
+    osc_state.publish('/state/bank', bank)
+    win_print(f"Camera bank {bank}")
 
 def clear_camera_handler(_address):
     """ Disable gamepad PTZ control when no camera is active. """
     global window
-    window.write_event_value('OSC_CLEAR_CAMERA', None)
+
+    metrics.inc('osc_messages_total', address=_address)
+    post('OSC_CLEAR_CAMERA', None)
+
+
+def trace_export_handler(_address, *args):
+    """ Dispatcher handler for trace/export command
+        arg1: (optional) name of the file to write, in the home folder. OSC isn't
+        authenticated, so it can't be a path
+        """
+    metrics.inc('osc_messages_total', address=_address)
+
+    try:
+        path = tracing.default_export_path(str(args[0]) if len(args) > 0 else None)
+    except ValueError as exc:
+        win_print(f"Trace export failed: {exc}")
+        return
+    try:
+        n = tracing.export(path)
+        win_print(f"Trace: {n} events saved to {path}")
+    except OSError as exc:
+        win_print(f"Trace export failed: {exc}")
 
 
-def osc_task(t):
+def _ptz_worker(_address, args, nargs: int) -> Optional[CameraWorker]:
+    """ The camera worker for a /ptz command: the camera is the optional argument after
+        the first nargs (number or name), the current camera if there isn't one
     """
-    Thread to run
+    if len(args) < nargs:
+        win_print(f"OSC {_address}: missing argument")
+        return None
+    cam_num = 0
+    if len(args) > nargs:
+        try:
+            cam_num = int(args[nargs])
+        except ValueError:
+            cam_num = config.cam_number(args[nargs])
+            if cam_num is None:
+                win_print(f"OSC {_address}: unknown camera name '{args[nargs]}'")
+                return None
+    if ptz_pool is None:
+        return None
+    return ptz_pool.worker(cam_num)
+
+
+def _speed(value, kind: str, worker: CameraWorker) -> int:
+    """ Camera speed for a -1 to 1 OSC value, with the camera's speed profile (as the gamepad) """
+    return config.Config.cam_profile(worker.cam_num).speed(kind, float(value))
+
+
+def _supported(_address, worker: CameraWorker, command: str) -> bool:
+    if config.Config.cam_profile(worker.cam_num).supports(command):
+        return True
+    win_print(f"OSC {_address}: camera {worker.cam_num} has no {command} control")
+    return False
+
+
+def ptz_pantilt_handler(_address, *args):
+    """ /ptz/pantilt pan tilt [camera]: pan and tilt speeds -1 to 1, positive is right and up """
+    metrics.inc('osc_messages_total', address=_address)
+    worker = _ptz_worker(_address, args, 2)
+    if worker is not None:
+        worker.drive('pantilt', (-_speed(args[0], 'pan', worker), _speed(args[1], 'tilt', worker)), at=_fire_at)
+
+
+def ptz_zoom_handler(_address, *args):
+    """ /ptz/zoom speed [camera]: -1 to 1, positive zooms in """
+    metrics.inc('osc_messages_total', address=_address)
+    worker = _ptz_worker(_address, args, 1)
+    if worker is not None:
+        worker.drive('zoom', _speed(args[0], 'zoom', worker), at=_fire_at)
+
+
+def ptz_focus_handler(_address, *args):
+    """ /ptz/focus speed [camera]: -1 to 1, positive focuses near. Selects manual focus """
+    metrics.inc('osc_messages_total', address=_address)
+    worker = _ptz_worker(_address, args, 1)
+    if worker is not None and _supported(_address, worker, 'focus'):
+        worker.drive('focus', _speed(args[0], 'focus', worker), at=_fire_at)
+
+
+def ptz_preset_handler(_address, *args):
+    """ /ptz/preset number [camera]: recall a preset (1-16) """
+    metrics.inc('osc_messages_total', address=_address)
+    worker = _ptz_worker(_address, args, 1)
+    if worker is None or not _supported(_address, worker, 'presets'):
+        return
+    try:
+        preset = int(args[0])
+    except ValueError:
+        preset = 0
+    if not 1 <= preset <= 16:
+        win_print(f"OSC {_address}: bad preset number {args[0]}")
+        return
+    worker.command('recall_preset', preset - 1, at=_fire_at)
+
+
+def ptz_stop_handler(_address, *args):
+    """ /ptz/stop [camera]: stop pan, tilt, zoom and focus """
+    metrics.inc('osc_messages_total', address=_address)
+    worker = _ptz_worker(_address, args, 0)
+    if worker is not None:
+        worker.stop(at=_fire_at)
+
+
+def state_refresh_handler(client_address, _address, *args):
+    """ /state/refresh [port]: send the whole state to the sender (on the given port, default the
+        port it sent from), or to all the feedback subscribers if the port is 0
     """
-    t.server.serve_forever()
+    metrics.inc('osc_messages_total', address=_address)
+    port = int(args[0]) if len(args) > 0 else client_address[1]
+    osc_state.refresh((client_address[0], port) if port else None)
+
+
+class _OSCProtocol(asyncio.DatagramProtocol):
+    def __init__(self, task: 'OSCTask'):
+        self.task = task
+
+    def datagram_received(self, data, client_address):
+        self.task.dispatch(data, client_address)
 
 
 class OSCTask:
@@ -92,25 +292,90 @@ class OSCTask:
         """
         Thread to run
         """
-        self.server.timeout = .5
-        self.server.serve_forever()
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+        self.transport.close()
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.loop.close()
+
+    def dispatch(self, data: bytes, client_address):
+        """ Dispatch all the messages of a datagram, and pass their actions to the main loop together """
+        global _batch, _fire_at
+
+        try:
+            packet = OscPacket(data)
+        except ParseError:
+            metrics.inc('osc_invalid_packets_total')
+            return
 
-    def __init__(self, win : Sg.Window, host=''):
-        global window
+        now = time.time()
+        to_monotonic = time.monotonic() - now
+        _batch = []
+        try:
+            for timed_message in packet.messages:
+                message = timed_message.message
+                delay = timed_message.time - now
+                if delay > MAX_DELAY:
+                    win_print(f"OSC {message.address}: time tag {delay:.0f}s ahead, ignored (are the clocks in sync?)")
+                    continue
+                # messages without a time tag, or whose time has passed, have the time of arrival
+                _fire_at = timed_message.time + to_monotonic if delay > 0 else None
+                for handler in self.dispatcher.handlers_for_address(message.address):
+                    try:
+                        handler.invoke(client_address, message)
+                    except (ValueError, TypeError, IndexError) as exc:
+                        # bad arguments: an exception here would close the server's transport
+                        win_print(f"OSC {message.address}: {exc}")
+        finally:
+            batch = _batch
+            _batch = None
+            _fire_at = None
+
+        # the actions for each time are posted together, in order
+        actions = {}
+        for at, event, value in batch:
+            actions.setdefault(at, []).append((event, value))
+        for at, timed_actions in actions.items():
+            if at is None:
+                _post(timed_actions)
+            else:
+                # the event loop's clock is time.monotonic()
+                self.loop.call_at(at, _post, timed_actions)
+
+    def __init__(self, win : Sg.Window, host='', pool: Optional[CameraPool] = None):
+        """ :param pool: the camera workers for /ptz commands """
+        global window, ptz_pool
 
         window = win
+        ptz_pool = pool
 
         self.dispatcher = Dispatcher()
         self.dispatcher.map("/setcam", camera_handler)
         self.dispatcher.map("/clearcam", clear_camera_handler)
         self.dispatcher.map("/setcamname", camera_name_handler)
-        self.server = BlockingOSCUDPServer((host, OSC_Port),
-                                           dispatcher=self.dispatcher,
-                                           family=socket.AF_INET)
-        self.thread = threading.Thread(target=self.osc_task)
+        self.dispatcher.map("/setbank", bank_handler)
+        self.dispatcher.map("/trace/export", trace_export_handler)
+        self.dispatcher.map("/ptz/pantilt", ptz_pantilt_handler)
+        self.dispatcher.map("/ptz/zoom", ptz_zoom_handler)
+        self.dispatcher.map("/ptz/focus", ptz_focus_handler)
+        self.dispatcher.map("/ptz/preset", ptz_preset_handler)
+        self.dispatcher.map("/ptz/stop", ptz_stop_handler)
+        self.dispatcher.map("/state/refresh", state_refresh_handler, needs_reply_address=True)
+
+        # bind here, so that an error is reported to the caller
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.bind((host, OSC_Port))
+        except OSError:
+            sock.close()
+            raise
+        self.loop = asyncio.new_event_loop()
+        self.transport, _protocol = self.loop.run_until_complete(
+            self.loop.create_datagram_endpoint(lambda: _OSCProtocol(self), sock=sock))
+        self.thread = threading.Thread(target=self.osc_task, name='OSC')
         self.thread.daemon = True
         self.thread.start()
 
     def shutdown(self):
-        self.server.shutdown()
+        self.loop.call_soon_threadsafe(self.loop.stop)
         self.thread.join()
@@ -0,0 +1,148 @@
+#
+# Publishing of the controller's state to OSC subscribers (e.g. Companion, for button feedback)
+#
+# Parts of the program report state with publish(address, value). Only changes are kept,
+# and the changes made within WINDOW seconds of the first one are sent together, as one
+# OSC bundle, to every subscriber. A subscriber added later, or one that sends
+# /state/refresh, gets the whole state.
+#
+# State addresses:
+#   /state/camera               current camera number (0 if none)
+#   /state/camera/name          current camera name
+#   /state/gamepad              1 if the game controller is controlling the camera, else 0
+#   /state/camera/<n>/reachable 1 if camera n answered when last used, else 0
+#   /state/preset               last preset recalled (1-16)
+#   /state/bank                 current bank of the camera select buttons
+#
+import socket
+import threading
+import time
+from pythonosc.osc_bundle_builder import OscBundleBuilder, IMMEDIATELY
+from pythonosc.osc_message_builder import OscMessageBuilder
+import metrics
+import resolver
+
+WINDOW = 0.02           # seconds over which changes are collected into one bundle
+
+metrics.describe('osc_state_bundles_total', 'counter', 'State bundles sent to OSC subscribers')
+
+_lock = threading.Condition()
+_state: dict[str, object] = {}
+_changed: dict[str, object] = {}
+_flush_at: float | None = None
+_subscribers: list[tuple[str, int]] = []
+_new_subscribers: list[tuple[str, int]] = []
+_thread: threading.Thread | None = None
+_sock: socket.socket | None = None
+
+
+def publish(address: str, value):
+    """ Set a state value, to be sent to the subscribers if it has changed """
+    if isinstance(value, bool):
+        value = int(value)
+    with _lock:
+        if address in _state and _state[address] == value:
+            return
+        _state[address] = value
+        if not _subscribers:
+            return
+        _changed[address] = value
+        _schedule()
+
+
+def parse_subscribers(text: str) -> tuple[list[tuple[str, int]], list[str]]:
+    """ Parse 'host:port, host:port ...'
+        :return: the (host, port) list, and a list of problems
+    """
+    subscribers = []
+    problems = []
+    for item in text.replace(';', ',').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        host, _, port = item.rpartition(':')
+        try:
+            port = int(port)
+        except ValueError:
+            port = 0
+        if not host or not 0 < port < 65536:
+            problems.append(f'OSC feedback: "{item}" is not host:port')
+            continue
+        subscribers.append((host, port))
+    return subscribers, problems
+
+
+def set_subscribers(subscribers: list[tuple[str, int]]):
+    """ Set where state changes are sent. New subscribers are sent the whole state """
+    global _subscribers
+    resolver.shared.prefetch(host for host, _port in subscribers)
+    with _lock:
+        _new_subscribers.extend(s for s in subscribers if s not in _subscribers)
+        _subscribers = list(subscribers)
+        if _new_subscribers:
+            _schedule()
+
+
+def refresh(subscriber: tuple[str, int] | None = None):
+    """ Send the whole state to one subscriber, or all of them """
+    with _lock:
+        _new_subscribers.extend([subscriber] if subscriber else _subscribers)
+        if _new_subscribers:
+            _schedule()
+
+
+def _schedule():
+    """ Send what has changed after WINDOW, called with the lock held """
+    global _flush_at, _thread, _sock
+    if _flush_at is not None:
+        return
+    if _thread is None:
+        _sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        _thread = threading.Thread(target=_sender, name='OSC state')
+        _thread.daemon = True
+        _thread.start()
+    _flush_at = time.monotonic() + WINDOW
+    _lock.notify()
+
+
+def _bundle(values: dict) -> bytes:
+    bundle = OscBundleBuilder(IMMEDIATELY)
+    for address, value in values.items():
+        message = OscMessageBuilder(address)
+        message.add_arg(value)
+        bundle.add_content(message.build())
+    return bundle.build().dgram
+
+
+def _send(dgram: bytes, subscribers):
+    for host, port in subscribers:
+        # this thread isn't on the control path, it can wait for a name to be resolved
+        address = resolver.shared.resolve(host, timeout=1.0)
+        if address is None:
+            continue
+        try:
+            _sock.sendto(dgram, (address, port))
+        except OSError:
+            pass
+
+
+def _sender():
+    global _flush_at
+    while True:
+        with _lock:
+            while _flush_at is None or time.monotonic() < _flush_at:
+                _lock.wait(None if _flush_at is None else _flush_at - time.monotonic())
+            _flush_at = None
+            changed = dict(_changed)
+            _changed.clear()
+            full = dict(_state)
+            new = list(dict.fromkeys(_new_subscribers))
+            _new_subscribers.clear()
+            others = [s for s in _subscribers if s not in new]
+
+        if new and full:
+            _send(_bundle(full), new)
+            metrics.inc('osc_state_bundles_total')
+        if changed and others:
+            _send(_bundle(changed), others)
+            metrics.inc('osc_state_bundles_total')
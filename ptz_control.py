@@ -0,0 +1,194 @@
+#
+# Camera workers for PTZ control from OSC
+#
+# Each camera gets a worker thread with its own Camera connection and a mailbox that holds
+# only the latest requested speed for each kind of movement (pan/tilt, zoom, focus), and a
+# queue of one-off commands (e.g. presets). The worker sends a movement only when it
+# differs from the last one sent, and at most once per MIN_INTERVAL for each kind, so a
+# fader sending hundreds of messages per second becomes a few VISCA commands, the last of
+# which carries the final value. Stops are sent without waiting for the interval.
+#
+# Commands can also be queued ahead of time, to be carried out at a given time.monotonic()
+# (e.g. from the time tag of an OSC bundle). The worker connects to the camera as soon as
+# such a command is queued, so a cue sent to several cameras fires on all of them at once,
+# each from its own worker, rather than one after another.
+#
+import heapq
+import threading
+import time
+from collections import deque
+from camera import Camera
+from visca_exceptions import ViscaException, NoQueryResponse
+from win_print import win_print
+import metrics
+import osc_state
+
+MIN_INTERVAL = 0.05     # seconds between drive commands of one kind, per camera
+
+# The camera currently selected by the main loop (0 for none), the default target of commands
+current_camera = 0
+
+_STOPPED = {'pantilt': (0, 0), 'zoom': 0, 'focus': 0}
+
+metrics.describe('ptz_requests_total', 'counter', 'PTZ movement requests received (e.g. from OSC)')
+metrics.describe('ptz_commands_total', 'counter', 'PTZ commands sent to cameras by the camera workers')
+metrics.describe('ptz_command_failures_total', 'counter', 'PTZ commands that failed')
+
+
+class CameraWorker:
+    def __init__(self, cam_num: int, address):
+        """ :param address: (host, port) of the camera """
+        self.cam_num = cam_num
+        self.address = address
+        self.cam: Camera | None = None
+        self.cond = threading.Condition()
+        self.wanted = {}            # kind -> latest requested value
+        self.sent = {}              # kind -> last value sent
+        self.next_allowed = {}      # kind -> time.monotonic() of the next drive command
+        self.commands = deque()     # (Camera method name, args)
+        self.timed = []             # heap of (time.monotonic() due, sequence, function to apply the request)
+        self.timed_sequence = 0
+        self.connect_wanted = False
+        self.focus_moving = False
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name=f'Camera {cam_num}')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def drive(self, kind: str, value, at: float | None = None):
+        """ Request a movement: kind is 'pantilt' (value (pan, tilt)), 'zoom' or 'focus'
+            :param at: time.monotonic() at which to start the movement, None for now
+        """
+        metrics.inc('ptz_requests_total', kind=kind)
+        self._request(at, lambda: self.wanted.__setitem__(kind, value))
+
+    def stop(self, at: float | None = None):
+        self._request(at, lambda: self.wanted.update(_STOPPED))
+
+    def command(self, name: str, *args, at: float | None = None):
+        """ Queue a call of Camera.<name>(*args), at time.monotonic() at, or now """
+        self._request(at, lambda: self.commands.append((name, args)))
+
+    def _request(self, at: float | None, apply):
+        with self.cond:
+            if at is None:
+                apply()
+            else:
+                self.timed_sequence += 1
+                heapq.heappush(self.timed, (at, self.timed_sequence, apply))
+                self.connect_wanted = True
+            self.cond.notify()
+
+    def _next_action(self):
+        """ Wait for something to do. Called with the condition held """
+        while self.running:
+            now = time.monotonic()
+            while self.timed and self.timed[0][0] <= now:
+                heapq.heappop(self.timed)[2]()
+            if self.connect_wanted:
+                # connect now rather than when the queued command is due
+                self.connect_wanted = False
+                if self.cam is None:
+                    return 'connect', ()
+            if self.commands:
+                return self.commands.popleft()
+            timeout = self.timed[0][0] - now if self.timed else None
+            for kind, value in self.wanted.items():
+                if value == self.sent.get(kind):
+                    continue
+                due = self.next_allowed.get(kind, 0.0)
+                if due <= now or value == _STOPPED[kind]:
+                    self.sent[kind] = value
+                    self.next_allowed[kind] = now + MIN_INTERVAL
+                    return kind, value
+                if timeout is None or due - now < timeout:
+                    timeout = due - now
+            self.cond.wait(timeout)
+        return None
+
+    def run(self):
+        while True:
+            with self.cond:
+                action = self._next_action()
+            if action is None:
+                break
+            self._execute(*action)
+        if self.cam is not None:
+            self.cam.close_connection()
+
+    def _execute(self, name, value):
+        try:
+            if self.cam is None:
+                self.cam = Camera(*self.address, self.cam_num)
+            cam = self.cam
+            if name == 'connect':
+                return
+            elif name == 'pantilt':
+                cam.pantilt(*value)
+            elif name == 'zoom':
+                cam.zoom(value)
+            elif name == 'focus':
+                # select manual focus when a focus movement starts, as the gamepad does
+                if value and not self.focus_moving:
+                    cam.set_focus_mode('manual')
+                self.focus_moving = value != 0
+                cam.manual_focus(value)
+            else:
+                getattr(cam, name)(*value)
+                if name == 'recall_preset':
+                    osc_state.publish('/state/preset', value[0] + 1)
+            metrics.inc('ptz_commands_total', kind=name)
+        except (ViscaException, NoQueryResponse, OSError) as exc:
+            metrics.inc('ptz_command_failures_total', kind=name)
+            win_print(f'Camera {self.cam_num} {name} failed: {exc}')
+        osc_state.publish(f'/state/camera/{self.cam_num}/reachable', self.cam is not None and self.cam.responding)
+
+    def retire(self):
+        """ Stop the worker once it has finished what it is doing, without waiting for it """
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+
+    def close(self):
+        self.retire()
+        self.thread.join()
+
+
+class CameraPool:
+    """ Camera workers, started when a camera is first used """
+    def __init__(self, address_func):
+        """ :param address_func: returns (host, port) for a camera number, host None if not configured """
+        self.address_func = address_func
+        self.workers: dict[int, CameraWorker] = {}
+        self.lock = threading.Lock()
+
+    def worker(self, cam_num: int = 0) -> CameraWorker | None:
+        """ The worker for a camera, 0 for the current camera. None if it isn't configured """
+        if not cam_num:
+            cam_num = current_camera
+            if not cam_num:
+                return None
+        worker = self.workers.get(cam_num)
+        # a worker whose camera has been given a new address in the configuration is replaced
+        if worker is None or worker.address != self.address_func(cam_num):
+            with self.lock:
+                worker = self.workers.get(cam_num)
+                host, port = self.address_func(cam_num)
+                if worker is not None and worker.address != (host, port):
+                    del self.workers[cam_num]
+                    worker.retire()
+                    worker = None
+                if worker is None:
+                    if not host:
+                        return None
+                    worker = CameraWorker(cam_num, (host, port))
+                    self.workers[cam_num] = worker
+        return worker
+
+    def reset(self):
+        """ Stop all the workers """
+        with self.lock:
+            workers = list(self.workers.values())
+            self.workers = {}
+        for worker in workers:
+            worker.close()
@@ -0,0 +1,331 @@
+#
+# Capture of VISCA relay traffic to a compact binary ring file, and a command line tool
+# to decode it, compute latency statistics, and replay it against a simulated camera.
+#
+# The ring file is memory mapped and preallocated. Each datagram is written into a fixed
+# size record with struct.pack_into, so the relay thread does no per packet allocation of
+# buffers and no formatting. One ring is shared by all the relay ports, which record from
+# the relay thread and from the threads of in-process clients, so writes hold its lock.
+#
+# File layout (little endian):
+#   header (64 bytes): magic, version, record size, capacity, records written,
+#                      wall clock time and monotonic time (ns) when the capture started
+#   capacity records of RECORD_SIZE bytes:
+#     monotonic time (ns), direction, length, relay port, client address/port,
+#     camera address/port, the datagram (truncated to MAX_DATA bytes)
+#
+# Usage:
+#   python relaycapture.py decode capture.bin
+#   python relaycapture.py stats capture.bin
+#   python relaycapture.py replay capture.bin [--camera host:port] [--speed N]
+#
+import argparse
+import mmap
+import socket
+import struct
+import threading
+import time
+
+MAGIC = b'VISCAPCP'
+VERSION = 1
+RECORD_SIZE = 64
+MAX_DATA = 40
+
+DIR_TO_CAMERA = 0       # command from a client, as received (client's sequence number)
+DIR_TO_CLIENT = 1       # reply from the camera, as sent to the client
+DIR_LOCAL = 2           # reply generated by the relay (shaping, sequence reset)
+
+direction_names = {DIR_TO_CAMERA: '->cam', DIR_TO_CLIENT: '<-cam', DIR_LOCAL: '<-rly'}
+
+_file_header = struct.Struct('<8sHHIQdQ24x')
+_record_header = struct.Struct('<QBBH4sH4sH')
+_write_index = struct.Struct('<Q')
+_WRITE_INDEX_OFFSET = 16
+
+assert _file_header.size == 64
+assert _record_header.size + MAX_DATA == RECORD_SIZE
+
+
+class CaptureRing:
+    """ Writer for a capture ring file, from any thread """
+    def __init__(self, path: str, capacity: int = 16384):
+        self.path = path
+        self.capacity = capacity
+        size = _file_header.size + capacity * RECORD_SIZE
+        self.file = open(path, 'w+b')
+        self.file.truncate(size)
+        self.mm = mmap.mmap(self.file.fileno(), size)
+        # datagrams are copied into the map through a view, without an intermediate bytes object
+        self.view = memoryview(self.mm)
+        _file_header.pack_into(self.mm, 0, MAGIC, VERSION, RECORD_SIZE, capacity, 0,
+                               time.time(), time.monotonic_ns())
+        self.index = 0
+        self.closed = False
+        self.lock = threading.Lock()
+        # packed IPv4 addresses, so that inet_aton isn't called for every packet
+        self._packed: dict[str, bytes] = {}
+
+    def _pack_address(self, host: str) -> bytes:
+        packed = self._packed.get(host)
+        if packed is None:
+            try:
+                packed = socket.inet_aton(host)
+            except OSError:
+                packed = b'\0\0\0\0'
+            self._packed[host] = packed
+        return packed
+
+    def record(self, direction: int, relay_port: int, client, camera, data, nbytes: int):
+        """ Write one datagram to the ring. client and camera are (host, port) sockaddrs.
+            data is a memoryview (as the relay receives into), or bytes of length nbytes
+        """
+        mm = self.mm
+        if nbytes > MAX_DATA:
+            nbytes = MAX_DATA
+        with self.lock:
+            if self.closed:
+                return
+            offset = _file_header.size + (self.index % self.capacity) * RECORD_SIZE
+            _record_header.pack_into(mm, offset, time.monotonic_ns(), direction, nbytes, relay_port,
+                                     self._pack_address(client[0]), client[1],
+                                     self._pack_address(camera[0]) if camera else b'\0\0\0\0',
+                                     camera[1] if camera else 0)
+            start = offset + _record_header.size
+            self.view[start:start + nbytes] = data[:nbytes] if nbytes < len(data) else data
+            self.index += 1
+            _write_index.pack_into(mm, _WRITE_INDEX_OFFSET, self.index)
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self.view.release()
+            self.mm.flush()
+            self.mm.close()
+            self.file.close()
+
+
+class CaptureRecord:
+    __slots__ = ('time_ns', 'direction', 'relay_port', 'client', 'camera', 'data')
+
+    def __init__(self, time_ns, direction, relay_port, client, camera, data):
+        self.time_ns = time_ns
+        self.direction = direction
+        self.relay_port = relay_port
+        self.client = client
+        self.camera = camera
+        self.data = data
+
+    @property
+    def sequence(self) -> int:
+        return int.from_bytes(self.data[4:8], 'big') if len(self.data) >= 8 else 0
+
+    @property
+    def payload(self) -> bytes:
+        return self.data[8:]
+
+
+def read_capture(path: str) -> tuple[float, int, list[CaptureRecord]]:
+    """ Read a capture file
+        :return: (wall clock start time, monotonic start time (ns), records in time order)
+    """
+    with open(path, 'rb') as f:
+        contents = f.read()
+    magic, version, record_size, capacity, written, start_time, start_ns = \
+        _file_header.unpack_from(contents, 0)
+    if magic != MAGIC or version != VERSION or record_size != RECORD_SIZE:
+        raise ValueError(f'{path} is not a VISCA relay capture file')
+
+    first = max(0, written - capacity)
+    records = []
+    for i in range(first, written):
+        offset = _file_header.size + (i % capacity) * RECORD_SIZE
+        t, direction, nbytes, relay_port, client_ip, client_port, cam_ip, cam_port = \
+            _record_header.unpack_from(contents, offset)
+        start = offset + _record_header.size
+        records.append(CaptureRecord(t, direction, relay_port,
+                                     (socket.inet_ntoa(client_ip), client_port),
+                                     (socket.inet_ntoa(cam_ip), cam_port),
+                                     contents[start:start + nbytes]))
+    return start_time, start_ns, records
+
+
+# Decoding of common VISCA commands, longest prefix first
+_command_names = [
+    ('01 06 01', 'Pan/Tilt drive'),
+    ('01 06 02', 'Pan/Tilt absolute'),
+    ('01 06 03', 'Pan/Tilt relative'),
+    ('01 06 04', 'Pan/Tilt home'),
+    ('01 06 05', 'Pan/Tilt reset'),
+    ('01 04 07', 'Zoom'),
+    ('01 04 47', 'Zoom direct'),
+    ('01 04 08', 'Focus'),
+    ('01 04 38', 'Focus mode'),
+    ('01 04 18', 'Focus one push'),
+    ('01 04 3f 01', 'Preset set'),
+    ('01 04 3f 02', 'Preset recall'),
+    ('01 04 3f 00', 'Preset reset'),
+    ('01 04 35', 'White balance mode'),
+    ('01 04 10 05', 'White balance one push trigger'),
+    ('01 04 39', 'AE mode'),
+    ('01 04 0e', 'Exposure compensation'),
+    ('01 04 00', 'Power'),
+    ('01 00 01', 'Clear interface'),
+    ('09 06 12', 'Pan/Tilt position inquiry'),
+    ('09 04 47', 'Zoom position inquiry'),
+    ('09 04 38', 'Focus mode inquiry'),
+]
+_command_prefixes = [(bytes.fromhex(p), name) for p, name in
+                     sorted(_command_names, key=lambda x: -len(x[0]))]
+
+
+def describe(record: CaptureRecord) -> str:
+    """ Describe the VISCA payload of a record """
+    data = record.data
+    if len(data) < 8:
+        return 'short packet'
+    payload_type = int.from_bytes(data[0:2], 'big')
+    payload = record.payload
+    if payload_type == 0x0200:
+        return 'Sequence number reset'
+    if payload_type == 0x0201:
+        return 'Control reply'
+    if record.direction != DIR_TO_CAMERA:
+        if len(payload) >= 2:
+            status = payload[1] >> 4
+            if status == 4:
+                return 'ACK'
+            if status == 5:
+                return 'Completion' if len(payload) <= 3 else 'Inquiry reply'
+            if status == 6:
+                return {2: 'Error: syntax', 3: 'Error: buffer full', 4: 'Error: cancelled',
+                        5: 'Error: no socket', 0x41: 'Error: not executable'}.get(
+                    payload[2] if len(payload) > 2 else 0, 'Error')
+        return 'Reply'
+    if len(payload) == 3 and payload[1] & 0xf0 == 0x20:
+        return 'Cancel'
+    body = payload[1:]
+    for prefix, name in _command_prefixes:
+        if body.startswith(prefix):
+            if name == 'Pan/Tilt drive' and len(payload) == 9 and payload[6] == 3 and payload[7] == 3:
+                return 'Pan/Tilt stop'
+            if name in ('Zoom', 'Focus') and len(payload) == 6 and payload[4] == 0:
+                return name + ' stop'
+            if name in ('Preset recall', 'Preset set') and len(payload) > 5:
+                return f'{name} {payload[5] + 1}'
+            return name
+    return 'Command'
+
+
+def latency_stats(records: list[CaptureRecord]) -> dict:
+    """ Time from each command to its first reply (ACK) and to its Completion/Error, in ms """
+    sent = {}
+    ack = []
+    done = []
+    for r in records:
+        key = (r.relay_port, r.client, r.sequence)
+        if r.direction == DIR_TO_CAMERA:
+            sent[key] = [r.time_ns, False]
+        else:
+            entry = sent.get(key)
+            if entry is None or len(r.payload) < 2:
+                continue
+            elapsed = (r.time_ns - entry[0]) / 1e6
+            if not entry[1]:
+                ack.append(elapsed)
+                entry[1] = True
+            if r.payload[1] >> 4 in (5, 6):
+                done.append(elapsed)
+                del sent[key]
+
+    def summarize(samples):
+        if not samples:
+            return {'count': 0}
+        samples.sort()
+        return {'count': len(samples),
+                'p50_ms': round(samples[len(samples) // 2], 3),
+                'p90_ms': round(samples[int(len(samples) * 0.9)], 3),
+                'max_ms': round(samples[-1], 3)}
+
+    return {'commands': sum(1 for r in records if r.direction == DIR_TO_CAMERA),
+            'first_reply': summarize(ack),
+            'completion': summarize(done),
+            'unanswered': len(sent)}
+
+
+def replay(records: list[CaptureRecord], camera, speed: float = 1.0) -> dict:
+    """ Send the captured commands to a camera with their original timing (divided by speed)
+        :return: count of commands sent and replies received
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setblocking(False)
+    commands = [r for r in records if r.direction == DIR_TO_CAMERA]
+    replies = 0
+    if commands:
+        t0 = commands[0].time_ns
+        start = time.perf_counter()
+        for r in commands:
+            delay = (r.time_ns - t0) / 1e9 / speed - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+            sock.sendto(r.data, camera)
+            replies += _drain(sock)
+        time.sleep(0.2)
+        replies += _drain(sock)
+    sock.close()
+    return {'commands_sent': len(commands), 'replies': replies}
+
+
+def _drain(sock) -> int:
+    n = 0
+    while True:
+        try:
+            sock.recv(64)
+            n += 1
+        except (BlockingIOError, ConnectionResetError):
+            return n
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Decode, analyse or replay a VISCA relay capture')
+    parser.add_argument('command', choices=['decode', 'stats', 'replay'])
+    parser.add_argument('file')
+    parser.add_argument('--camera', help='host:port to replay to (default: a local simulated camera)')
+    parser.add_argument('--speed', type=float, default=1.0, help='replay speed multiplier')
+    args = parser.parse_args()
+
+    start_time, start_ns, records = read_capture(args.file)
+
+    if args.command == 'decode':
+        for r in records:
+            t = start_time + (r.time_ns - start_ns) / 1e9
+            stamp = time.strftime('%H:%M:%S', time.localtime(t)) + f'.{int(t * 1e6) % 1000000:06d}'
+            print(f'{stamp} :{r.relay_port} {direction_names.get(r.direction, "?")} '
+                  f'{r.client[0]}:{r.client[1]} cam {r.camera[0]}:{r.camera[1]} '
+                  f'seq {r.sequence:<6} {r.payload.hex(" "):<30} {describe(r)}')
+
+    elif args.command == 'stats':
+        stats = latency_stats(records)
+        print(f"{stats['commands']} commands, {stats['unanswered']} unanswered")
+        for name in ('first_reply', 'completion'):
+            print(f'{name}: {stats[name]}')
+
+    elif args.command == 'replay':
+        sim = None
+        if args.camera:
+            host, port = args.camera.rsplit(':', 1)
+            camera = (host, int(port))
+        else:
+            from visca_sim import SimCamera
+            sim = SimCamera()
+            camera = sim.address
+        result = replay(records, camera, args.speed)
+        print(f"sent {result['commands_sent']} commands to {camera[0]}:{camera[1]}, "
+              f"{result['replies']} replies")
+        if sim is not None:
+            print(f'simulated camera: {sim.num_commands} commands, position {sim.position()}, '
+                  f'preset {sim.preset}')
+            sim.close()
+
+
+if __name__ == '__main__':
+    main()
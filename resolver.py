@@ -0,0 +1,170 @@
+#
+# Cached host name resolution for cameras, the VISCA relay and Companion
+#
+# lookup() never blocks: it answers from the cache, and names that aren't cached (or whose
+# entry has expired) are resolved by background threads. An expired entry is still used
+# until the refresh completes, so a slow DNS or mDNS server never delays a command.
+# Failures are cached too (for a shorter time), so that an unresolvable name isn't looked
+# up again for every packet.
+#
+# Names are resolved ahead of time with prefetch() when the configuration is loaded or
+# changed. resolve() waits for a result, for use when configuring, not on the control path.
+#
+import ipaddress
+import queue
+import socket
+import threading
+import time
+import metrics
+
+TTL = 300.0             # seconds a resolved address is used before it is refreshed
+NEGATIVE_TTL = 10.0     # seconds a failure is remembered
+NUM_WORKERS = 2
+
+
+class _Entry:
+    __slots__ = ('address', 'expires', 'waiters')
+
+    def __init__(self):
+        self.address: str | None = None
+        self.expires = 0.0
+        self.waiters: list | None = None      # callbacks waiting for a resolution in progress
+
+
+class Resolver:
+    def __init__(self, resolve_func=socket.gethostbyname, ttl: float = TTL, negative_ttl: float = NEGATIVE_TTL):
+        """ :param resolve_func: blocking function returning the IPv4 address for a name,
+                raising OSError (or UnicodeError) if it can't be resolved
+        """
+        self.resolve_func = resolve_func
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.lock = threading.Lock()
+        self.cache: dict[str, _Entry] = {}
+        self.requests = queue.SimpleQueue()
+        self.workers: list[threading.Thread] = []
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+
+    def lookup(self, host: str, callback=None) -> str | None:
+        """ The address for host, from the cache. Never blocks.
+            :param callback: if the address isn't known yet, called with the address (or None
+                if it can't be resolved) from a resolver thread when the resolution completes
+            :return: the address, or None if it isn't known (yet)
+        """
+        entry = self.cache.get(host)
+        if entry is not None and entry.waiters is None:
+            if time.monotonic() < entry.expires:
+                self.hits += 1
+                return entry.address
+        return self._lookup(host, callback)[0]
+
+    def _lookup(self, host: str, callback) -> tuple[str | None, bool]:
+        """ lookup() from the cache under the lock
+            :return: (address, True if callback has been registered, i.e. a resolution is in
+                progress and the address isn't known yet)
+        """
+        with self.lock:
+            entry = self.cache.get(host)
+            if entry is None:
+                entry = _Entry()
+                literal = _literal(host)
+                if literal is not None:
+                    # IP address: no need to resolve, ever
+                    entry.address = literal
+                    entry.expires = float('inf')
+                    self.cache[host] = entry
+                    return literal, False
+                self.cache[host] = entry
+            if entry.waiters is None and time.monotonic() < entry.expires:
+                # including a failure that is still remembered
+                self.hits += 1
+                return entry.address, False
+            self.misses += 1
+            if entry.waiters is None:
+                entry.waiters = []
+                self._request(host)
+            if entry.address is None and callback is not None:
+                entry.waiters.append(callback)
+                return None, True
+            # a stale address is used while it is refreshed
+            return entry.address, False
+
+    def prefetch(self, hosts):
+        """ Start resolving names that aren't cached """
+        for host in hosts:
+            if host:
+                self.lookup(host)
+
+    def resolve(self, host: str, timeout: float = 5.0) -> str | None:
+        """ Wait (up to timeout seconds) for the address of host. Returns None at once if
+            the name has recently failed to resolve
+        """
+        done = threading.Event()
+        result = []
+
+        def resolved(address):
+            result.append(address)
+            done.set()
+
+        address, waiting = self._lookup(host, resolved)
+        if not waiting:
+            return address
+        done.wait(timeout)
+        return result[0] if result else None
+
+    def invalidate(self, host: str | None = None):
+        """ Forget one name, or all of them """
+        with self.lock:
+            if host is None:
+                self.cache = {h: e for h, e in self.cache.items() if e.waiters is not None}
+            elif host in self.cache and self.cache[host].waiters is None:
+                del self.cache[host]
+
+    def _request(self, host: str):
+        """ Called with the lock held """
+        self.requests.put(host)
+        if len(self.workers) < NUM_WORKERS:
+            worker = threading.Thread(target=self._worker, name=f'Resolver-{len(self.workers) + 1}')
+            worker.daemon = True
+            self.workers.append(worker)
+            worker.start()
+
+    def _worker(self):
+        while True:
+            host = self.requests.get()
+            try:
+                address = self.resolve_func(host)
+            except (OSError, UnicodeError):
+                address = None
+            now = time.monotonic()
+            with self.lock:
+                entry = self.cache.setdefault(host, _Entry())
+                waiters = entry.waiters or []
+                entry.waiters = None
+                if address is None:
+                    # keep using the previous address, if any, and try again later
+                    self.failures += 1
+                    entry.expires = now + self.negative_ttl
+                else:
+                    entry.address = address
+                    entry.expires = now + self.ttl
+            for callback in waiters:
+                callback(address)
+
+
+def _literal(host: str) -> str | None:
+    try:
+        return str(ipaddress.IPv4Address(host))
+    except ValueError:
+        return None
+
+
+shared = Resolver()
+
+metrics.register('resolver_lookups_total',
+                 lambda: {(('result', 'hit'),): shared.hits, (('result', 'miss'),): shared.misses},
+                 'counter', 'Host name lookups answered from the cache (hit) or needing resolution (miss)')
+metrics.register('resolver_failures_total', lambda: shared.failures,
+                 'counter', 'Host names that could not be resolved')
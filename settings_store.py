@@ -0,0 +1,119 @@
+#
+# Persistent settings, read once and written atomically
+#
+# The settings are kept in the JSON file PySimpleGUI uses for its user settings, so existing
+# settings are kept, but instead of rewriting the file for every entry set (as
+# Sg.user_settings_set_entry does) changes are collected and written together by commit():
+# to a temporary file in the same directory, which then replaces the settings file, so a
+# crash during a save leaves either the old or the new settings, never a mix.
+#
+# The file carries a schema version (SCHEMA_KEY), for converting the settings of older
+# versions of the program on load.
+#
+import json
+import os
+import tempfile
+import threading
+import PySimpleGUI as Sg
+from win_print import win_print
+
+SCHEMA_VERSION = 1
+SCHEMA_KEY = '-schema-version-'
+
+
+class SettingsStore:
+    def __init__(self, path: str | None = None):
+        """ :param path: settings file, None for PySimpleGUI's default user settings file """
+        self.path = path
+        self.values: dict = {}
+        self.dirty = False
+        self.loaded = False
+        self.lock = threading.Lock()
+        self.stats = {'reads': 0, 'writes': 0}
+
+    def _path(self) -> str:
+        if self.path is None:
+            self.path = Sg.user_settings_filename()
+        return self.path
+
+    def load(self):
+        """ Read all the settings """
+        path = self._path()
+        values = {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                values = json.load(f)
+            self.stats['reads'] += 1
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as exc:
+            # keep the damaged file for inspection, and start from the defaults
+            win_print(f'Settings file {path} could not be read ({exc}), using defaults')
+            try:
+                os.replace(path, path + '.bad')
+            except OSError:
+                pass
+        if not isinstance(values, dict):
+            values = {}
+        with self.lock:
+            self.values = _upgrade(values)
+            self.dirty = values.get(SCHEMA_KEY) != SCHEMA_VERSION and bool(values)
+            self.loaded = True
+
+    def get(self, key: str, default=None):
+        if not self.loaded:
+            self.load()
+        return self.values.get(key, default)
+
+    def set(self, key: str, value):
+        """ Change a setting, written by the next commit() """
+        if not self.loaded:
+            self.load()
+        with self.lock:
+            if key not in self.values or self.values[key] != value:
+                self.values[key] = value
+                self.dirty = True
+
+    def commit(self):
+        """ Write the settings, if any have changed, in one atomic replacement of the file """
+        with self.lock:
+            if not self.dirty:
+                return
+            values = dict(self.values, **{SCHEMA_KEY: SCHEMA_VERSION})
+            write_json(self._path(), values)
+            self.values = values
+            self.dirty = False
+            self.stats['writes'] += 1
+
+
+def write_json(path: str, values):
+    """ Write values to a JSON file atomically: to a temporary file in the same directory,
+        which then replaces the file
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp = tempfile.mkstemp(prefix='.settings-', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(values, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, path)
+    except BaseException:
+        try:
+            os.remove(temp)
+        except OSError:
+            pass
+        raise
+
+
+def _upgrade(values: dict) -> dict:
+    """ Convert settings written by an older version of the program """
+    version = values.get(SCHEMA_KEY, 0)
+    if version < 1:
+        # version 0: written entry by entry by PySimpleGUI, same keys
+        pass
+    return values
+
+
+shared = SettingsStore()
@@ -0,0 +1,232 @@
+#
+# Show files: the settings for one venue (or rig) in one JSON file, to switch between venues
+# without re-entering them in the configuration dialog
+#
+# A show file holds the cameras (number, name, address and speed profile), the speed
+# profiles, the controller preferences, the Companion and OSC feedback settings and the
+# VISCA relay settings. The program's own preferences (debug, trace, metrics port) and the
+# window position aren't part of a show. Sections missing from a show file leave those
+# settings as they are. A camera can use a speed profile of the show file, or Default.
+#
+# A file is read and checked against SCHEMA (a subset of JSON Schema, checked here so no
+# other package is needed) in one pass, and its speed profiles compiled, before any
+# setting is changed: a file with any problem changes nothing.
+#
+# Example:
+#   {
+#     "format": "visca-game-controller-show", "version": 1, "name": "Main hall",
+#     "cameras": [{"number": 1, "name": "Pulpit", "host": "10.0.0.21", "port": 52381, "profile": "P100"}],
+#     "profiles": {"P100": {"speeds": {"pan": "1,2,4,8,12,16"}, "max_speeds": {"pan": 18}}},
+#     "companion": {"page": 99, "host": "10.0.0.5"}
+#   }
+#
+import json
+from collections import Counter
+from camera_profiles import BREAKPOINTS, COMMANDS, DEFAULT as DEFAULT_PROFILE, CameraProfile
+from camera_registry import DEFAULT_PORT, MAX_CAMS
+import settings_store
+
+FORMAT = 'visca-game-controller-show'
+VERSION = 1
+
+_number = ['integer', 'number']
+
+_PROFILE = {
+    'type': 'object',
+    'additionalProperties': False,
+    'properties': {
+        'speeds': {'type': 'object', 'additionalProperties': False,
+                   'properties': {kind: {'type': 'string'} for kind in BREAKPOINTS}},
+        'max_speeds': {'type': 'object', 'additionalProperties': False,
+                       'properties': {kind: {'type': 'integer', 'minimum': 1} for kind in BREAKPOINTS}},
+        'reverse_pan': {'type': 'boolean'},
+        'reverse_tilt': {'type': 'boolean'},
+        'commands': {'type': 'array', 'items': {'enum': list(COMMANDS)}},
+    },
+}
+
+SCHEMA = {
+    'type': 'object',
+    'required': ['format', 'version'],
+    'additionalProperties': False,
+    'properties': {
+        'format': {'const': FORMAT},
+        'version': {'type': 'integer', 'minimum': 1, 'maximum': VERSION},
+        'name': {'type': 'string'},
+        'cameras': {
+            'type': 'array', 'minItems': 1, 'maxItems': MAX_CAMS,
+            'items': {
+                'type': 'object',
+                'required': ['number'],
+                'additionalProperties': False,
+                'properties': {
+                    'number': {'type': 'integer', 'minimum': 1, 'maximum': MAX_CAMS},
+                    'name': {'type': 'string'},
+                    'host': {'type': 'string'},
+                    'port': {'type': 'integer', 'minimum': 1, 'maximum': 65535},
+                    'profile': {'type': 'string'},
+                },
+            },
+        },
+        'bank_size': {'type': 'integer', 'minimum': 1},
+        'profiles': {'type': 'object', 'additionalProperties': _PROFILE},
+        'controller': {
+            'type': 'object',
+            'additionalProperties': False,
+            'properties': {
+                'long_press_time': {'type': _number, 'minimum': 0},
+                'dead_zone': {'type': _number + ['null'], 'minimum': 0, 'maximum': 1},
+                'invert_tilt': {'type': 'boolean'},
+                'swap_pan': {'type': 'boolean'},
+            },
+        },
+        'companion': {
+            'type': 'object',
+            'additionalProperties': False,
+            'properties': {
+                'page': {'type': 'integer', 'minimum': 0},
+                'host': {'type': 'string'},
+                'backup_host': {'type': 'string'},
+                'tcp': {'type': 'boolean'},
+                'tbar_rate': {'type': _number, 'minimum': 0},
+            },
+        },
+        'osc_feedback': {'type': 'string'},
+        'relay': {
+            'type': 'object',
+            'additionalProperties': False,
+            'properties': {
+                'shaping': {'type': 'boolean'},
+                'rate_limit': {'type': _number, 'minimum': 0},
+            },
+        },
+    },
+}
+
+_TYPES = {'object': dict, 'array': list, 'string': str, 'boolean': bool, 'null': type(None)}
+
+
+class ShowFileError(ValueError):
+    def __init__(self, path: str, problems: list[str]):
+        self.path = path
+        self.problems = problems
+        super().__init__(f'{path}: ' + '; '.join(problems))
+
+
+def _is_type(value, name: str) -> bool:
+    if name == 'integer':
+        return isinstance(value, int) and not isinstance(value, bool)
+    if name == 'number':
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    return isinstance(value, _TYPES[name])
+
+
+def _check(value, schema: dict, where: str, problems: list):
+    """ Check value against a schema, adding a description of each problem to problems """
+    if 'const' in schema and value != schema['const']:
+        problems.append(f'{where} must be {schema["const"]!r}')
+        return
+    if 'enum' in schema and value not in schema['enum']:
+        problems.append(f'{where} must be one of {", ".join(map(str, schema["enum"]))}')
+        return
+    types = schema.get('type')
+    if types is not None:
+        types = [types] if isinstance(types, str) else types
+        if not any(_is_type(value, t) for t in types):
+            problems.append(f'{where} must be of type {" or ".join(types)}')
+            return
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        if 'minimum' in schema and value < schema['minimum']:
+            problems.append(f'{where} must be at least {schema["minimum"]}')
+        if 'maximum' in schema and value > schema['maximum']:
+            problems.append(f'{where} must be at most {schema["maximum"]}')
+    if isinstance(value, dict):
+        for key in schema.get('required', ()):
+            if key not in value:
+                problems.append(f'{where}.{key} is missing')
+        properties = schema.get('properties', {})
+        extra = schema.get('additionalProperties', True)
+        for key, item in value.items():
+            if key in properties:
+                _check(item, properties[key], f'{where}.{key}', problems)
+            elif extra is False:
+                problems.append(f'{where}.{key} is not a show file setting')
+            elif isinstance(extra, dict):
+                _check(item, extra, f'{where}.{key}', problems)
+    if isinstance(value, list):
+        if len(value) < schema.get('minItems', 0):
+            problems.append(f'{where} must have at least {schema["minItems"]} entries')
+        if len(value) > schema.get('maxItems', len(value)):
+            problems.append(f'{where} must have at most {schema["maxItems"]} entries')
+        items = schema.get('items')
+        if items is not None:
+            for i, item in enumerate(value):
+                _check(item, items, f'{where}[{i}]', problems)
+
+
+def validate(show) -> list[str]:
+    """ The problems with a show file's contents (none if it can be used) """
+    problems = []
+    _check(show, SCHEMA, 'show', problems)
+    if problems:
+        return problems
+    numbers = Counter(camera['number'] for camera in show.get('cameras', ()))
+    duplicates = sorted(n for n, count in numbers.items() if count > 1)
+    if duplicates:
+        problems.append(f'show.cameras: camera {", ".join(map(str, duplicates))} appears more than once')
+    profiles = set(show.get('profiles', {})) | {DEFAULT_PROFILE}
+    for i, camera in enumerate(show.get('cameras', ())):
+        if camera.get('profile', DEFAULT_PROFILE) not in profiles:
+            problems.append(f'show.cameras[{i}].profile: there is no speed profile {camera["profile"]!r}')
+    return problems
+
+
+def parse(show, path: str = 'show') -> dict:
+    """ A show file's contents, checked, with its speed profiles compiled (CameraProfile)
+        :raises ShowFileError: if there is any problem with it
+    """
+    problems = validate(show)
+    profiles = {}
+    if not problems:
+        for name, values in show.get('profiles', {}).items():
+            try:
+                profiles[name] = CameraProfile.from_dict(name, values)
+            except ValueError as exc:
+                problems.append(f'show.profiles: {exc}')
+    if problems:
+        raise ShowFileError(path, problems)
+    show = dict(show)
+    if 'profiles' in show:
+        show['profiles'] = profiles
+    if 'cameras' in show:
+        show['cameras'] = [dict({'name': f'Camera {camera["number"]}', 'host': '', 'port': DEFAULT_PORT,
+                                 'profile': DEFAULT_PROFILE}, **camera)
+                           for camera in show['cameras']]
+    return show
+
+
+def read(path: str) -> dict:
+    """ Read a show file (see parse())
+        :raises ShowFileError: if it can't be read or there is a problem with it
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            show = json.load(f)
+    except OSError as exc:
+        raise ShowFileError(path, [exc.strerror or str(exc)])
+    except ValueError as exc:
+        raise ShowFileError(path, [f'not a JSON file ({exc})'])
+    return parse(show, path)
+
+
+def write(path: str, show: dict, name: str = ''):
+    """ Write a show file. show holds the sections, with CameraProfile speed profiles
+        :raises OSError: if it can't be written
+    """
+    contents = {'format': FORMAT, 'version': VERSION}
+    if name:
+        contents['name'] = name
+    contents.update(show)
+    if 'profiles' in show:
+        contents['profiles'] = {profile.name: profile.to_dict() for profile in show['profiles'].values()}
+    settings_store.write_json(path, contents)
@@ -0,0 +1,127 @@
+#
+# Control path tracing
+#
+# Records spans and instant events into an in-memory ring, and exports them as Chrome
+# trace_event JSON, which can be opened in Perfetto (https://ui.perfetto.dev) or
+# chrome://tracing to see what delayed a command during a live show.
+#
+# Tracing is gated by the module level 'enabled' flag. When disabled, span() returns a
+# shared do-nothing context manager (also available as null_span) and instant() returns immediately.
+#
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+
+enabled = False
+
+RING_SIZE = 50000
+
+# (phase, name, category, timestamp us, duration us, thread id, args)
+_ring: deque = deque(maxlen=RING_SIZE)
+_pid = os.getpid()
+
+
+def now_us() -> int:
+    return time.perf_counter_ns() // 1000
+
+
+class _Span:
+    __slots__ = ('name', 'cat', 'args', 't0')
+
+    def __init__(self, name, cat, args):
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.t0 = now_us()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args = dict(self.args or {}, exception=exc_type.__name__)
+        t1 = now_us()
+        _ring.append(('X', self.name, self.cat, self.t0, t1 - self.t0, threading.get_ident(), self.args))
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+# for callers that check 'enabled' themselves, to avoid building a span's name and args
+null_span = _NullSpan()
+
+
+def span(name: str, cat: str, args: dict | None = None):
+    """ Context manager recording a complete event for the enclosed code """
+    if not enabled:
+        return null_span
+    return _Span(name, cat, args)
+
+
+def complete(name: str, cat: str, t0_us: int, t1_us: int, args: dict | None = None):
+    """ Record a complete event with known start and end times """
+    if enabled:
+        _ring.append(('X', name, cat, t0_us, t1_us - t0_us, threading.get_ident(), args))
+
+
+def instant(name: str, cat: str, args: dict | None = None):
+    """ Record an instant event """
+    if enabled:
+        _ring.append(('i', name, cat, now_us(), 0, threading.get_ident(), args))
+
+
+def clear():
+    _ring.clear()
+
+
+def trace_events() -> list[dict]:
+    events = list(_ring)   # atomic copy
+    thread_names = {t.ident: t.name for t in threading.enumerate()}
+    result = [{'ph': 'M', 'name': 'process_name', 'pid': _pid, 'tid': 0,
+               'args': {'name': 'VISCA Game Controller'}}]
+    for tid in {e[5] for e in events}:
+        result.append({'ph': 'M', 'name': 'thread_name', 'pid': _pid, 'tid': tid,
+                       'args': {'name': thread_names.get(tid, str(tid))}})
+    for ph, name, cat, ts, dur, tid, args in events:
+        e = {'ph': ph, 'name': name, 'cat': cat, 'ts': ts, 'pid': _pid, 'tid': tid}
+        if ph == 'X':
+            e['dur'] = dur
+        else:
+            e['s'] = 't'
+        if args:
+            e['args'] = args
+        result.append(e)
+    return result
+
+
+def export(path: str) -> int:
+    """ Write the ring to a Chrome trace_event JSON file. Returns the number of events """
+    events = trace_events()
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+    return len(events)
+
+
+def default_export_path(name: str | None = None) -> str:
+    """ The path to export to, in the home folder
+        :param name: a file name (.json is added if it doesn't end with it), or None for a timestamped name
+        :raises ValueError: if name isn't a plain file name
+    """
+    if name is None:
+        name = f'visca-trace-{time.strftime("%Y%m%d-%H%M%S")}.json'
+    elif not re.fullmatch(r'\w[\w.-]*', name):
+        raise ValueError(f'{name!r} is not a plain file name')
+    elif not name.endswith('.json'):
+        name += '.json'
+    return os.path.join(os.path.expanduser('~'), name)
@@ -0,0 +1,143 @@
+#
+# Virtual game controllers, for load tests and development without a physical gamepad
+#
+# A VirtualJoystick has the methods of pygame.joystick.Joystick that the controller code
+# uses (name, counts of axes, buttons and hats, and their state), so a Controller set up
+# with one works as with a real gamepad. Its controls are moved by the program: each change
+# sets the control's state and returns the pygame event a real joystick would produce, for
+# the caller to post or to pass to the event handling.
+#
+# VirtualJoysticks holds the attached virtual joysticks. Their device indexes and instance
+# ids start at FIRST_DEVICE, clear of those of real joysticks, and its open() can be given
+# to ControllerList in place of pygame.joystick.Joystick: it opens the virtual joystick at
+# a device index, or the real one.
+#
+import threading
+import pygame
+
+FIRST_DEVICE = 1000
+
+
+class VirtualJoystick:
+    def __init__(self, device_index: int, instance_id: int, name: str = 'Virtual gamepad',
+                 axes: int = 6, buttons: int = 12, hats: int = 1):
+        """ :param name: the joystick name, which selects the controller map (see controller_map):
+                any name not in CONTROLLER_MAP.json is a gamepad with the default map
+        """
+        self.device_index = device_index
+        self.instance_id = instance_id
+        self.name = name
+        self.axes = [0.0] * axes
+        self.buttons = [False] * buttons
+        self.hats = [(0, 0)] * hats
+        self.initialized = True
+
+    # pygame.joystick.Joystick
+
+    def init(self):
+        self.initialized = True
+
+    def quit(self):
+        self.initialized = False
+
+    def get_init(self) -> bool:
+        return self.initialized
+
+    def get_id(self) -> int:
+        return self.device_index
+
+    def get_instance_id(self) -> int:
+        return self.instance_id
+
+    def get_guid(self) -> str:
+        return f'virtual{self.instance_id:025d}'
+
+    def get_power_level(self) -> str:
+        return 'wired'
+
+    def get_name(self) -> str:
+        return self.name
+
+    def get_numaxes(self) -> int:
+        return len(self.axes)
+
+    def get_axis(self, axis: int) -> float:
+        return self.axes[axis]
+
+    def get_numballs(self) -> int:
+        return 0
+
+    def get_numbuttons(self) -> int:
+        return len(self.buttons)
+
+    def get_button(self, button: int) -> bool:
+        return self.buttons[button]
+
+    def get_numhats(self) -> int:
+        return len(self.hats)
+
+    def get_hat(self, hat: int) -> tuple[int, int]:
+        return self.hats[hat]
+
+    def rumble(self, _low_frequency: float, _high_frequency: float, _duration: int) -> bool:
+        return False
+
+    def stop_rumble(self):
+        pass
+
+    # moving the controls
+
+    def move_axis(self, axis: int, value: float) -> pygame.event.Event:
+        """ Move an axis to value (-1 to 1) """
+        value = max(-1.0, min(1.0, float(value)))
+        self.axes[axis] = value
+        return pygame.event.Event(pygame.JOYAXISMOTION, instance_id=self.instance_id, axis=axis, value=value)
+
+    def press(self, button: int) -> pygame.event.Event:
+        self.buttons[button] = True
+        return pygame.event.Event(pygame.JOYBUTTONDOWN, instance_id=self.instance_id, button=button)
+
+    def release(self, button: int) -> pygame.event.Event:
+        self.buttons[button] = False
+        return pygame.event.Event(pygame.JOYBUTTONUP, instance_id=self.instance_id, button=button)
+
+    def move_hat(self, hat: int, value: tuple[int, int]) -> pygame.event.Event:
+        """ Move a hat to value: (x, y), each -1, 0 or 1 """
+        value = (int(value[0]), int(value[1]))
+        self.hats[hat] = value
+        return pygame.event.Event(pygame.JOYHATMOTION, instance_id=self.instance_id, hat=hat, value=value)
+
+
+class VirtualJoysticks:
+    def __init__(self):
+        self.devices: dict[int, VirtualJoystick] = {}   # by device index
+        self.next_device = FIRST_DEVICE
+        self.lock = threading.Lock()
+
+    def attach(self, name: str = 'Virtual gamepad', axes: int = 6, buttons: int = 12,
+               hats: int = 1) -> tuple[VirtualJoystick, pygame.event.Event]:
+        """ Attach a virtual joystick
+            :return: the joystick, and the JOYDEVICEADDED event announcing it
+        """
+        with self.lock:
+            index = self.next_device
+            self.next_device += 1
+            joystick = VirtualJoystick(index, index, name, axes, buttons, hats)
+            self.devices[index] = joystick
+        return joystick, pygame.event.Event(pygame.JOYDEVICEADDED, device_index=index)
+
+    def detach(self, joystick: VirtualJoystick) -> pygame.event.Event:
+        """ Detach a virtual joystick
+            :return: the JOYDEVICEREMOVED event announcing it
+        """
+        with self.lock:
+            self.devices.pop(joystick.device_index, None)
+        joystick.quit()
+        return pygame.event.Event(pygame.JOYDEVICEREMOVED, instance_id=joystick.instance_id)
+
+    def open(self, device_index: int):
+        """ The joystick at a device index: a virtual one, or else pygame's """
+        joystick = self.devices.get(device_index)
+        if joystick is not None:
+            return joystick
+        return pygame.joystick.Joystick(device_index)
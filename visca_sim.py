@@ -0,0 +1,128 @@
+#
+# Simulated VISCA over IP camera, for benchmarks and development without hardware
+#
+# Answers commands with ACK + Completion, inquiries with a completion carrying a
+# (simulated) value, and control messages (sequence number reset) with a control reply.
+# Pan/tilt/zoom drive commands are integrated over time so that the final position can
+# be checked after a stream of commands.
+#
+import socket
+import threading
+import time
+
+
+class SimCamera:
+    def __init__(self, port: int = 0, host='127.0.0.1', reply_delay: float = 0.0):
+        """ :param port: UDP port to listen on, 0 to pick a free one
+            :param reply_delay: seconds to wait before replying, to simulate a slow camera
+        """
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self.address = self.sock.getsockname()
+        self.reply_delay = reply_delay
+        self.running = True
+
+        self.num_commands = 0
+        self.num_inquiries = 0
+        self.num_resets = 0
+        self.last_sequence = 0
+        # (time.perf_counter(), sender address, VISCA payload) for every packet received
+        self.log: list[tuple[float, tuple, bytes]] = []
+        self.log_enabled = False
+
+        # simulated state
+        self.pan_speed = 0
+        self.tilt_speed = 0
+        self.zoom_speed = 0
+        self.pan = 0.0
+        self.tilt = 0.0
+        self.zoom = 0.0
+        self.preset = None
+        self._moved_at = time.perf_counter()
+
+        self.thread = threading.Thread(target=self.serve, name=f'SimCamera:{self.address[1]}')
+        self.thread.daemon = True
+        self.thread.start()
+
+    @property
+    def port(self) -> int:
+        return self.address[1]
+
+    def close(self):
+        self.running = False
+        try:
+            # wake up the receive
+            self.sock.sendto(b'', self.address)
+        except OSError:
+            pass
+        self.thread.join()
+        self.sock.close()
+
+    def _integrate(self):
+        now = time.perf_counter()
+        dt = now - self._moved_at
+        self._moved_at = now
+        self.pan += self.pan_speed * dt
+        self.tilt += self.tilt_speed * dt
+        self.zoom += self.zoom_speed * dt
+
+    def _command(self, payload: bytes):
+        """ Update the simulated state from a VISCA command (81 01 ... FF) """
+        body = payload[2:-1]
+        if body[:2] == b'\x06\x01' and len(body) == 6:
+            self._integrate()
+            direction = {1: -1, 2: 1, 3: 0}
+            self.pan_speed = body[2] * direction.get(body[4], 0)
+            self.tilt_speed = body[3] * direction.get(body[5], 0)
+        elif body[:2] == b'\x04\x07' and len(body) == 3:
+            self._integrate()
+            direction = {0: 0, 2: 1, 3: -1}
+            self.zoom_speed = (body[2] & 0x0f) * direction.get(body[2] >> 4, 0)
+        elif body[:3] == b'\x04\x3f\x02' and len(body) == 4:
+            self.preset = body[3]
+
+    def serve(self):
+        s = self.sock
+        while self.running:
+            try:
+                packet, address = s.recvfrom(2048)
+            except OSError:
+                break
+            if not self.running:
+                break
+            if len(packet) < 9:
+                continue
+            now = time.perf_counter()
+            payload_type = packet[0:2]
+            sequence = packet[4:8]
+            payload = packet[8:]
+            self.last_sequence = int.from_bytes(sequence, 'big')
+            if self.log_enabled:
+                self.log.append((now, address, bytes(payload)))
+            if self.reply_delay:
+                time.sleep(self.reply_delay)
+
+            try:
+                if payload_type == b'\x02\x00':
+                    # control command: reset sequence number
+                    self.num_resets += 1
+                    s.sendto(b'\x02\x01\x00\x01' + sequence + b'\x01', address)
+                elif payload_type == b'\x01\x10':
+                    # inquiry: answer with a completion carrying zeroes
+                    self.num_inquiries += 1
+                    reply = b'\x90\x50' + b'\x00' * 8 + b'\xff'
+                    s.sendto(b'\x01\x11' + len(reply).to_bytes(2, 'big') + sequence + reply, address)
+                else:
+                    self.num_commands += 1
+                    self._command(payload)
+                    ack = b'\x90\x41\xff'
+                    completion = b'\x90\x51\xff'
+                    s.sendto(b'\x01\x11\x00\x03' + sequence + ack, address)
+                    s.sendto(b'\x01\x11\x00\x03' + sequence + completion, address)
+            except OSError:
+                pass
+
+    def position(self) -> tuple[float, float, float]:
+        """ Current simulated (pan, tilt, zoom) """
+        self._integrate()
+        return self.pan, self.tilt, self.zoom
@@ -0,0 +1,189 @@
+#
+# Shared UDP transport for VISCA over IP cameras
+#
+# Rather than each Camera binding its own socket and blocking on it, all cameras send from
+# a small pool of shared sockets. A single I/O thread waits on all of them and hands each
+# reply to the channel of the camera it came from (by source address), so the number of
+# sockets and threads stays the same however many cameras are configured.
+#
+# A socket can only have one channel per camera address, as replies are told apart by
+# source address. A second channel to the same camera (e.g. while a connection is being
+# replaced) uses the next socket of the pool, which is extended if needed.
+#
+import queue
+import selectors
+import socket
+import threading
+import metrics
+import resolver
+
+RECV_BATCH = 64         # maximum datagrams handled per wakeup, per socket
+RECV_BUFSIZE = 2048
+RESOLVE_TIMEOUT = 2.0   # seconds a new channel waits for the camera's name to be resolved
+
+
+class Channel:
+    """ The connection to one camera: send() from the caller's thread, replies are queued by
+        the I/O thread and read with recv()
+    """
+    def __init__(self, transport: 'ViscaTransport', sock: socket.socket, host: str, sockaddr):
+        self.transport = transport
+        self.sock = sock
+        self.host = host
+        self.sockaddr = sockaddr
+        self.replies = queue.SimpleQueue()
+        self.local_port = sock.getsockname()[1]
+
+    def send(self, message) -> bool:
+        address = resolver.shared.lookup(self.host)
+        if address is not None and address != self.sockaddr[0]:
+            # the camera's name now resolves to another address
+            self.transport.move(self, (address, self.sockaddr[1]))
+        self.sock.sendto(message, self.sockaddr)
+        return True
+
+    def recv(self, timeout: float) -> bytes:
+        """ Wait for the next reply
+            :raises socket.timeout: if there is no reply within timeout seconds
+        """
+        try:
+            return self.replies.get(timeout=timeout)
+        except queue.Empty:
+            raise socket.timeout('timed out') from None
+
+    def close(self):
+        self.transport.release(self)
+
+
+class ViscaTransport:
+    def __init__(self, num_sockets: int = 1):
+        """ :param num_sockets: sockets opened up front; more are added for duplicate channels """
+        self.lock = threading.Lock()
+        # per socket: {camera sockaddr: channel}
+        self.channels: dict[socket.socket, dict[tuple, Channel]] = {}
+        self.unrouted = 0
+        self.selector = selectors.DefaultSelector()
+        self._wakeup_recv, self._wakeup_send = socket.socketpair()
+        self._wakeup_recv.setblocking(False)
+        self.selector.register(self._wakeup_recv, selectors.EVENT_READ, None)
+        for _ in range(num_sockets):
+            self._add_socket()
+
+        metrics.register('visca_transport_channels', self.num_channels,
+                         'gauge', 'Camera connections on the shared VISCA transport')
+        metrics.register('visca_transport_sockets', lambda: len(self.channels),
+                         'gauge', 'Sockets of the shared VISCA transport')
+        metrics.register('visca_transport_unrouted_total', lambda: self.unrouted,
+                         'counter', 'Datagrams received from an address with no camera connection')
+
+        self.running = True
+        self.thread = threading.Thread(target=self.iothread, name='ViscaTransport')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _add_socket(self) -> socket.socket:
+        """ Called with the lock held (or before the I/O thread is started) """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(('', 0))
+        sock.setblocking(False)
+        self.channels[sock] = {}
+        self.selector.register(sock, selectors.EVENT_READ, sock)
+        return sock
+
+    def channel(self, host: str, port: int) -> Channel:
+        """ Open a channel to the camera at (host, port). Called when connecting to a camera, so
+            it waits (up to RESOLVE_TIMEOUT) for the name to be resolved if it isn't cached yet
+            :raises socket.gaierror: if the address of host can't be resolved, see resolver.py
+        """
+        address = resolver.shared.resolve(host, timeout=RESOLVE_TIMEOUT)
+        if address is None:
+            raise socket.gaierror(socket.EAI_AGAIN, f'{host} not resolved')
+        sockaddr = (address, port)
+        with self.lock:
+            channel = Channel(self, self._socket_for(sockaddr), host, sockaddr)
+            self.channels[channel.sock][sockaddr] = channel
+        return channel
+
+    def _socket_for(self, sockaddr) -> socket.socket:
+        """ A socket with no channel for sockaddr, called with the lock held """
+        for sock, channels in self.channels.items():
+            if sockaddr not in channels:
+                return sock
+        sock = self._add_socket()
+        # so that the I/O thread selects on the new socket
+        self._wakeup_send.send(b'\0')
+        return sock
+
+    def move(self, channel: Channel, sockaddr):
+        """ Change the address of a channel """
+        with self.lock:
+            channels = self.channels.get(channel.sock)
+            if channels is not None and channels.get(channel.sockaddr) is channel:
+                del channels[channel.sockaddr]
+            channel.sock = self._socket_for(sockaddr)
+            channel.sockaddr = sockaddr
+            self.channels[channel.sock][sockaddr] = channel
+
+    def release(self, channel: Channel):
+        with self.lock:
+            channels = self.channels.get(channel.sock)
+            if channels is not None and channels.get(channel.sockaddr) is channel:
+                del channels[channel.sockaddr]
+
+    def num_channels(self) -> int:
+        return sum(len(c) for c in self.channels.values())
+
+    def iothread(self):
+        buffer = bytearray(RECV_BUFSIZE)
+        view = memoryview(buffer)
+        while self.running:
+            for key, _mask in self.selector.select():
+                sock = key.data
+                if sock is None:
+                    try:
+                        self._wakeup_recv.recv(64)
+                    except OSError:
+                        pass
+                    continue
+                channels = self.channels[sock]
+                for _ in range(RECV_BATCH):
+                    try:
+                        nbytes, address = sock.recvfrom_into(buffer)
+                    except (BlockingIOError, InterruptedError):
+                        break
+                    except ConnectionResetError:
+                        # ICMP port unreachable from a previous send, on Windows
+                        continue
+                    except OSError:
+                        break
+                    channel = channels.get(address)
+                    if channel is None:
+                        self.unrouted += 1
+                        continue
+                    channel.replies.put(bytes(view[:nbytes]))
+
+    def close(self):
+        self.running = False
+        try:
+            self._wakeup_send.send(b'\0')
+        except OSError:
+            pass
+        self.thread.join()
+        self.selector.close()
+        for sock in self.channels:
+            sock.close()
+        self._wakeup_send.close()
+        self._wakeup_recv.close()
+
+
+_transport: ViscaTransport | None = None
+_transport_lock = threading.Lock()
+
+
+def shared_transport() -> ViscaTransport:
+    """ The transport used by all Cameras, started on first use """
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            _transport = ViscaTransport()
+        return _transport
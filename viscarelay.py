@@ -1,54 +1,708 @@
 #
 # Code to handle Relaying VISCA packets to the camera
 #
+# The relay listens on:
+# - the "current camera" port (default 10000), which forwards to whichever camera is selected
+# - one port per configured camera (current camera port + camera number, i.e. 10001-10008 by
+#   default, matching the NDI Camera Selector convention), which always forward to that camera
 #
+# Several controllers (e.g. Companion and another control surface) can send through each
+# port at the same time. Like a NAT, each port rewrites each command's VISCA sequence
+# number into a single camera side sequence space, and uses the camera side sequence number
+# of each ACK, Completion or Error to route it back to the client that sent the command,
+# with the client's own sequence number restored.
+#
+# All ports are served by a single selector loop on one thread. Each wakeup drains every
+# datagram waiting on a socket (up to RELAY_BATCH) into a preallocated buffer, and forwards
+# it from a memoryview of that buffer, so there is no polling delay and no per packet copy.
+#
+# A Camera in this process that addresses one of the relay's ports on the loopback doesn't
+# need to go through the kernel: it gets a LocalClient, which routes commands on the
+# caller's thread and receives its replies from the relay thread through a queue.
+#
+import queue
+import selectors
 import socket
-import threading
 import struct
+import threading
 import time
+import metrics
+import resolver
+import tracing
+from relaycapture import CaptureRing, DIR_TO_CAMERA, DIR_TO_CLIENT, DIR_LOCAL
+
+RELAY_BATCH = 64        # maximum datagrams handled per wakeup, per socket
+RELAY_BUFSIZE = 2048    # VISCA over IP packets are at most 24 bytes, but allow for anything
+MAX_PENDING = 256       # outstanding commands remembered for reply routing, per port
+SEQUENCE_NUM_MAX = 2 ** 32 - 1
+
+# VISCA over IP payload types
+VISCA_CONTROL_COMMAND = 0x0200
+VISCA_CONTROL_REPLY = 0x0201
+
+_header = struct.Struct('>HHI')     # payload type, payload length, sequence number
+_reset_command = bytes.fromhex('02 00 00 01 00 00 00 01 01')
+
+# Relay ports owned by this process, by port number, for the in-process fast path
+_local_ports: dict[int, 'RelayPort'] = {}
+fast_path = True
+# Relay ports by the camera they forward to (ptz sockaddr), see forget_drives()
+_ports_to: dict[tuple, tuple['RelayPort', ...]] = {}
+_ports_to_lock = threading.Lock()
+
+
+class RelayClient:
+    """ Per client state and statistics """
+    __slots__ = ('address', 'packets_sent', 'packets_received', 'last_seen')
+
+    def __init__(self, address):
+        self.address = address
+        self.packets_sent = 0        # controller -> camera
+        self.packets_received = 0    # camera -> controller
+        self.last_seen = 0.0
+
+
+# Shaper command classes
+SHAPE_PRIORITY = 0      # stop and cancel commands, sent ahead of everything else
+SHAPE_DRIVE = 1         # pan/tilt, zoom and focus drive commands
+SHAPE_OTHER = 2         # everything else, forwarded in order
+
+COLLAPSE_WINDOW = 0.25  # seconds within which a repeated drive command is collapsed
+
+
+def classify(packet) -> tuple[int, str | None]:
+    """ Classify a VISCA over IP command packet for shaping
+        :return: (class, kind) where kind is 'pantilt', 'zoom', 'focus' for drive and stop commands
+    """
+    if len(packet) < _header.size + 3 or packet[0] != 0x01 or packet[1] != 0x00:
+        return SHAPE_OTHER, None
+    payload = packet[_header.size:]
+    if payload[1] & 0xf0 == 0x20 and len(payload) == 3:
+        # 8x 2p FF: cancel
+        return SHAPE_PRIORITY, None
+    if payload[1] != 0x01:
+        return SHAPE_OTHER, None
+    command = payload[2:4]
+    if command == b'\x06\x01' and len(payload) == 9:
+        # 8x 01 06 01 VV WW 0p 0t FF
+        if payload[6] == 0x03 and payload[7] == 0x03:
+            return SHAPE_PRIORITY, 'pantilt'
+        return SHAPE_DRIVE, 'pantilt'
+    if command in (b'\x04\x07', b'\x04\x08') and len(payload) == 6:
+        # 8x 01 04 07 pq FF (zoom), 8x 01 04 08 pq FF (focus)
+        kind = 'zoom' if command == b'\x04\x07' else 'focus'
+        if payload[4] == 0x00:
+            return SHAPE_PRIORITY, kind
+        if payload[4] >> 4 in (2, 3):
+            return SHAPE_DRIVE, kind
+    return SHAPE_OTHER, None
+
+
+class RelayShaper:
+    """ Traffic shaping for the commands sent through one relay port:
+        - stop and cancel commands jump ahead of the other commands received in the same batch
+        - a stop discards earlier drive commands of the same kind (pan/tilt, zoom, focus) in the batch,
+          and a drive command discards earlier ones of the same kind
+        - a drive command identical to the last one forwarded, within COLLAPSE_WINDOW, is collapsed
+          (unless the camera has been sent anything else meanwhile, see forget_drives())
+        - optionally, drive commands are limited to rate_limit per second per kind; the latest
+          command held back is sent when the interval has passed
+        Dropped commands are answered locally with ACK and Completion.
+    """
+    def __init__(self, rate_limit: float = 0):
+        self.interval = 1.0 / rate_limit if rate_limit else 0.0
+        self.last_drive: dict[str, tuple[bytes, float]] = {}     # kind: (payload, when forwarded)
+        self.next_allowed: dict[str, float] = {}
+        self.deferred: dict[str, tuple[bytearray, tuple]] = {}
+        self.stats = {'prioritized': 0, 'superseded': 0, 'collapsed': 0, 'rate_limited': 0}
+
+    def shape(self, port: 'RelayPort', commands: list[tuple[bytearray, tuple]]):
+        priority = []
+        normal = []
+        for packet, address in commands:
+            command_class, kind = classify(packet)
+            if command_class == SHAPE_PRIORITY:
+                if kind is not None:
+                    self._supersede(port, normal, kind)
+                    held = self.deferred.pop(kind, None)
+                    if held is not None:
+                        self.stats['superseded'] += 1
+                        port.reply_locally(*held)
+                    self.last_drive.pop(kind, None)
+                if normal:
+                    self.stats['prioritized'] += 1
+                priority.append((packet, address, command_class, kind))
+            else:
+                if command_class == SHAPE_DRIVE:
+                    self._supersede(port, normal, kind)
+                normal.append((packet, address, command_class, kind))
+
+        now = time.monotonic()
+        for packet, address, command_class, kind in priority + normal:
+            if command_class == SHAPE_DRIVE:
+                payload = bytes(packet[_header.size:])
+                if self._is_repeat(kind, payload, now):
+                    self.stats['collapsed'] += 1
+                    port.reply_locally(packet, address)
+                    continue
+                if self.interval:
+                    if now < self.next_allowed.get(kind, 0.0):
+                        held = self.deferred.get(kind)
+                        if held is not None:
+                            port.reply_locally(*held)
+                        self.stats['rate_limited'] += 1
+                        self.deferred[kind] = (packet, address)
+                        continue
+                    self.next_allowed[kind] = now + self.interval
+                self.last_drive[kind] = (payload, now)
+            elif command_class == SHAPE_OTHER:
+                # e.g. a preset recall, which ends any drive
+                self.last_drive.clear()
+            port.forward_command(packet, address)
+
+    def _is_repeat(self, kind: str, payload: bytes, now: float) -> bool:
+        last = self.last_drive.get(kind)
+        return last is not None and last[0] == payload and now - last[1] < COLLAPSE_WINDOW
+
+    def reset(self, port: 'RelayPort'):
+        """ Forget all state, when the port starts forwarding to another camera """
+        for held in self.deferred.values():
+            port.reply_locally(*held)
+        self.deferred = {}
+        self.last_drive = {}
+        self.next_allowed = {}
+
+    def _supersede(self, port: 'RelayPort', normal: list, kind: str):
+        """ Drop drive commands of the given kind waiting in this batch """
+        for entry in [e for e in normal if e[2] == SHAPE_DRIVE and e[3] == kind]:
+            normal.remove(entry)
+            self.stats['superseded'] += 1
+            port.reply_locally(entry[0], entry[1])
+
+    def next_deadline(self) -> float | None:
+        """ When the next held back drive command is due (time.monotonic()), or None """
+        if not self.deferred:
+            return None
+        return min(self.next_allowed.get(kind, 0.0) for kind in self.deferred)
+
+    def flush(self, port: 'RelayPort'):
+        """ Send held back drive commands that are now due """
+        now = time.monotonic()
+        for kind in [k for k in self.deferred if self.next_allowed.get(k, 0.0) <= now]:
+            packet, address = self.deferred.pop(kind)
+            payload = bytes(packet[_header.size:])
+            if self._is_repeat(kind, payload, now):
+                self.stats['collapsed'] += 1
+                port.reply_locally(packet, address)
+                continue
+            self.last_drive[kind] = (payload, now)
+            self.next_allowed[kind] = now + self.interval
+            port.forward_command(packet, address)
+
+
+class RelayPort:
+    """ One listening socket, forwarding to one camera """
+    def __init__(self, rcv_port: int, camera_num: int = 0):
+        """ :param rcv_port: UDP port to listen on
+            :param camera_num: the camera this port always forwards to, 0 for the current camera
+        """
+        self.rcv_port = rcv_port
+        self.camera_num = camera_num
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            self.socket.bind(("", rcv_port))
+        except OSError:
+            self.socket.close()
+            raise
+        self.socket.setblocking(False)
+        self.recv_sockaddr = None
+        self.ptz_sockaddr = None
+        self.clients: dict[tuple, RelayClient] = {}
+        # camera side sequence number -> (client address, client sequence number)
+        self.pending: dict[int, tuple[tuple, int]] = {}
+        self.camera_sequence = 1
+        self.unrouted_replies = 0
+        self.packets_to_camera = 0
+        self.packets_to_controller = 0
+        self.packets_dropped = 0
+        self.shaper: RelayShaper | None = None
+        self.capture: CaptureRing | None = None
+        # held while routing, as LocalClients route commands on their own thread
+        self.lock = threading.Lock()
+        self.closed = False
+        _local_ports[rcv_port] = self
+
+    def set_destination(self, ptz_sockaddr):
+        """ Set a new ptz destination (resolved sockaddr) """
+        if ptz_sockaddr == self.ptz_sockaddr:
+            return
+        # New camera: forget outstanding commands and start a new sequence space
+        with self.lock:
+            self.pending = {}
+            self.camera_sequence = 1
+            _index_port(self, self.ptz_sockaddr, ptz_sockaddr)
+            self.ptz_sockaddr = ptz_sockaddr
+            if self.shaper is not None:
+                self.shaper.reset(self)
+        try:
+            self.socket.sendto(_reset_command, ptz_sockaddr)
+        except OSError:
+            pass
+
+    def _next_sequence(self) -> int:
+        seq = self.camera_sequence + 1
+        if seq > SEQUENCE_NUM_MAX:
+            seq = 0
+        self.camera_sequence = seq
+        return seq
+
+    def relay_packets(self, buffer: bytearray, view: memoryview):
+        """ Forward all packets waiting on the socket
+            - if packet camera sockaddr then it's from the camera -> Forward back to the client
+              that sent the command with that sequence number
+            - otherwise, translate the sequence number and forward to the current sockaddr for the camera
+              (when shaping, commands are collected and handed to the shaper at the end of the batch)
+        """
+        with self.lock:
+            self._relay_packets(buffer, view)
+
+    def _relay_packets(self, buffer: bytearray, view: memoryview):
+        s = self.socket
+        shaper = self.shaper
+        commands = None
+
+        for _ in range(RELAY_BATCH):
+            try:
+                nbytes, address = s.recvfrom_into(buffer)
+            except (BlockingIOError, InterruptedError):
+                break
+            except ConnectionResetError:
+                # ICMP port unreachable from a previous send, on Windows
+                continue
+            except OSError:
+                break
+
+            if nbytes < _header.size:
+                continue
+            capture = self.capture
+            if address == self.ptz_sockaddr:
+                # Packet is a response from the camera
+                dst_sockaddr = self.route_reply(buffer, nbytes)
+                if dst_sockaddr is None:
+                    continue
+                self.packets_to_controller += 1
+                if capture is not None:
+                    capture.record(DIR_TO_CLIENT, self.rcv_port, dst_sockaddr, address, view, nbytes)
+                if dst_sockaddr.__class__ is LocalClient:
+                    dst_sockaddr.replies.put(bytes(view[:nbytes]))
+                else:
+                    self.forward(view[:nbytes], dst_sockaddr, address)
+                continue
+
+            if capture is not None:
+                capture.record(DIR_TO_CAMERA, self.rcv_port, address, self.ptz_sockaddr, view, nbytes)
+            if shaper is not None:
+                # Packet is a (probably) from a controller, hold it for shaping
+                if commands is None:
+                    commands = []
+                commands.append((bytearray(view[:nbytes]), address))
+                continue
+            else:
+                # Packet is a (probably) from a controller
+                dst_sockaddr = self.route_command(buffer, view, address)
+                if dst_sockaddr is None:
+                    continue
+                self.packets_to_camera += 1
+                forget_drives(dst_sockaddr)
+
+            self.forward(view[:nbytes], dst_sockaddr, address)
+
+        if commands is not None:
+            shaper.shape(self, commands)
+
+    def forward(self, packet, dst_sockaddr, src_sockaddr):
+        try:
+            self.socket.sendto(packet, dst_sockaddr)
+        except (BlockingIOError, ConnectionResetError):
+            self.packets_dropped += 1
+            return
+        if tracing.enabled:
+            tracing.instant('relay forward', 'relay',
+                            {'port': self.rcv_port,
+                             'from': f'{src_sockaddr[0]}:{src_sockaddr[1]}',
+                             'to': f'{dst_sockaddr[0]}:{dst_sockaddr[1]}', 'len': len(packet)})
+
+    def forward_command(self, packet: bytearray, address):
+        """ Translate and forward a command held by the shaper """
+        view = memoryview(packet)
+        dst_sockaddr = self.route_command(packet, view, address)
+        if dst_sockaddr is not None:
+            self.packets_to_camera += 1
+            forget_drives(dst_sockaddr, self)
+            self.forward(view, dst_sockaddr, address)
+
+    def reply_locally(self, packet: bytearray, address):
+        """ Answer a command that the shaper has dropped with ACK and Completion, so that
+            the client doesn't time out and retry it
+        """
+        sequence = packet[4:8]
+        for reply in (b'\x01\x11\x00\x03' + sequence + b'\x90\x41\xff',
+                      b'\x01\x11\x00\x03' + sequence + b'\x90\x51\xff'):
+            self.send_to_client(reply, address)
+            if self.capture is not None:
+                self.capture.record(DIR_LOCAL, self.rcv_port, address, self.ptz_sockaddr, reply, len(reply))
+
+    def route_command(self, buffer: bytearray, view: memoryview, address):
+        """ Translate the sequence number of a command from a client (in place) and
+            return the address to forward it to, or None if it has been handled here.
+        """
+        payload_type, _length, client_sequence = _header.unpack_from(buffer, 0)
+
+        client = self.clients.get(address)
+        if client is None:
+            client = RelayClient(address)
+            self.clients[address] = client
+        client.packets_sent += 1
+        client.last_seen = time.monotonic()
+        # Fallback destination for replies that can't be matched to a command
+        self.recv_sockaddr = address
+
+        if payload_type == VISCA_CONTROL_COMMAND:
+            # Sequence number reset from a client: the camera side sequence space is owned
+            # by the relay, so acknowledge it here rather than resetting the camera
+            _header.pack_into(buffer, 0, VISCA_CONTROL_REPLY, 1, client_sequence)
+            self.send_to_client(view[:_header.size + 1], address)
+            if self.capture is not None:
+                self.capture.record(DIR_LOCAL, self.rcv_port, address, self.ptz_sockaddr, view, _header.size + 1)
+            return None
+
+        if self.ptz_sockaddr is None:
+            return None
+
+        sequence = self._next_sequence()
+        pending = self.pending
+        pending[sequence] = (address, client_sequence)
+        if len(pending) > MAX_PENDING:
+            # forget the oldest outstanding command
+            del pending[next(iter(pending))]
+        struct.pack_into('>I', buffer, 4, sequence)
+        return self.ptz_sockaddr
+
+    def route_reply(self, buffer: bytearray, nbytes: int):
+        """ Find the client for a reply from the camera, restore the client's sequence number
+            (in place) and return the client's address
+        """
+        payload_type, _length, sequence = _header.unpack_from(buffer, 0)
+        entry = self.pending.get(sequence)
+        if entry is None:
+            if payload_type == VISCA_CONTROL_REPLY:
+                # reply to the relay's own sequence number reset
+                return None
+            # unknown sequence number, send it to the last client seen
+            self.unrouted_replies += 1
+            return self.recv_sockaddr
+
+        address, client_sequence = entry
+        struct.pack_into('>I', buffer, 4, client_sequence)
+        # Completion (5x) and Error (6x) end the command, an ACK (4x) is followed by more
+        if nbytes > _header.size + 1 and buffer[_header.size + 1] >> 4 != 4:
+            self.pending.pop(sequence, None)
+        client = self.clients.get(address)
+        if client is not None:
+            client.packets_received += 1
+        return address
+
+    def send_to_client(self, packet, address):
+        """ Send a reply generated by the relay to a client """
+        if address.__class__ is LocalClient:
+            address.replies.put(bytes(packet))
+            return
+        try:
+            self.socket.sendto(packet, address)
+        except OSError:
+            pass
+
+    def close(self):
+        self.closed = True
+        if _local_ports.get(self.rcv_port) is self:
+            del _local_ports[self.rcv_port]
+        _index_port(self, self.ptz_sockaddr, None)
+        self.socket.close()
+
+
+class LocalClient:
+    """ A client of a relay port in this process. Commands are translated and forwarded
+        on the sender's thread, without going through the loopback to the relay thread.
+        The relay thread puts the replies on the replies queue.
+        Indexing gives a sockaddr, for the capture and tracing.
+    """
+    sockaddr = ('127.0.0.1', 0)
+
+    def __init__(self, relay_port: RelayPort):
+        self.relay_port = relay_port
+        self.replies = queue.SimpleQueue()
+
+    def __getitem__(self, index):
+        return self.sockaddr[index]
+
+    def send(self, message) -> bool:
+        """ Send a VISCA over IP message through the relay port
+            :return: False if the relay port has been closed
+        """
+        relay_port = self.relay_port
+        packet = bytearray(message)
+        view = memoryview(packet)
+        with relay_port.lock:
+            if relay_port.closed:
+                return False
+            capture = relay_port.capture
+            if capture is not None:
+                capture.record(DIR_TO_CAMERA, relay_port.rcv_port, self, relay_port.ptz_sockaddr, view, len(packet))
+            dst_sockaddr = relay_port.route_command(packet, view, self)
+            if dst_sockaddr is not None:
+                relay_port.packets_to_camera += 1
+                # bypasses the port's shaper
+                forget_drives(dst_sockaddr)
+                relay_port.forward(view, dst_sockaddr, self)
+        return True
+
+    def recv(self, timeout: float) -> bytes:
+        """ Wait for the next reply
+            :raises socket.timeout: if there is no reply within timeout seconds
+        """
+        try:
+            return self.replies.get(timeout=timeout)
+        except queue.Empty:
+            raise socket.timeout('timed out') from None
+
+    def close(self):
+        relay_port = self.relay_port
+        with relay_port.lock:
+            relay_port.clients.pop(self, None)
+
+
+def local_client(host: str, port: int) -> LocalClient | None:
+    """ If (host, port) is a relay port of this process on the loopback, which forwards
+        somewhere else, return a LocalClient for it
+    """
+    if not fast_path:
+        return None
+    relay_port = _local_ports.get(port)
+    if relay_port is None or relay_port.closed or relay_port.ptz_sockaddr is None:
+        return None
+    sockaddr = _resolve(host, port)
+    if sockaddr is None or not sockaddr[0].startswith('127.') or sockaddr == relay_port.ptz_sockaddr:
+        return None
+    return LocalClient(relay_port)
+
+
+def _index_port(relay_port: RelayPort, old_sockaddr, new_sockaddr):
+    """ Move a relay port in _ports_to. The tuples are replaced rather than changed, so
+        forget_drives() can read them without the lock
+    """
+    with _ports_to_lock:
+        if old_sockaddr is not None:
+            ports = tuple(p for p in _ports_to.get(old_sockaddr, ()) if p is not relay_port)
+            if ports:
+                _ports_to[old_sockaddr] = ports
+            else:
+                _ports_to.pop(old_sockaddr, None)
+        if new_sockaddr is not None:
+            _ports_to[new_sockaddr] = _ports_to.get(new_sockaddr, ()) + (relay_port,)
+
+
+def forget_drives(ptz_sockaddr, via: RelayPort | None = None):
+    """ A command has reached the camera at ptz_sockaddr other than through the shaper of
+        relay port via (another relay port, a LocalClient, or a Camera that addresses the camera
+        directly), so the camera may no longer be doing what the last drive command forwarded
+        by a shaper told it: the next one mustn't be collapsed.
+        Runs on any thread, without the ports' locks: clearing the dictionary is atomic, and at
+        worst a drive command racing with it isn't collapsed.
+    """
+    for relay_port in _ports_to.get(ptz_sockaddr, ()):
+        shaper = relay_port.shaper
+        if shaper is not None and relay_port is not via:
+            shaper.last_drive.clear()
+
+
+def _resolve(host: str, port: int):
+    """ The sockaddr for (host, port) if the address of host is cached, see resolver.py """
+    address = resolver.shared.lookup(host)
+    if address is None:
+        return None
+    return address, port
+
 
 class ViscaRelay:
     def ptz_set(self, ptz: str, ptz_port:int):
-        """ Set a new ptz destination """
+        """ Set a new ptz destination for the current camera port. If the address of the
+            camera isn't known yet, the destination is set when it has been resolved
+        """
+        self.ptz_target = (ptz, ptz_port)
+
+        def resolved(address):
+            if address is not None and self.ptz_target == (ptz, ptz_port):
+                self.current.set_destination((address, ptz_port))
+
+        address = resolver.shared.lookup(ptz, resolved)
+        if address is not None:
+            self.current.set_destination((address, ptz_port))
+
+    def set_camera_ports(self, cameras: dict[int, tuple[str, int]]) -> list[str]:
+        """ Listen on rcv_port + n for each camera n in cameras {n: (host, port)}, forwarding to
+            that camera. Ports for cameras no longer in the dictionary are closed.
+            :return: a list of problems, e.g. ports that could not be opened
+        """
+        problems = []
+        ports = {}
+        for camera_num, (host, port) in cameras.items():
+            if not host:
+                continue
+            rcv_port = self.rcv_port + camera_num
+            # configuration time, so it's OK to wait for the name to be resolved
+            address = resolver.shared.resolve(host, timeout=2.0)
+            ptz_sockaddr = (address, port) if address is not None else None
+            if ptz_sockaddr is None:
+                problems.append(f'Relay port {rcv_port}: cannot resolve {host}')
+                continue
+            if ptz_sockaddr[0].startswith('127.') and (port == self.rcv_port or port - self.rcv_port in cameras):
+                # The camera is addressed through this relay (or something else on this port,
+                # e.g. NDI Camera Selector), relaying to it would loop
+                continue
+            relay_port = self.camera_ports.get(camera_num)
+            if relay_port is None:
+                try:
+                    relay_port = RelayPort(rcv_port, camera_num)
+                except OSError as exc:
+                    problems.append(f'Relay port {rcv_port}: {exc.strerror}')
+                    continue
+            relay_port.set_destination(ptz_sockaddr)
+            ports[camera_num] = relay_port
+            if relay_port.shaper is None and self.shaping:
+                relay_port.shaper = RelayShaper(self.rate_limit)
+            relay_port.capture = self.capture
+
+        self._call_in_loop(lambda: self._replace_camera_ports(ports))
+        return problems
+
+    def _replace_camera_ports(self, ports: dict[int, RelayPort]):
+        """ Runs on the relay thread """
+        for camera_num, relay_port in self.camera_ports.items():
+            if ports.get(camera_num) is not relay_port:
+                self.selector.unregister(relay_port.socket)
+                relay_port.close()
+        for camera_num, relay_port in ports.items():
+            if self.camera_ports.get(camera_num) is not relay_port:
+                self.selector.register(relay_port.socket, selectors.EVENT_READ, relay_port)
+        self.camera_ports = ports
+
+    def set_shaping(self, enabled: bool, rate_limit: float = 0):
+        """ Enable or disable traffic shaping on all ports
+            :param rate_limit: maximum drive commands per second, per camera and kind, 0 for no limit
+        """
+        def apply():
+            self.shaping = enabled
+            self.rate_limit = rate_limit
+            for relay_port in self.ports():
+                relay_port.shaper = RelayShaper(rate_limit) if enabled else None
+        self._call_in_loop(apply)
+
+    def start_capture(self, path: str, capacity: int = 16384):
+        """ Capture all relayed datagrams, on all ports, to a ring file """
+        ring = CaptureRing(path, capacity)
+
+        def apply():
+            old = self.capture
+            self.capture = ring
+            for relay_port in self.ports():
+                relay_port.capture = ring
+            if old is not None:
+                old.close()
+        self._call_in_loop(apply)
+
+    def stop_capture(self):
+        def apply():
+            old = self.capture
+            self.capture = None
+            for relay_port in self.ports():
+                relay_port.capture = None
+            if old is not None:
+                old.close()
+        self._call_in_loop(apply)
+
+    def shaping_stats(self) -> dict:
+        """ Shaping statistics: {(port, action): count} """
+        stats = {}
+        for relay_port in self.ports():
+            if relay_port.shaper is not None:
+                for action, n in relay_port.shaper.stats.items():
+                    stats[(relay_port.rcv_port, action)] = n
+        return stats
+
+    def _call_in_loop(self, func):
+        """ Run func on the relay thread, which owns the selector """
+        self._calls.put(func)
         try:
-            ptz_address = socket.gethostbyname(ptz)
-            self.ptz_sockaddr = (ptz_address, ptz_port)
-        except socket.gaierror:
+            self._wakeup_send.send(b'\0')
+        except OSError:
             pass
 
+    def ports(self) -> list[RelayPort]:
+        return [self.current] + list(self.camera_ports.values())
+
     def relaythread(self):
         """ Loop:
-            - receive packet
-            - if packet camera sockaddr then it's from the camera -> Forward back to the last sockaddr
-              seen from the controller
-            - otherwise, forward to the current sockaddr for the camera
+            - wait for any of the sockets to become readable
+            - drain the pending packets from each readable socket
         """
-        global last_relay
+        buffer = self._buffer
+        view = self._view
+        while self.running:
+            timeout = None
+            if self.shaping:
+                # wake up in time to send drive commands held back by rate limiting
+                deadlines = [d for d in (p.shaper.next_deadline() for p in self.ports() if p.shaper)
+                             if d is not None]
+                if deadlines:
+                    timeout = max(0.0, min(deadlines) - time.monotonic())
+                    if timeout == 0.0:
+                        for relay_port in self.ports():
+                            if relay_port.shaper is not None:
+                                with relay_port.lock:
+                                    relay_port.shaper.flush(relay_port)
+                        continue
 
-        s = self.socket
-        self.recv_sockaddr = None
-
-        while True:
-            time.sleep(0.001)
-            try:
-                buffer, address = s.recvfrom(1024)
-                if address == self.ptz_sockaddr:
-                    # Packet is a response from the camera
-                    dst_sockaddr = self.recv_sockaddr
-                    # We don't clear the sockaddr here because it is possible to get multiple packets in response
-                    # eg: CMD-> ACK, REPLY
+            for key, _mask in self.selector.select(timeout):
+                relay_port = key.data
+                if relay_port is not None:
+                    relay_port.relay_packets(buffer, view)
                 else:
-                    # Packet is a (probably) from a controller. Save address for later reply
-                    self.recv_sockaddr = address
-                    # forward packet to the camera
-                    dst_sockaddr = self.ptz_sockaddr
+                    # woken up by _call_in_loop() or close()
+                    try:
+                        self._wakeup_recv.recv(64)
+                    except OSError:
+                        pass
+                    while not self._calls.empty():
+                        self._calls.get_nowait()()
 
-                if dst_sockaddr is not None:
-                    s.sendto(buffer, dst_sockaddr)
-            except ConnectionResetError:
-                pass
+            # Loop until closed
 
-            # Loop forever
+    def close(self):
+        """ Stop the relay thread and close the sockets """
+        self.running = False
+        try:
+            self._wakeup_send.send(b'\0')
+        except OSError:
+            pass
+        self.thread.join()
+        self.selector.close()
+        for relay_port in self.ports():
+            relay_port.close()
+        self._wakeup_send.close()
+        self._wakeup_recv.close()
+
+    def _port_counts(self, attribute: str) -> dict:
+        return {(('port', p.rcv_port),): getattr(p, attribute) for p in self.ports()}
 
     def __init__(self, rcv_port: int):
         """ Init:
@@ -60,11 +714,43 @@ class ViscaRelay:
             - forward packets back to controller
         """
         self.rcv_port = rcv_port
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        address = ("", rcv_port)
-        self.socket.bind(address)
-        self.recv_sockaddr = None
-        self.ptz_sockaddr = None
-        self.thread = threading.Thread(target=self.relaythread)
+        self.current = RelayPort(rcv_port)
+        self.ptz_target = None
+        self.camera_ports: dict[int, RelayPort] = {}
+        self.shaping = False
+        self.rate_limit = 0
+        self.capture: CaptureRing | None = None
+
+        metrics.register('relay_packets_forwarded_total',
+                         lambda: {(('direction', 'to_camera'), ('port', p.rcv_port)): p.packets_to_camera
+                                  for p in self.ports()} |
+                                 {(('direction', 'to_controller'), ('port', p.rcv_port)): p.packets_to_controller
+                                  for p in self.ports()},
+                         'counter', 'VISCA packets forwarded by the relay')
+        metrics.register('relay_packets_dropped_total', lambda: self._port_counts('packets_dropped'),
+                         'counter', 'VISCA packets the relay could not forward')
+        metrics.register('relay_unrouted_replies_total', lambda: self._port_counts('unrouted_replies'),
+                         'counter', 'Camera replies that could not be matched to a client command')
+        metrics.register('relay_shaped_total',
+                         lambda: {(('action', action), ('port', port)): n
+                                  for (port, action), n in self.shaping_stats().items()},
+                         'counter', 'VISCA commands prioritized, superseded, collapsed or rate limited by the relay')
+        metrics.register('relay_clients', lambda: {(('port', p.rcv_port),): len(p.clients) for p in self.ports()},
+                         'gauge', 'Controllers that have sent through the relay')
+
+        self._buffer = bytearray(RELAY_BUFSIZE)
+        self._view = memoryview(self._buffer)
+
+        # socketpair used to wake the selector for _call_in_loop() and close()
+        self._wakeup_recv, self._wakeup_send = socket.socketpair()
+        self._wakeup_recv.setblocking(False)
+        self._calls = queue.SimpleQueue()
+
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.current.socket, selectors.EVENT_READ, self.current)
+        self.selector.register(self._wakeup_recv, selectors.EVENT_READ, None)
+
+        self.running = True
+        self.thread = threading.Thread(target=self.relaythread, name='ViscaRelay')
         self.thread.daemon = True
         self.thread.start()
@@ -16,4 +16,8 @@ def win_print(string):
     global print_window
 
     win = print_window
+    if win is None:
+        # no window (yet), e.g. when used from a benchmark
+        print(string)
+        return
     win.write_event_value("-PRINT-", string)